@@ -1,10 +1,173 @@
-from fastapi import FastAPI
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from python_multipart.multipart import MultipartParser, parse_options_header
+from starlette.datastructures import Headers
 
 from app.endpoints.ekg_endpoints import ekg_router
 from app.endpoints.health_endpoints import health_router
+from app.endpoints.metrics_endpoints import metrics_router
+from app.logic.metrics.metrics import (
+    REQUEST_DURATION,
+    REQUESTS_IN_PROGRESS,
+    SERVER_TIMING_ENABLED,
+    collect_request_stages,
+    format_server_timing,
+)
+from app.logic.uploads.uploads import (
+    UPLOAD_MAX_FILE_BYTES,
+    UPLOAD_MAX_REQUEST_BYTES,
+    UploadTooLargeError,
+)
+from app.logic.warmup.warmup import warmup
+from app.logic.worker_pool.worker_pool import (
+    WorkerPoolBusyError,
+    WorkerPoolTimeoutError,
+    WorkerPoolUnavailableError,
+    worker_pool,
+)
+
+LOG_LEVEL = os.environ.get("EKG_LOG_LEVEL", "WARNING").upper()
+
+logging.basicConfig(
+    level=LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+REQUEST_TOO_LARGE_DETAIL = "Przesłane dane są zbyt duże."
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warmup_task = asyncio.create_task(warmup.run())
+    yield
+    warmup_task.cancel()
+    worker_pool.shutdown()
+
+
+class MultipartFileLimit:
+    """
+    Follows a multipart body as it is received and raises 413 as soon as one
+    file in it is larger than `max_bytes`, before the body is fully spooled.
+    Tighter per-endpoint limits, like the one on images, are still checked
+    once the upload has been read.
+    """
+
+    def __init__(self, boundary, max_bytes):
+        self.max_bytes = max_bytes
+        self._filename = None
+        self._size = 0
+        self._header_field = b""
+        self._header_value = b""
+        self._parser = MultipartParser(
+            boundary,
+            {
+                "on_part_begin": self._on_part_begin,
+                "on_part_data": self._on_part_data,
+                "on_header_field": self._on_header_field,
+                "on_header_value": self._on_header_value,
+                "on_header_end": self._on_header_end,
+            },
+        )
+
+    @classmethod
+    def from_headers(cls, headers, max_bytes):
+        content_type, options = parse_options_header(headers.get("content-type"))
+        if content_type != b"multipart/form-data" or b"boundary" not in options:
+            return None
+        return cls(options[b"boundary"], max_bytes)
+
+    def feed(self, body: bytes) -> bool:
+        """False once the body cannot be parsed; the form parser reports why."""
+        try:
+            self._parser.write(body)
+        except HTTPException:
+            raise
+        except Exception:
+            return False
+        return True
+
+    def _on_part_begin(self):
+        self._filename = None
+        self._size = 0
+
+    def _on_header_field(self, data, start, end):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data, start, end):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        if self._header_field.lower() == b"content-disposition":
+            filename = parse_options_header(self._header_value)[1].get(b"filename")
+            if filename is not None:
+                self._filename = filename.decode("utf-8", "replace")
+        self._header_field = self._header_value = b""
+
+    def _on_part_data(self, data, start, end):
+        if self._filename is None:
+            return
+        self._size += end - start
+        if self._size > self.max_bytes:
+            raise HTTPException(
+                status_code=413, detail=f"Plik '{self._filename}' jest zbyt duży."
+            )
+
 
-app = FastAPI()
+class RequestSizeLimitMiddleware:
+    """
+    Rejects request bodies larger than `max_bytes` with 413: right away when
+    the Content-Length says so, otherwise as soon as the limit is crossed
+    while the body is being received. Multipart files larger than
+    `max_file_bytes` are rejected the same way.
+    """
+
+    def __init__(self, app, max_bytes, max_file_bytes=None):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = Headers(scope=scope)
+        content_length = headers.get("content-length", "")
+        if content_length.isdigit() and int(content_length) > self.max_bytes:
+            response = JSONResponse(
+                status_code=413, content={"detail": REQUEST_TOO_LARGE_DETAIL}
+            )
+            return await response(scope, receive, send)
+
+        received = 0
+        file_limit = None
+        if self.max_file_bytes is not None:
+            file_limit = MultipartFileLimit.from_headers(headers, self.max_file_bytes)
+
+        async def limited_receive():
+            nonlocal received, file_limit
+            message = await receive()
+            if message["type"] == "http.request":
+                body = message.get("body", b"")
+                received += len(body)
+                if received > self.max_bytes:
+                    raise HTTPException(
+                        status_code=413, detail=REQUEST_TOO_LARGE_DETAIL
+                    )
+                if file_limit is not None and not file_limit.feed(body):
+                    file_limit = None
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+app = FastAPI(lifespan=lifespan)
 
 origins = [
     "http://localhost:3000",
@@ -20,5 +183,72 @@ app.add_middleware(
     allow_headers=["Content-Type"],
 )
 
+app.add_middleware(
+    RequestSizeLimitMiddleware,
+    max_bytes=UPLOAD_MAX_REQUEST_BYTES,
+    max_file_bytes=UPLOAD_MAX_FILE_BYTES,
+)
+
 app.include_router(ekg_router)
 app.include_router(health_router)
+app.include_router(metrics_router)
+
+
+@app.middleware("http")
+async def timing_middleware(request: Request, call_next):
+    REQUESTS_IN_PROGRESS.labels(method=request.method).inc()
+    start = time.perf_counter()
+    status = 500
+    try:
+        with collect_request_stages() as stages:
+            response = await call_next(request)
+        status = response.status_code
+    finally:
+        elapsed = time.perf_counter() - start
+        REQUESTS_IN_PROGRESS.labels(method=request.method).dec()
+        route = request.scope.get("route")
+        REQUEST_DURATION.labels(
+            method=request.method,
+            route=route.path if route is not None else "unmatched",
+            status=status,
+        ).observe(elapsed)
+
+    if SERVER_TIMING_ENABLED or logger.isEnabledFor(logging.DEBUG):
+        server_timing = format_server_timing(stages, elapsed)
+        if SERVER_TIMING_ENABLED:
+            response.headers["Server-Timing"] = server_timing
+        logger.debug(
+            "%s %s %d %s", request.method, request.url.path, status, server_timing
+        )
+
+    return response
+
+
+@app.exception_handler(WorkerPoolBusyError)
+async def worker_pool_busy_handler(request: Request, exc: WorkerPoolBusyError):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": "Serwer jest przeciążony, spróbuj ponownie za chwilę."},
+        headers={"Retry-After": "1"},
+    )
+
+
+@app.exception_handler(WorkerPoolUnavailableError)
+async def worker_pool_unavailable_handler(
+    request: Request, exc: WorkerPoolUnavailableError
+):
+    if isinstance(exc, WorkerPoolTimeoutError):
+        detail = "Przetwarzanie trwało zbyt długo."
+    else:
+        detail = "Przetwarzanie jest chwilowo niedostępne."
+    return JSONResponse(
+        status_code=503, content={"detail": detail}, headers={"Retry-After": "5"}
+    )
+
+
+@app.exception_handler(UploadTooLargeError)
+async def upload_too_large_handler(request: Request, exc: UploadTooLargeError):
+    return JSONResponse(
+        status_code=413,
+        content={"detail": f"Plik '{exc.filename}' jest zbyt duży."},
+    )
@@ -1,9 +1,70 @@
+import asyncio
+import json
+from contextlib import ExitStack, aclosing
 from pathlib import Path
 
-from fastapi import APIRouter, File, HTTPException, UploadFile
-from fastapi.responses import JSONResponse
+from fastapi import (
+    APIRouter,
+    File,
+    HTTPException,
+    Query,
+    Request,
+    UploadFile,
+    WebSocket,
+    WebSocketDisconnect,
+)
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 
-from ..logic.ekg_endpoints_logic import analyze_image_logic, analyze_signal_logic
+from ..logic.ekg_endpoints_logic import (
+    BATCH_MAX_IMAGES,
+    analyze_image_logic,
+    analyze_signal_logic,
+    get_calibration_profile,
+    get_record_events_logic,
+    get_record_overview_logic,
+    get_record_ranges_logic,
+    get_record_window_logic,
+    get_stored_record,
+    list_calibration_profiles,
+    read_images_from_zip,
+    scan_record_logic,
+    store_image_record,
+    store_image_records_logic,
+    store_signal_record,
+)
+from ..logic.http_cache.http_cache import cache_headers, etag_matches, make_etag
+from ..logic.live_monitor.live_monitor import (
+    LIVE_MAX_FRAME_DURATION,
+    LIVE_MAX_FS,
+    LIVE_MAX_LEADS,
+    LiveMonitorBusyError,
+    live_monitor_session,
+    parse_frame,
+)
+from ..logic.metrics.metrics import UPLOAD_BYTES, timed_stage
+from ..logic.uploads.uploads import (
+    UPLOAD_MAX_IMAGE_BYTES,
+    check_upload_size,
+    read_upload,
+)
+from ..logic.wfdb_converter.wfdb_json_converter import (
+    FLOAT32_JSON_MEDIA_TYPE,
+    FRAME_MEDIA_TYPE,
+    INT16_JSON_MEDIA_TYPE,
+    JSON_MEDIA_TYPE,
+    WDFDB_SAMPLES_PER_WINDOW,
+    convert_record_to_base64_dict,
+    convert_signal_to_dict,
+    encode_frame,
+    negotiate_media_type,
+)
+from ..logic.windowing.windowing import (
+    RANGE_MAX_COUNT,
+    RANGE_UNITS,
+    WINDOW_MAX_SIZE,
+    WindowGrid,
+    parse_range,
+)
 
 ekg_router = APIRouter(prefix="/ekg", tags=["ekg"])
 
@@ -11,60 +72,522 @@ TEMPORAL_FILES_DIR = Path(__file__).parent / "temp"
 
 ALLOWED_IMAGE_TYPES = ["image/png", "image/jpeg", "image/jpg"]
 ALLOWED_SIGNAL_EXTENSIONS = [".dat", ".hea"]
+ALLOWED_ARCHIVE_TYPES = ["application/zip", "application/x-zip-compressed"]
 
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
 
-@ekg_router.post("/image")
-async def analyze_image_endpoint(
-    crop_idx: int = 0, image_file: UploadFile = File(...)
-) -> JSONResponse:
+
+def _validate_image_file(image_file: UploadFile):
     if image_file.content_type not in ALLOWED_IMAGE_TYPES:
         raise HTTPException(
             status_code=400, detail="Tylko pliki PNG lub JPG są akceptowane."
         )
 
-    image_bytes = await image_file.read()
-    filename = image_file.filename
 
-    processed_data, crop_idx, max_crop_idx, events = analyze_image_logic(
-        image_bytes, filename, crop_idx
+def _validate_signal_files(hea_file: UploadFile, dat_file: UploadFile):
+    if not any(hea_file.filename.endswith(ext) for ext in ALLOWED_SIGNAL_EXTENSIONS):
+        raise HTTPException(
+            status_code=400, detail="Tylko pliki .dat lub .hea są akceptowane."
+        )
+    if not any(dat_file.filename.endswith(ext) for ext in ALLOWED_SIGNAL_EXTENSIONS):
+        raise HTTPException(
+            status_code=400, detail="Tylko pliki .dat lub .hea są akceptowane."
+        )
+
+
+def _calibration_profile(profile_id: str | None):
+    try:
+        return get_calibration_profile(profile_id)
+    except KeyError:
+        raise HTTPException(
+            status_code=404, detail="Nie znaleziono profilu kalibracji."
+        )
+
+
+def _validate_window(window_size: int, overlap: int):
+    if overlap >= window_size:
+        raise HTTPException(
+            status_code=400,
+            detail="Nakładanie okien musi być mniejsze niż rozmiar okna.",
+        )
+
+
+def _parse_ranges(ranges: list[str], unit: str, fs: float):
+    if unit not in RANGE_UNITS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Nieznana jednostka zakresu, dozwolone: {', '.join(RANGE_UNITS)}.",
+        )
+    if len(ranges) > RANGE_MAX_COUNT:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Można pobrać najwyżej {RANGE_MAX_COUNT} zakresów naraz.",
+        )
+    try:
+        return [parse_range(text, unit, fs) for text in ranges]
+    except ValueError:
+        raise HTTPException(
+            status_code=400,
+            detail="Nieprawidłowy zakres, oczekiwano postaci początek:koniec.",
+        )
+
+
+async def _read_image_file(image_file: UploadFile):
+    with timed_stage("upload_read"):
+        image_bytes = await asyncio.to_thread(
+            read_upload, image_file, UPLOAD_MAX_IMAGE_BYTES
+        )
+    UPLOAD_BYTES.labels(kind="image").observe(len(image_bytes))
+    return image_bytes
+
+
+def _window_response(
+    request: Request,
+    window_record,
+    content: dict,
+    precision: int | None = None,
+    headers: dict | None = None,
+) -> Response:
+    with timed_stage("response_encoding"):
+        return _encode_window_response(
+            request, window_record, content, precision, headers
+        )
+
+
+def _encode_window_response(
+    request: Request,
+    window_record,
+    content: dict,
+    precision: int | None,
+    headers: dict | None = None,
+) -> Response:
+    """
+    Serializes a window in the format negotiated from the `Accept` header:
+    plain JSON (optionally rounded to `precision` decimals), base64 int16 or
+    float32 samples in JSON, or a binary frame.
+    """
+    media_type = negotiate_media_type(request.headers.get("accept"))
+    headers = {"Vary": "Accept", **(headers or {})}
+
+    if window_record is None:
+        channels = None
+        media_type = JSON_MEDIA_TYPE
+    elif media_type == FRAME_MEDIA_TYPE:
+        return Response(
+            content=encode_frame(content, window_record),
+            media_type=media_type,
+            headers=headers,
+        )
+    elif media_type == INT16_JSON_MEDIA_TYPE:
+        channels = convert_record_to_base64_dict(window_record, "int16")
+    elif media_type == FLOAT32_JSON_MEDIA_TYPE:
+        channels = convert_record_to_base64_dict(window_record, "float32")
+    else:
+        channels = convert_signal_to_dict(
+            window_record.p_signal, window_record.sig_name, precision
+        )
+
+    return JSONResponse(
+        content={"channels": channels, **content},
+        media_type=media_type,
+        headers=headers,
+    )
+
+
+def _scan_response(request: Request, messages) -> StreamingResponse:
+    """
+    Streams scan messages as NDJSON and stops scanning as soon as the client
+    disconnects.
+    """
+
+    async def lines():
+        # Closing the messages stops the analysis they may be waiting for
+        async with aclosing(messages):
+            async for message in messages:
+                if message["type"] == "progress" and await request.is_disconnected():
+                    break
+                yield json.dumps(message) + "\n"
+
+    return StreamingResponse(
+        lines(),
+        media_type=NDJSON_MEDIA_TYPE,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
+
+def _not_modified_response(request: Request, etag: str, headers: dict) -> Response | None:
+    """
+    304 response when the client already holds the response with `etag`,
+    answered before any of it is computed.
+    """
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return None
+
+
+def _get_stored_record(record_id: str):
+    try:
+        return get_stored_record(record_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Nie znaleziono rekordu.")
+
+
+def _record_response(record) -> JSONResponse:
     return JSONResponse(
         content={
-            "channels": processed_data,
-            "crop_idx": crop_idx,
-            "max_crop_idx": max_crop_idx,
-            "events": events,
+            "record_id": record.record_id,
+            "fs": record.fs,
+            "sig_len": record.sig_len,
+            "max_crop_idx": WindowGrid(record.sig_len).max_index,
         }
     )
 
 
+@ekg_router.post("/image")
+async def analyze_image_endpoint(
+    request: Request,
+    crop_idx: int = 0,
+    window_size: int = Query(WDFDB_SAMPLES_PER_WINDOW, ge=1, le=WINDOW_MAX_SIZE),
+    overlap: int = Query(0, ge=0),
+    precision: int | None = Query(None, ge=0, le=15),
+    calibration_profile: str | None = None,
+    image_file: UploadFile = File(...),
+) -> Response:
+    _validate_image_file(image_file)
+    _validate_window(window_size, overlap)
+    profile = _calibration_profile(calibration_profile)
+
+    image_bytes = await _read_image_file(image_file)
+    filename = image_file.filename
+
+    window_record, crop_idx, max_crop_idx, events = await analyze_image_logic(
+        image_bytes, filename, crop_idx, profile, window_size, overlap
+    )
+
+    return _window_response(
+        request,
+        window_record,
+        {"crop_idx": crop_idx, "max_crop_idx": max_crop_idx, "events": events},
+        precision,
+    )
+
+
 @ekg_router.post("/signal")
 async def analyze_signal_endpoint(
+    request: Request,
     crop_idx: int = 0,
     show_full_signal: bool = True,
+    window_size: int = Query(WDFDB_SAMPLES_PER_WINDOW, ge=1, le=WINDOW_MAX_SIZE),
+    overlap: int = Query(0, ge=0),
+    precision: int | None = Query(None, ge=0, le=15),
     hea_file: UploadFile = File(...),
     dat_file: UploadFile = File(...),
     xws_file: UploadFile = File(...),
+) -> Response:
+    _validate_signal_files(hea_file, dat_file)
+    _validate_window(window_size, overlap)
+
+    window_record, crop_idx, max_crop_idx, events = await analyze_signal_logic(
+        hea_file, dat_file, xws_file, crop_idx, show_full_signal, window_size, overlap
+    )
+
+    return _window_response(
+        request,
+        window_record,
+        {"crop_idx": crop_idx, "max_crop_idx": max_crop_idx, "events": events},
+        precision,
+    )
+
+
+@ekg_router.post("/signal/scan")
+async def scan_signal_endpoint(
+    request: Request,
+    crop_idx: int = 0,
+    stop_at_first: bool = False,
+    window_size: int = Query(WDFDB_SAMPLES_PER_WINDOW, ge=1, le=WINDOW_MAX_SIZE),
+    overlap: int = Query(0, ge=0),
+    precision: int | None = Query(None, ge=0, le=15),
+    hea_file: UploadFile = File(...),
+    dat_file: UploadFile = File(...),
+    xws_file: UploadFile = File(...),
+) -> StreamingResponse:
+    _validate_signal_files(hea_file, dat_file)
+    _validate_window(window_size, overlap)
+
+    record = await store_signal_record(hea_file, dat_file, xws_file)
+
+    return _scan_response(
+        request,
+        scan_record_logic(
+            record, crop_idx, stop_at_first, precision, window_size, overlap
+        ),
+    )
+
+
+@ekg_router.post("/records/image")
+async def upload_image_record_endpoint(
+    calibration_profile: str | None = None,
+    image_file: UploadFile = File(...),
 ) -> JSONResponse:
-    if not any(hea_file.filename.endswith(ext) for ext in ALLOWED_SIGNAL_EXTENSIONS):
-        raise HTTPException(
-            status_code=400, detail="Tylko pliki .dat lub .hea są akceptowane."
-        )
-    if not any(dat_file.filename.endswith(ext) for ext in ALLOWED_SIGNAL_EXTENSIONS):
-        raise HTTPException(
-            status_code=400, detail="Tylko pliki .dat lub .hea są akceptowane."
-        )
+    _validate_image_file(image_file)
+    profile = _calibration_profile(calibration_profile)
+
+    image_bytes = await _read_image_file(image_file)
+    record = await store_image_record(image_bytes, image_file.filename, profile)
+
+    return _record_response(record)
+
+
+@ekg_router.post("/records/images")
+async def upload_image_records_endpoint(
+    calibration_profile: str | None = None,
+    image_files: list[UploadFile] = File(default=[]),
+    archive_file: UploadFile | None = File(default=None),
+) -> JSONResponse:
+    profile = _calibration_profile(calibration_profile)
+
+    images = []
+    for image_file in image_files:
+        _validate_image_file(image_file)
+        images.append((image_file.filename, await _read_image_file(image_file)))
+
+    # The archive stays open until its images, read one at a time, are done
+    with ExitStack() as archives:
+        if archive_file is not None:
+            if archive_file.content_type not in ALLOWED_ARCHIVE_TYPES:
+                raise HTTPException(
+                    status_code=400, detail="Tylko archiwa ZIP są akceptowane."
+                )
+            try:
+                UPLOAD_BYTES.labels(kind="archive").observe(check_upload_size(archive_file))
+                images.extend(await asyncio.to_thread(
+                    archives.enter_context, read_images_from_zip(archive_file)
+                ))
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+
+        if not images:
+            raise HTTPException(status_code=400, detail="Nie przesłano żadnych obrazów.")
+        if len(images) > BATCH_MAX_IMAGES:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Można przesłać najwyżej {BATCH_MAX_IMAGES} obrazów naraz.",
+            )
+
+        results = await store_image_records_logic(images, profile)
+
+    return JSONResponse(content={"records": results})
+
+
+@ekg_router.get("/calibration-profiles")
+async def list_calibration_profiles_endpoint() -> JSONResponse:
+    profiles = await asyncio.to_thread(list_calibration_profiles)
+    return JSONResponse(content={"profiles": profiles})
+
+
+@ekg_router.post("/records/signal")
+async def upload_signal_record_endpoint(
+    hea_file: UploadFile = File(...),
+    dat_file: UploadFile = File(...),
+    xws_file: UploadFile = File(...),
+) -> JSONResponse:
+    _validate_signal_files(hea_file, dat_file)
+
+    record = await store_signal_record(hea_file, dat_file, xws_file)
 
-    processed_data, crop_idx, max_crop_idx, events = await analyze_signal_logic(
-        hea_file, dat_file, xws_file, crop_idx, show_full_signal
+    return _record_response(record)
+
+
+@ekg_router.get("/records/{record_id}/windows/{crop_idx}")
+async def get_record_window_endpoint(
+    request: Request,
+    record_id: str,
+    crop_idx: int,
+    window_size: int = Query(WDFDB_SAMPLES_PER_WINDOW, ge=1, le=WINDOW_MAX_SIZE),
+    overlap: int = Query(0, ge=0),
+    precision: int | None = Query(None, ge=0, le=15),
+) -> Response:
+    _get_stored_record(record_id)
+    _validate_window(window_size, overlap)
+    media_type = negotiate_media_type(request.headers.get("accept"))
+    etag = make_etag(
+        record_id, "window", crop_idx, window_size, overlap, precision, media_type
     )
+    headers = {"Vary": "Accept", **cache_headers(etag)}
+    not_modified = _not_modified_response(request, headers["ETag"], headers)
+    if not_modified is not None:
+        return not_modified
 
-    return JSONResponse(
-        content={
-            "channels": processed_data,
+    try:
+        window = await get_record_window_logic(
+            record_id, crop_idx, window_size, overlap
+        )
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Nie znaleziono rekordu.")
+    window_record, crop_idx, max_crop_idx, events = window
+
+    return _window_response(
+        request,
+        window_record,
+        {
+            "record_id": record_id,
             "crop_idx": crop_idx,
             "max_crop_idx": max_crop_idx,
             "events": events,
-        }
+        },
+        precision,
+        headers,
+    )
+
+
+@ekg_router.get("/records/{record_id}/events")
+async def get_record_events_endpoint(
+    request: Request,
+    record_id: str,
+    sampfrom: int = Query(0, ge=0),
+    sampto: int | None = Query(None, ge=0),
+) -> Response:
+    _get_stored_record(record_id)
+    headers = cache_headers(make_etag(record_id, "events", sampfrom, sampto))
+    not_modified = _not_modified_response(request, headers["ETag"], headers)
+    if not_modified is not None:
+        return not_modified
+
+    try:
+        events = await get_record_events_logic(record_id, sampfrom, sampto)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Nie znaleziono rekordu.")
+
+    with timed_stage("response_encoding"):
+        return JSONResponse(content=events, headers=headers)
+
+
+@ekg_router.get("/records/{record_id}/scan")
+async def scan_record_endpoint(
+    request: Request,
+    record_id: str,
+    crop_idx: int = 0,
+    stop_at_first: bool = False,
+    window_size: int = Query(WDFDB_SAMPLES_PER_WINDOW, ge=1, le=WINDOW_MAX_SIZE),
+    overlap: int = Query(0, ge=0),
+    precision: int | None = Query(None, ge=0, le=15),
+) -> StreamingResponse:
+    record = _get_stored_record(record_id)
+    _validate_window(window_size, overlap)
+
+    return _scan_response(
+        request,
+        scan_record_logic(
+            record, crop_idx, stop_at_first, precision, window_size, overlap
+        ),
     )
+
+
+@ekg_router.get("/records/{record_id}/overview")
+async def get_record_overview_endpoint(
+    request: Request,
+    record_id: str,
+    sampfrom: int = Query(0, ge=0),
+    sampto: int | None = Query(None, ge=0),
+    max_points: int = Query(2000, ge=2, le=20000),
+) -> Response:
+    _get_stored_record(record_id)
+    headers = cache_headers(
+        make_etag(record_id, "overview", sampfrom, sampto, max_points)
+    )
+    not_modified = _not_modified_response(request, headers["ETag"], headers)
+    if not_modified is not None:
+        return not_modified
+
+    try:
+        overview = await get_record_overview_logic(
+            record_id, sampfrom, sampto, max_points
+        )
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Nie znaleziono rekordu.")
+
+    with timed_stage("response_encoding"):
+        return JSONResponse(content=overview, headers=headers)
+
+
+@ekg_router.get("/records/{record_id}/ranges")
+async def get_record_ranges_endpoint(
+    request: Request,
+    record_id: str,
+    ranges: list[str] = Query(..., alias="range"),
+    unit: str = "samples",
+    max_points: int | None = Query(None, ge=2, le=WINDOW_MAX_SIZE),
+    precision: int | None = Query(None, ge=0, le=15),
+) -> Response:
+    record = _get_stored_record(record_id)
+    sample_ranges = _parse_ranges(ranges, unit, record.fs)
+    headers = cache_headers(
+        make_etag(record_id, "ranges", sample_ranges, max_points, precision)
+    )
+    not_modified = _not_modified_response(request, headers["ETag"], headers)
+    if not_modified is not None:
+        return not_modified
+
+    try:
+        content = await get_record_ranges_logic(
+            record_id, sample_ranges, max_points, precision
+        )
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Nie znaleziono rekordu.")
+
+    with timed_stage("response_encoding"):
+        return JSONResponse(content=content, headers=headers)
+
+
+@ekg_router.websocket("/live")
+async def live_monitor_endpoint(
+    websocket: WebSocket,
+    fs: float = Query(..., gt=0, le=LIVE_MAX_FS),
+    leads: int = Query(1, ge=1, le=LIVE_MAX_LEADS),
+):
+    """
+    Live monitoring of a streamed signal. Every binary (float32) or JSON
+    frame of samples is answered with the beats, heart rate and events it
+    made final, in samples from the stream start; a text "end" frame reports
+    the rest and closes the connection.
+    """
+    await websocket.accept()
+    max_samples = int(LIVE_MAX_FRAME_DURATION * fs)
+
+    try:
+        with live_monitor_session(fs, leads) as monitor:
+            await websocket.send_json({
+                "type": "ready",
+                "fs": fs,
+                "leads": monitor.lead_names,
+                "peak_delay": monitor.peak_delay,
+            })
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    return
+
+                if message.get("text") == "end":
+                    await websocket.send_json({"type": "update", **monitor.flush()})
+                    await websocket.close()
+                    return
+
+                try:
+                    samples = parse_frame(
+                        message.get("bytes") or message.get("text"), leads, max_samples
+                    )
+                except ValueError:
+                    await websocket.close(
+                        code=1003, reason="Nieprawidłowa ramka próbek."
+                    )
+                    return
+
+                update = monitor.feed(samples)
+                if update["beats"] or update["events"]:
+                    await websocket.send_json({"type": "update", **update})
+    except LiveMonitorBusyError:
+        await websocket.close(
+            code=1013, reason="Serwer jest przeciążony, spróbuj ponownie za chwilę."
+        )
+    except WebSocketDisconnect:
+        pass
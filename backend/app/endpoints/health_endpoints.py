@@ -1,9 +1,18 @@
 from fastapi import APIRouter
 from fastapi.responses import JSONResponse
 
+from ..logic.warmup.warmup import warmup
+
 health_router = APIRouter(prefix="/health", tags=["health"])
 
 
 @health_router.get("/live")
 async def health_check_ready() -> JSONResponse:
     return JSONResponse(content={"status": True})
+
+
+@health_router.get("/ready")
+async def readiness_check() -> JSONResponse:
+    if not warmup.ready:
+        return JSONResponse(status_code=503, content={"status": False})
+    return JSONResponse(content={"status": True})
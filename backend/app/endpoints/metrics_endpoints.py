@@ -0,0 +1,10 @@
+from fastapi import APIRouter
+from fastapi.responses import Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+metrics_router = APIRouter(tags=["metrics"])
+
+
+@metrics_router.get("/metrics")
+async def metrics_endpoint() -> Response:
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,152 @@
+import json
+import os
+import tempfile
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+import numpy as np
+
+CALIBRATION_PROFILES_ENABLED = os.environ.get("EKG_CALIBRATION_PROFILES", "1") == "1"
+CALIBRATION_PROFILE_DIR = Path(
+    os.environ.get(
+        "EKG_CALIBRATION_PROFILE_DIR",
+        Path(tempfile.gettempdir()) / "ekg-calibration-profiles",
+    )
+)
+CALIBRATION_PROFILE_MAX_COUNT = int(os.environ.get("EKG_CALIBRATION_PROFILE_MAX_COUNT", 256))
+
+# The fingerprint is made of these percentiles of the margin intensity
+# (paper, grid and line shades, hardly affected by the thin trace), taken
+# over every FINGERPRINT_STRIDE-th pixel and quantized to FINGERPRINT_LEVELS
+FINGERPRINT_PERCENTILES = (10, 50, 90)
+FINGERPRINT_STRIDE = 4
+FINGERPRINT_LEVELS = 16
+# A profile matches an image when the margin intensity is at least this many
+# times more periodic at its grid pitch than at 10% off it, or at twice it
+PROFILE_MIN_GRID_CONTRAST = 3.0
+
+
+@dataclass
+class CalibrationProfile:
+    """Grid pitch and sample rate shared by images from one ECG machine or scanner."""
+    profile_id: str
+    width: int
+    height: int
+    small_grid_size: float
+    sample_rate: int
+
+
+def margin_fingerprint(image) -> str:
+    """Quantized intensity percentiles of the grid margins, as hex digits."""
+    # Imported here, so that the app process (which only keeps the profiles
+    # of images digitized by the workers) does not load OpenCV
+    from ..ecg_digitizer.modules.signal_processing import grid_margins
+
+    margins = grid_margins(image[::FINGERPRINT_STRIDE, ::FINGERPRINT_STRIDE])
+    shades = np.percentile(margins, FINGERPRINT_PERCENTILES)
+    levels = (shades * FINGERPRINT_LEVELS // 256).astype(int)
+    return "".join(f"{level:x}" for level in levels)
+
+
+def profile_key(image) -> str:
+    """Image dimensions and margin fingerprint, the automatic profile id."""
+    height, width = image.shape[:2]
+    return f"{width}x{height}-{margin_fingerprint(image)}"
+
+
+def _periodicity(projection, frequency):
+    phases = np.exp(-2j * np.pi * frequency * np.arange(len(projection)))
+    return abs(np.dot(projection, phases))
+
+
+def verify_profile(image, profile: CalibrationProfile) -> bool:
+    """
+    Checks cheaply that the vertical grid lines of `image` repeat at the
+    profile pitch: a single DFT bin of the margin column intensities at the
+    pitch must clearly stand out from the bins 10% below and above it, and
+    from the one at twice the pitch, which a grid of that pitch would show.
+    """
+    if profile.small_grid_size <= 1:
+        return False
+
+    import cv2
+
+    from ..ecg_digitizer.modules.signal_processing import grid_margins
+
+    margins = grid_margins(image)
+    projection = 255 - cv2.reduce(margins, 0, cv2.REDUCE_AVG, dtype=cv2.CV_32F)[0]
+    projection -= projection.mean()
+
+    frequency = 1.0 / profile.small_grid_size
+    contrast = _periodicity(projection, frequency)
+    background = max(
+        _periodicity(projection, ratio * frequency) for ratio in (0.5, 0.9, 1.1)
+    )
+    return contrast >= PROFILE_MIN_GRID_CONTRAST * background
+
+
+class CalibrationProfileStore:
+    """
+    Calibration profiles kept as one JSON file each, shared by every worker
+    process. Reads refresh a profile's modification time, and the least
+    recently used profiles are removed beyond `max_count`.
+    """
+
+    def __init__(self, root_dir, max_count):
+        self.root_dir = Path(root_dir)
+        self.max_count = max_count
+        self.root_dir.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, profile_id: str) -> Path:
+        return self.root_dir / f"{Path(profile_id).name}.json"
+
+    def get(self, profile_id: str) -> CalibrationProfile | None:
+        path = self._path(profile_id)
+        profile = self._load(path)
+        if profile is not None:
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+        return profile
+
+    @staticmethod
+    def _load(path: Path) -> CalibrationProfile | None:
+        try:
+            return CalibrationProfile(**json.loads(path.read_text()))
+        except (OSError, TypeError, ValueError):
+            return None
+
+    def put(self, profile: CalibrationProfile) -> CalibrationProfile:
+        # Written aside and renamed, so concurrent readers never see a partial file
+        descriptor, staging_path = tempfile.mkstemp(dir=self.root_dir, suffix=".tmp")
+        with os.fdopen(descriptor, "w") as file:
+            json.dump(asdict(profile), file)
+        os.replace(staging_path, self._path(profile.profile_id))
+
+        self._evict()
+        return profile
+
+    def profiles(self) -> list[CalibrationProfile]:
+        profiles = (self._load(path) for path in self._paths())
+        return [profile for profile in profiles if profile is not None]
+
+    def _paths(self) -> list[Path]:
+        """Profile files, least recently used first."""
+        stats = []
+        for path in self.root_dir.glob("*.json"):
+            try:
+                stats.append((path.stat().st_mtime, path))
+            except OSError:
+                continue
+        return [path for _, path in sorted(stats)]
+
+    def _evict(self):
+        paths = self._paths()
+        for path in paths[: max(0, len(paths) - self.max_count)]:
+            path.unlink(missing_ok=True)
+
+
+calibration_profiles = CalibrationProfileStore(
+    CALIBRATION_PROFILE_DIR, CALIBRATION_PROFILE_MAX_COUNT
+)
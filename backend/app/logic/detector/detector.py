@@ -1,14 +1,188 @@
-import wfdb
+from dataclasses import dataclass, field
+
+from pathlib import Path
+
 import numpy as np
-from scipy.signal import find_peaks
-import matplotlib.pyplot as plt
 
+from ..ecg_record.ecg_record import ECGRecord
+from ..ecg_record.wfdb_reader import INVALID_SAMPLE_VALUES, WfdbSignalReader
+
+from ..metrics.metrics import timed_stage
+from .streaming_detector import (
+    DETECTION_CHUNK_DURATION,
+    detect_r_peaks_chunked,
+    iter_chunks,
+    lead_means,
+)
+
+BRADYCARDIA_THRESHOLD = 60
+TACHYCARDIA_THRESHOLD = 100
+RATE_WINDOW_DURATION = 3.0
+
+# RR intervals (in seconds) longer than these are pauses and asystole
+PAUSE_THRESHOLD = 2.0
+ASYSTOLE_THRESHOLD = 3.0
+# Local RR statistics are taken over this many preceding intervals
+VARIABILITY_WINDOW_BEATS = 16
+# Intervals shorter than this share of the local mean end on a premature beat
+PREMATURE_RR_RATIO = 0.8
+# A premature beat is followed by a compensatory pause: the short and the
+# next interval together span two local means, within this share of them
+PREMATURE_PAUSE_TOLERANCE = 0.15
+# Half width (in seconds) of a premature beat event
+PREMATURE_BEAT_MARGIN = 0.2
+# A window is AF-like when at least this share of its successive RR
+# differences exceed AF_RR_DIFFERENCE_RATIO of the mean of the two intervals,
+# and its RMSSD exceeds AF_MIN_NORMALIZED_RMSSD of its mean RR
+AF_RR_DIFFERENCE_RATIO = 0.1
+AF_MIN_IRREGULAR_FRACTION = 0.6
+AF_MIN_NORMALIZED_RMSSD = 0.1
+
+# Peaks of different leads closer than this (in seconds) are the same beat
+CONSENSUS_TOLERANCE = 0.1
+# A beat is kept when more than this share of the leads detected it, so a
+# strict majority; leads without any peaks (e.g. missing) do not vote
+CONSENSUS_MIN_LEAD_FRACTION = 0.5
+# Share of an event's beats a lead must detect to be listed as supporting it
+EVENT_MIN_LEAD_SUPPORT = 0.5
+
+# Window means closer to a threshold than this (relative) are recomputed
+# directly so the cumulative-sum shortcut can never flip a comparison.
+_THRESHOLD_RECHECK_TOLERANCE = 1e-6
 
 
 def detect_r_peaks(signal, fs):
+    return detect_r_peaks_multi(signal, fs)[0]
+
+
+def detect_r_peaks_multi(signals, fs, missing_value=None):
+    """
+    R-peaks of every lead (column) of `signals`. Peaks must reach the mean
+    of their lead, so leads with missing samples (NaN, or `missing_value` in
+    digital signals) have none.
+    """
+    # Imported here, so that the app process (which only reads analyses
+    # computed by the workers) does not load scipy.signal
+    from scipy.signal import find_peaks
+
+    signals = np.asarray(signals)
+    if signals.ndim == 1:
+        signals = signals[:, np.newaxis]
+    leads = np.ascontiguousarray(signals.T)
+
+    thresholds = np.mean(leads, axis=1, dtype=np.float64)
+    if missing_value is not None:
+        thresholds[(leads == missing_value).any(axis=1)] = np.nan
+
+    # All leads are shifted by their thresholds at once, so one height of 0
+    # applies all of them. Samples below it are clamped, as they can neither
+    # be peaks nor stop a peak from being one, which saves find_peaks most
+    # of its work. Each lead is then scanned on its own, as a contiguous row
+    # that stays in cache
+    lanes = np.subtract(leads, thresholds[:, np.newaxis], dtype=np.float64)
+    np.maximum(lanes, -np.finfo(float).tiny, out=lanes)
+
     distance = int(0.6 * fs)
-    peaks, _ = find_peaks(signal, distance=distance, height=np.mean(signal))
-    return peaks
+    return [find_peaks(lane, height=0.0, distance=distance)[0] for lane in lanes]
+
+
+def cluster_r_peaks(lead_peaks, fs, tolerance=CONSENSUS_TOLERANCE):
+    """
+    Groups per-lead R-peaks into candidate beats, starting a new one wherever
+    consecutive peaks are further apart than `tolerance`. Returns the beat
+    sample indices, the last peak of every beat and a `(beats, leads)`
+    boolean matrix of the leads that detected each beat.
+    """
+    leads = len(lead_peaks)
+    positions = np.concatenate(
+        [np.asarray(peaks, dtype=np.intp) for peaks in lead_peaks]
+        + [np.empty(0, dtype=np.intp)]
+    )
+    if not len(positions):
+        return positions, positions, np.zeros((0, leads), dtype=bool)
+
+    owners = np.repeat(np.arange(leads), [len(peaks) for peaks in lead_peaks])
+    order = np.argsort(positions, kind="stable")
+    positions, owners = positions[order], owners[order]
+
+    beat = np.concatenate(([0], np.cumsum(np.diff(positions) > tolerance * fs)))
+    support = np.zeros((beat[-1] + 1, leads), dtype=bool)
+    support[beat, owners] = True
+
+    counts = np.bincount(beat)
+    beats = np.round(np.bincount(beat, weights=positions) / counts).astype(np.intp)
+    return beats, positions[np.cumsum(counts) - 1], support
+
+
+def fuse_r_peaks(
+    lead_peaks,
+    fs,
+    tolerance=CONSENSUS_TOLERANCE,
+    min_lead_fraction=CONSENSUS_MIN_LEAD_FRACTION,
+):
+    """
+    Fuses per-lead R-peaks into one consensus beat series, keeping the beats
+    a strict majority of the leads with any peaks detected. Returns the beat
+    sample indices and a `(beats, leads)` boolean matrix of the leads that
+    detected each beat.
+
+    Each lead keeps only one peak within 0.6 s, so during fast runs the
+    leads can keep different beats and agree on none of them. Where a strict
+    majority of the leads has peaks between two consensus beats, the beats
+    of the lead with the most of them are kept as well, so that such a
+    disagreement never opens a gap in the beats.
+    """
+    beats, _, support = cluster_r_peaks(lead_peaks, fs, tolerance)
+    voting = np.array([len(peaks) > 0 for peaks in lead_peaks], dtype=bool)
+    keep = support.sum(axis=1) > min_lead_fraction * voting.sum()
+    if len(beats):
+        keep |= _disputed_beats(support, keep, voting, min_lead_fraction)
+    return beats[keep], support[keep]
+
+
+def _disputed_beats(support, keep, voting, min_lead_fraction):
+    """
+    Beats without a majority that are kept, being the beats of the lead with
+    the most peaks between two consensus beats that a strict majority of the
+    leads has peaks between.
+    """
+    # Beats between the same two consensus beats share a gap
+    gap = np.cumsum(keep)
+    disputed = ~keep
+    peaks = np.zeros((gap[-1] + 1, support.shape[1]), dtype=np.intp)
+    np.add.at(peaks, gap[disputed], support[disputed])
+
+    seen = ((peaks > 0) & voting).sum(axis=1) > min_lead_fraction * voting.sum()
+    chosen = peaks.argmax(axis=1)[gap]
+    return disputed & seen[gap] & support[np.arange(len(gap)), chosen]
+
+
+def confirmed_gaps(
+    lead_peaks,
+    fs,
+    starts,
+    ends,
+    tolerance=CONSENSUS_TOLERANCE,
+    min_lead_fraction=CONSENSUS_MIN_LEAD_FRACTION,
+):
+    """
+    Whether every `[starts, ends]` gap between beats is also a gap in a
+    strict majority of the leads with any peaks, which have none of their
+    own peaks inside it.
+    """
+    starts = np.asarray(starts, dtype=float) + tolerance * fs
+    ends = np.asarray(ends, dtype=float) - tolerance * fs
+    empty = np.zeros(len(starts), dtype=np.intp)
+    voters = 0
+    for peaks in lead_peaks:
+        if len(peaks):
+            voters += 1
+            inside = np.searchsorted(peaks, ends) - np.searchsorted(
+                peaks, starts, side="right"
+            )
+            empty += inside <= 0
+    return empty > min_lead_fraction * voters
+
 
 def compute_rr_intervals(r_peaks, fs):
     return np.diff(r_peaks) / fs
@@ -16,29 +190,52 @@ def compute_rr_intervals(r_peaks, fs):
 def compute_heart_rate(rr_intervals):
     return 60 / rr_intervals
 
-def detect_bradycardia(times, hr, window_duration=3.0, threshold=60):
-    bradycardia_times = []
-    for i in range(len(hr)):
-        window_start = times[i]
-        window_end = window_start + window_duration
-        in_window = (times >= window_start) & (times <= window_end)
-        if np.sum(in_window) > 0:
-            avg_hr = np.mean(hr[in_window])
-            if avg_hr < threshold:
-                bradycardia_times.append(window_start)
-    return bradycardia_times
-
-def detect_tachycardia(times, hr, window_duration=3.0, threshold=100):
-    tachycardia_times = []
-    for i in range(len(hr)):
-        window_start = times[i]
-        window_end = window_start + window_duration
-        in_window = (times >= window_start) & (times <= window_end)
-        if np.sum(in_window) > 0:
-            avg_hr = np.mean(hr[in_window])
-            if avg_hr > threshold:
-                tachycardia_times.append(window_start)
-    return tachycardia_times
+
+def compute_window_heart_rates(times, hr, window_duration=RATE_WINDOW_DURATION):
+    """
+    Mean heart rate of every window `[times[i], times[i] + window_duration]`,
+    together with the `[first, last)` beat index bounds of each window.
+    `times` must be sorted ascending.
+    """
+    times = np.asarray(times, dtype=float)
+    hr = np.asarray(hr, dtype=float)
+
+    first = np.searchsorted(times, times, side="left")
+    last = np.searchsorted(times, times + window_duration, side="right")
+
+    center = np.mean(hr) if len(hr) else 0.0
+    cumulative = np.concatenate(([0.0], np.cumsum(hr - center)))
+    mean_hr = (cumulative[last] - cumulative[first]) / (last - first) + center
+
+    return mean_hr, first, last
+
+
+def _rate_onsets(times, hr, mean_hr, first, last, threshold, above):
+    near = np.abs(mean_hr - threshold) <= _THRESHOLD_RECHECK_TOLERANCE * abs(threshold)
+    for i in np.flatnonzero(near):
+        mean_hr[i] = np.mean(hr[first[i]:last[i]])
+
+    matches = mean_hr > threshold if above else mean_hr < threshold
+    return list(times[matches])
+
+
+def detect_bradycardia(
+    times, hr, window_duration=RATE_WINDOW_DURATION, threshold=BRADYCARDIA_THRESHOLD
+):
+    times = np.asarray(times, dtype=float)
+    hr = np.asarray(hr, dtype=float)
+    mean_hr, first, last = compute_window_heart_rates(times, hr, window_duration)
+    return _rate_onsets(times, hr, mean_hr, first, last, threshold, above=False)
+
+
+def detect_tachycardia(
+    times, hr, window_duration=RATE_WINDOW_DURATION, threshold=TACHYCARDIA_THRESHOLD
+):
+    times = np.asarray(times, dtype=float)
+    hr = np.asarray(hr, dtype=float)
+    mean_hr, first, last = compute_window_heart_rates(times, hr, window_duration)
+    return _rate_onsets(times, hr, mean_hr, first, last, threshold, above=True)
+
 
 def filter_events_by_time(events, start_time, end_time):
     return [
@@ -46,45 +243,408 @@ def filter_events_by_time(events, start_time, end_time):
         if event["end"] >= start_time and event["start"] <= end_time
     ]
 
-def detect_sickness(sampfrom, sampto, crop_idx, tmp_hea_path):
 
-    base_path = tmp_hea_path.with_suffix("")
-    record = wfdb.rdrecord(base_path)
+@dataclass
+class RRFeatures:
+    """
+    Beat-to-beat features of a record, computed once and read by every
+    rhythm detector. Interval `i` runs from beat `i` to beat `i + 1`.
+    """
+    fs: float
+    r_peaks: np.ndarray
+    # Start of every interval in seconds
+    times: np.ndarray
+    rr_intervals: np.ndarray
+    # rr_intervals[i] - rr_intervals[i - 1], NaN for the first interval
+    rr_differences: np.ndarray
+    heart_rates: np.ndarray
+    # Mean heart rate of the intervals starting in the rate window after
+    # each interval, with the [first, last) bounds of the window
+    window_heart_rates: np.ndarray
+    window_first: np.ndarray
+    window_last: np.ndarray
+    # Mean, standard deviation and RMSSD of the preceding
+    # VARIABILITY_WINDOW_BEATS intervals, NaN where there are too few
+    local_rr_mean: np.ndarray
+    local_rr_std: np.ndarray
+    local_rmssd: np.ndarray
+    # Heart rates (in bpm) the rate windows are held to
+    bradycardia_threshold: float = BRADYCARDIA_THRESHOLD
+    tachycardia_threshold: float = TACHYCARDIA_THRESHOLD
+    # Peaks of every lead the beats were fused from, empty for a single
+    # beat series
+    lead_peaks: list = field(default_factory=list)
+
 
-    fs = record.fs
-    signal = record.p_signal[:, 0]
+def _trailing_sums(values, window):
+    """Sums of `values[i - window:i]` for every `i`, NaN where it starts before 0."""
+    cumulative = np.concatenate(([0.0], np.cumsum(values, dtype=np.float64)))
+    sums = np.full(len(values), np.nan)
+    sums[window:] = cumulative[window:-1] - cumulative[:-window - 1]
+    return sums
 
-    r_peaks = detect_r_peaks(signal, fs)
-    r_peak_times = r_peaks / fs
 
+def compute_rr_features(
+    r_peaks,
+    fs,
+    window_duration=RATE_WINDOW_DURATION,
+    beats=VARIABILITY_WINDOW_BEATS,
+    lead_peaks=None,
+    bradycardia_threshold=BRADYCARDIA_THRESHOLD,
+    tachycardia_threshold=TACHYCARDIA_THRESHOLD,
+):
+    r_peaks = np.asarray(r_peaks)
+    times = r_peaks[:-1] / fs
     rr_intervals = compute_rr_intervals(r_peaks, fs)
     heart_rates = compute_heart_rate(rr_intervals)
+    rr_differences = np.concatenate(([np.nan], np.diff(rr_intervals)))
+
+    window_heart_rates, first, last = compute_window_heart_rates(
+        times, heart_rates, window_duration
+    )
+
+    # Centred on the overall mean, so the variance does not cancel out. The
+    # successive differences of a window are the ones between its intervals
+    center = np.mean(rr_intervals) if len(rr_intervals) else 0.0
+    centered = rr_intervals - center
+    local_mean = _trailing_sums(centered, beats) / beats
+    local_variance = _trailing_sums(centered**2, beats) / beats - local_mean**2
+    squared_differences = np.nan_to_num(rr_differences) ** 2
+    local_rmssd = np.sqrt(_trailing_sums(squared_differences, beats - 1) / (beats - 1))
+    local_rmssd[:beats] = np.nan
+
+    return RRFeatures(
+        fs=fs,
+        r_peaks=r_peaks,
+        times=times,
+        rr_intervals=rr_intervals,
+        rr_differences=rr_differences,
+        heart_rates=heart_rates,
+        window_heart_rates=window_heart_rates,
+        window_first=first,
+        window_last=last,
+        local_rr_mean=local_mean + center,
+        local_rr_std=np.sqrt(np.maximum(local_variance, 0.0)),
+        local_rmssd=local_rmssd,
+        bradycardia_threshold=bradycardia_threshold,
+        tachycardia_threshold=tachycardia_threshold,
+        lead_peaks=list(lead_peaks or []),
+    )
 
-    bradycardia_onsets = detect_bradycardia(r_peak_times[:-1], heart_rates)
-    tachycardia_onsets = detect_tachycardia(r_peak_times[:-1], heart_rates)
 
-    #print(f"\nWykryto {len(bradycardia_onsets)} epizodów bradykardii.")
-    #for t in bradycardia_onsets:
-    #    print(f"Bradykardia wykryta w okolicach {t:.2f} sekundy.")
+@dataclass
+class RecordAnalysis:
+    fs: float
+    r_peaks: np.ndarray
+    rr_intervals: np.ndarray
+    heart_rates: np.ndarray
+    # event type -> (starts, ends) in samples, both sorted ascending
+    episodes: dict = field(default_factory=dict)
+    lead_names: list = field(default_factory=list)
+    # (beats, leads) boolean matrix of the leads that detected each beat
+    beat_leads: np.ndarray | None = None
+    # event type -> (events, leads) boolean matrix of the supporting leads
+    episode_leads: dict = field(default_factory=dict)
+    rr_features: RRFeatures | None = None
 
-    #print(f"\nWykryto {len(tachycardia_onsets)} epizodów tachykardii.")
-    #for t in tachycardia_onsets:
-    #    print(f"Tachykardia wykryta w okolicach {t:.2f} sekundy.")
+    @property
+    def nbytes(self) -> int:
+        arrays = [self.r_peaks, self.rr_intervals, self.heart_rates, self.beat_leads]
+        arrays += [bound for bounds in self.episodes.values() for bound in bounds]
+        arrays += list(self.episode_leads.values())
+        if self.rr_features is not None:
+            arrays += list(vars(self.rr_features).values())
+            arrays += self.rr_features.lead_peaks
+        # The RR features share some arrays with the analysis
+        arrays = {id(array): array for array in arrays if isinstance(array, np.ndarray)}
+        return sum(array.nbytes for array in arrays.values())
 
-    all_events = [
-        {"start": max(0, (t - 1) * fs), "end": (t+1)*fs, "type": "bradycardia"} for t in bradycardia_onsets
-    ] + [{"start": max(0, (t - 1) * fs), "end": (t+1)*fs, "type": "tachycardia"} for t in tachycardia_onsets]
+    def events_in_window(self, sampfrom, sampto, origin=0):
+        """Events overlapping `[sampfrom, sampto)`, in samples from `origin`."""
+        events = []
+        for event_type, (starts, ends) in self.episodes.items():
+            first = np.searchsorted(ends, sampfrom, side="left")
+            last = np.searchsorted(starts, sampto, side="right")
+            leads = self.episode_leads.get(event_type)
+            for i in range(first, last):
+                event = {
+                    "start": float(starts[i]) - origin,
+                    "end": float(ends[i]) - origin,
+                    "type": event_type,
+                }
+                if leads is not None:
+                    event["leads"] = [
+                        self.lead_names[lead] for lead in np.flatnonzero(leads[i])
+                    ]
+                events.append(event)
+        return events
 
-    start_time = sampfrom
-    end_time = sampto
 
-    all_events = filter_events_by_time(all_events, start_time, end_time)
-    
-    for event in all_events:
-        event["start"] -= crop_idx*4000
-        event["end"] -= crop_idx*4000
+def _episode_bounds(onsets, fs):
+    onsets = np.asarray(onsets, dtype=float)
+    return np.maximum(0, (onsets - 1) * fs), (onsets + 1) * fs
 
-    return all_events
 
+def episode_leads(r_peaks, beat_leads, starts, ends, min_support=EVENT_MIN_LEAD_SUPPORT):
+    """Leads that detected at least `min_support` of the beats of each episode."""
+    detected = np.vstack([
+        np.zeros((1, beat_leads.shape[1])), np.cumsum(beat_leads, axis=0)
+    ])
+    first = np.searchsorted(r_peaks, starts, side="left")
+    last = np.searchsorted(r_peaks, ends, side="right")
 
+    counts = detected[last] - detected[first]
+    return counts >= min_support * (last - first)[:, np.newaxis]
+
+
+# event type -> function of RRFeatures returning (starts, ends) in samples,
+# both sorted ascending
+RHYTHM_DETECTORS = {}
+
+
+def rhythm_detector(event_type):
+    def register(detect):
+        RHYTHM_DETECTORS[event_type] = detect
+        return detect
+    return register
+
+
+def _merge_spans(starts, ends):
+    """Unions sorted-by-start spans into disjoint ones."""
+    if not len(starts):
+        return starts, ends
+    reach = np.maximum.accumulate(ends)
+    opening = np.concatenate(([True], starts[1:] > reach[:-1]))
+    closing = np.concatenate((opening[1:], [True]))
+    return starts[opening], reach[closing]
+
+
+@rhythm_detector("bradycardia")
+def detect_bradycardia_episodes(features: RRFeatures):
+    onsets = _rate_onsets(
+        features.times, features.heart_rates, features.window_heart_rates.copy(),
+        features.window_first, features.window_last, features.bradycardia_threshold,
+        above=False,
+    )
+    return _episode_bounds(onsets, features.fs)
+
+
+@rhythm_detector("tachycardia")
+def detect_tachycardia_episodes(features: RRFeatures):
+    onsets = _rate_onsets(
+        features.times, features.heart_rates, features.window_heart_rates.copy(),
+        features.window_first, features.window_last, features.tachycardia_threshold,
+        above=True,
+    )
+    return _episode_bounds(onsets, features.fs)
+
+
+def _long_intervals(features: RRFeatures, longer, up_to=np.inf):
+    """
+    RR intervals in `(longer, up_to]` seconds, as `(starts, ends)` beats. Of
+    fused beats, only the gaps also found in the leads' own peaks count, so
+    a beat lost in fusion is not taken for one.
+    """
+    rr = features.rr_intervals
+    long = (rr > longer) & (rr <= up_to)
+    starts = features.r_peaks[:-1][long].astype(float)
+    ends = features.r_peaks[1:][long].astype(float)
+    if features.lead_peaks:
+        confirmed = confirmed_gaps(features.lead_peaks, features.fs, starts, ends)
+        starts, ends = starts[confirmed], ends[confirmed]
+    return starts, ends
+
+
+@rhythm_detector("pause")
+def detect_pauses(features: RRFeatures):
+    return _long_intervals(features, PAUSE_THRESHOLD, ASYSTOLE_THRESHOLD)
+
+
+@rhythm_detector("asystole")
+def detect_asystole(features: RRFeatures):
+    return _long_intervals(features, ASYSTOLE_THRESHOLD)
+
+
+@rhythm_detector("premature_beat")
+def detect_premature_beats(features: RRFeatures):
+    """
+    Beats ending an interval shorter than PREMATURE_RR_RATIO of the local
+    mean, followed by a compensatory pause and then an interval back at the
+    local rate, so that a step in the rate is not taken for one.
+    """
+    rr, mean = features.rr_intervals, features.local_rr_mean
+    following = np.concatenate((rr[1:], [np.nan]))
+    after = np.concatenate((rr[2:], [np.nan, np.nan]))[:len(rr)]
+    with np.errstate(invalid="ignore"):
+        premature = (
+            (rr < PREMATURE_RR_RATIO * mean)
+            & (following > mean)
+            & (np.abs(rr + following - 2 * mean) <= PREMATURE_PAUSE_TOLERANCE * 2 * mean)
+            & (np.abs(after - mean) <= (1 - PREMATURE_RR_RATIO) * mean)
+        )
+    beats = features.r_peaks[1:][premature].astype(float)
+    margin = PREMATURE_BEAT_MARGIN * features.fs
+    return np.maximum(0, beats - margin), beats + margin
+
+
+@rhythm_detector("irregular_rhythm")
+def detect_irregular_rhythm(features: RRFeatures, beats=VARIABILITY_WINDOW_BEATS):
+    """AF-like windows, where most successive RR intervals differ markedly."""
+    with np.errstate(invalid="ignore"):
+        pair_means = features.rr_intervals - features.rr_differences / 2
+        irregular = (
+            np.abs(features.rr_differences) > AF_RR_DIFFERENCE_RATIO * pair_means
+        )
+        fraction = _trailing_sums(irregular, beats - 1) / (beats - 1)
+        flagged = (fraction >= AF_MIN_IRREGULAR_FRACTION) & (
+            features.local_rmssd >= AF_MIN_NORMALIZED_RMSSD * features.local_rr_mean
+        )
+
+    # Every flagged window spans its preceding intervals and the current one
+    last = np.flatnonzero(flagged)
+    return _merge_spans(
+        features.r_peaks[last - beats].astype(float),
+        features.r_peaks[last + 1].astype(float),
+    )
+
+
+def analyze_record(
+    signals,
+    fs,
+    lead_names=None,
+    missing_value=None,
+    **options,
+):
+    """
+    Analyses every lead of `signals` (one lead per column, or a 1-D single
+    lead) at once. Rates and events come from the consensus beats of all
+    leads.
+    """
+    signals = np.asarray(signals)
+    if signals.ndim == 1:
+        signals = signals[:, np.newaxis]
+    if lead_names is None:
+        lead_names = [f"lead {i}" for i in range(signals.shape[1])]
+
+    with timed_stage("r_peak_detection"):
+        lead_peaks = detect_r_peaks_multi(signals, fs, missing_value)
+    return analyze_r_peaks(lead_peaks, fs, lead_names, **options)
+
+
+def analyze_chunks(
+    chunks, fs, lead_names, missing_value=None, thresholds=None, **options
+):
+    """
+    Analyses a record read in consecutive `(samples, leads)` chunks, holding
+    only one chunk of it in memory. With the record means of its leads as
+    `thresholds`, the beats are those of `analyze_record`.
+    """
+    with timed_stage("r_peak_detection"):
+        found = list(
+            detect_r_peaks_chunked(
+                chunks, fs, len(lead_names), missing_value, thresholds
+            )
+        )
+        lead_peaks = [np.concatenate(peaks) for peaks in zip(*found)]
+    return analyze_r_peaks(lead_peaks, fs, lead_names, **options)
+
+
+def analyze_r_peaks(lead_peaks, fs, lead_names, detectors=None, **options):
+    """
+    Fuses per-lead R-peaks into beats and runs every rhythm detector on their
+    shared RR features. `options` go to `compute_rr_features`, e.g. the rate
+    `window_duration` and the bradycardia and tachycardia thresholds.
+    """
+    detectors = RHYTHM_DETECTORS if detectors is None else detectors
+
+    with timed_stage("peak_fusion"):
+        r_peaks, beat_leads = fuse_r_peaks(lead_peaks, fs)
+    with timed_stage("rr_features"):
+        features = compute_rr_features(r_peaks, fs, lead_peaks=lead_peaks, **options)
+
+    episodes = {}
+    for event_type, detect in detectors.items():
+        with timed_stage(f"detector_{event_type}"):
+            episodes[event_type] = detect(features)
+
+    return RecordAnalysis(
+        fs=fs,
+        r_peaks=r_peaks,
+        rr_intervals=features.rr_intervals,
+        heart_rates=features.heart_rates,
+        episodes=episodes,
+        lead_names=list(lead_names),
+        beat_leads=beat_leads,
+        episode_leads={
+            event_type: episode_leads(r_peaks, beat_leads, starts, ends)
+            for event_type, (starts, ends) in episodes.items()
+        },
+        rr_features=features,
+    )
+
+
+class AnalysisStoppedError(Exception):
+    pass
+
+
+def analyze_wfdb_record(
+    tmp_hea_path, chunk_duration=DETECTION_CHUNK_DURATION, progress=None, **options
+):
+    """
+    Analyses a stored record. `progress(read, total)` is called before every
+    chunk with the samples read so far and the samples to read, which cover
+    both passes over the record.
+    """
+    base_path = Path(tmp_hea_path).with_suffix("")
+    reader = WfdbSignalReader.open(base_path)
+    if reader is None or min(reader.adc_gain) <= 0:
+        record = ECGRecord.from_wfdb(base_path)
+        return analyze_record(record.p_signal, record.fs, record.sig_name, **options)
+
+    # Beats only depend on the order of the samples, which the increasing
+    # conversion to physical units keeps, so the stored samples are analysed
+    # as they are, read from the memory-mapped file one chunk at a time: once
+    # for the lead means, once for the peaks
+    def chunks(passes_done):
+        def read(start, stop):
+            if progress is not None:
+                progress(passes_done * reader.sig_len + start, 2 * reader.sig_len)
+            return reader.read_digital(start, stop)
+
+        return iter_chunks(read, reader.sig_len, int(chunk_duration * reader.fs))
+
+    missing_value = INVALID_SAMPLE_VALUES[reader.fmt]
+    with timed_stage("lead_means"):
+        thresholds = lead_means(chunks(0), len(reader.sig_name), missing_value)
+    return analyze_chunks(
+        chunks(1),
+        reader.fs,
+        reader.sig_name,
+        missing_value=missing_value,
+        thresholds=thresholds,
+        **options,
+    )
+
+
+def analyze_wfdb_record_tracked(progress, tmp_hea_path):
+    """
+    `analyze_wfdb_record` in a worker, writing the samples read and the
+    samples to read into the int64 `progress` array shared with the caller.
+    It stops at the next chunk once the caller sets `progress[2]`.
+    """
+    def track(read, total):
+        if progress[2]:
+            raise AnalysisStoppedError()
+        progress[:2] = read, total
+
+    return analyze_wfdb_record(tmp_hea_path, progress=track)
+
+
+def detect_sickness(sampfrom, sampto, crop_idx, tmp_hea_path):
+    """
+    Events of `[sampfrom, sampto)`, in samples from `sampfrom`. That is the
+    start of window `crop_idx`, which is kept for existing callers only.
+    """
+    analysis = analyze_wfdb_record(tmp_hea_path)
 
+    return analysis.events_in_window(sampfrom, sampto, sampfrom)
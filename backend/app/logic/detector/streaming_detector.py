@@ -0,0 +1,218 @@
+import numpy as np
+
+# Records are read and analysed this many seconds at a time
+DETECTION_CHUNK_DURATION = 60.0
+# Longest a peak is held back waiting for its neighbours (see below)
+PEAK_MAX_DELAY = 60.0
+
+
+class StreamingPeakDetector:
+    """
+    Finds R-peaks of every lead of a signal that is fed in consecutive
+    chunks, holding only a bounded tail of it. As in `detect_r_peaks`, a
+    peak must reach the threshold of its lead and be the highest within
+    0.6 s. The thresholds are fixed when given (the record means from
+    `lead_means` give the peaks of the whole-array run, but for which of two
+    equally high peaks is kept), otherwise each sample is held to the
+    running mean of its lead so far.
+
+    A candidate peak is only removed by a higher kept one within 0.6 s, so
+    its fate can depend on later samples through a run of ever higher
+    candidates, each within 0.6 s of the previous one. Candidates become
+    final once no such run reaches the unread part of the signal; a run
+    still open after `max_delay` seconds is settled with the samples at
+    hand. Every call returns the new final peaks, as record sample indices.
+    """
+
+    def __init__(
+        self, fs, leads=1, missing_value=None, thresholds=None, max_delay=PEAK_MAX_DELAY
+    ):
+        self.fs = fs
+        self.leads = leads
+        self.missing_value = missing_value
+        self.distance = int(0.6 * fs)
+        self.max_lookahead = max(2 * self.distance, int(max_delay * fs))
+
+        self._buffer = np.empty((leads, 0))
+        self._start = 0
+        # Candidates of every lead before its cut are final, and the last
+        # kept peak (with its height) may still remove later candidates
+        self._cuts = np.zeros(leads, dtype=np.intp)
+        self._last_peaks = np.full(leads, -self.distance)
+        self._last_heights = np.zeros(leads)
+
+        self._thresholds = None
+        if thresholds is not None:
+            self._thresholds = np.asarray(thresholds, dtype=np.float64)[:, np.newaxis]
+        # Sums and counts of the valid samples before the buffer, for the
+        # running means
+        self._sums = np.zeros(leads)
+        self._counts = np.zeros(leads)
+
+    @property
+    def samples_seen(self):
+        return self._start + self._buffer.shape[1]
+
+    @property
+    def samples_final(self):
+        """Every peak before this sample index has been returned."""
+        return int(self._cuts.min())
+
+    def feed(self, samples) -> list[np.ndarray]:
+        """Adds `(samples, leads)` to the signal and returns the new final peaks."""
+        samples = np.asarray(samples, dtype=np.float64)
+        if samples.ndim == 1:
+            samples = samples[:, np.newaxis]
+
+        self._buffer = np.concatenate([self._buffer, samples.T], axis=1)
+        return self._emit()
+
+    def flush(self) -> list[np.ndarray]:
+        """Returns the remaining peaks, once the whole signal has been fed."""
+        return self._emit(final=True)
+
+    def _missing(self, values):
+        missing = np.isnan(values)
+        if self.missing_value is not None:
+            missing |= values == self.missing_value
+        return missing
+
+    def _lanes(self):
+        """Buffered samples shifted by their thresholds, NaN where missing."""
+        if self._thresholds is not None:
+            return self._buffer - self._thresholds
+
+        missing = self._missing(self._buffer)
+        sums = self._sums[:, np.newaxis] + np.cumsum(
+            np.where(missing, 0.0, self._buffer), axis=1
+        )
+        counts = self._counts[:, np.newaxis] + np.cumsum(~missing, axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            lanes = self._buffer - sums / counts
+        lanes[missing] = np.nan
+        return lanes
+
+    def _drop(self, count):
+        dropped = self._buffer[:, :count]
+        if self._thresholds is None:
+            missing = self._missing(dropped)
+            self._sums += np.where(missing, 0.0, dropped).sum(axis=1)
+            self._counts += (~missing).sum(axis=1)
+        self._buffer = self._buffer[:, count:]
+        self._start += count
+
+    def _open_from(self, positions, heights, length):
+        """
+        Index of the first candidate whose fate later samples can still
+        change: those within the distance of the unread samples, and every
+        lower one within the distance before such a candidate.
+        """
+        open_ = positions + self.distance >= length - 1
+        first = int(open_.argmax()) if open_.any() else len(positions)
+        index = first - 1
+        while index >= 0 and first < len(positions) and (
+            positions[first] - positions[index] < self.distance
+        ):
+            near = slice(index + 1, np.searchsorted(positions, positions[index] + self.distance))
+            if (open_[near] & (heights[near] >= heights[index])).any():
+                open_[index] = True
+                first = index
+            index -= 1
+        return first
+
+    def _emit(self, final=False):
+        from scipy.signal import find_peaks
+
+        # Clamped below the thresholds, as in `detect_r_peaks_multi`
+        lanes = self._lanes()
+        np.maximum(lanes, -np.finfo(float).tiny, out=lanes)
+        length = lanes.shape[1]
+
+        peaks = []
+        for lead, lane in enumerate(lanes):
+            cut = self._cuts[lead] - self._start
+            positions, properties = find_peaks(lane, height=0.0)
+            heights = properties["peak_heights"][positions >= cut]
+            positions = positions[positions >= cut]
+
+            if final:
+                until = length
+            else:
+                first = self._open_from(positions, heights, length)
+                until = positions[first] if first < len(positions) else length - 1 - self.distance
+                if length - until > self.max_lookahead:
+                    until = length - 1 - self.distance
+            if until <= cut:
+                peaks.append(np.empty(0, dtype=np.intp))
+                continue
+
+            peaks.append(self._select(
+                lead, positions + self._start, heights, self._start + until
+            ))
+            self._cuts[lead] = self._start + until
+
+        self._drop(max(0, self.samples_final - self.distance - self._start))
+        return peaks
+
+    def _select(self, lead, positions, heights, until):
+        """
+        Candidates before `until` that the distance condition keeps, as
+        `find_peaks` keeps them, given the last kept peak of the lead.
+        """
+        from scipy.signal import find_peaks
+
+        if not len(positions):
+            return positions.astype(np.intp)
+
+        # Every candidate as a lone spike, so that find_peaks compares the
+        # same positions and heights
+        last = self._last_peaks[lead]
+        spikes = np.full(positions[-1] - last + 2, -1.0)
+        spikes[0] = self._last_heights[lead]
+        spikes[positions - last] = heights
+        kept, _ = find_peaks(np.concatenate([[-1.0], spikes]), distance=self.distance)
+        kept = kept - 1 + last
+        kept = kept[(kept > last) & (kept < until)]
+
+        if len(kept):
+            self._last_peaks[lead] = kept[-1]
+            self._last_heights[lead] = spikes[kept[-1] - last]
+        return kept.astype(np.intp)
+
+
+def lead_means(chunks, leads, missing_value=None) -> np.ndarray:
+    """
+    Mean of every lead over `(samples, leads)` chunks, read in one pass: the
+    thresholds of `detect_r_peaks_multi`, NaN for leads with missing samples.
+    """
+    sums = np.zeros(leads)
+    missing = np.zeros(leads, dtype=bool)
+    count = 0
+    for chunk in chunks:
+        chunk = np.asarray(chunk).reshape(len(chunk), leads)
+        sums += chunk.sum(axis=0, dtype=np.float64)
+        if missing_value is not None:
+            missing |= (chunk == missing_value).any(axis=0)
+        count += len(chunk)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = sums / count
+    means[missing] = np.nan
+    return means
+
+
+def iter_chunks(read, length, chunk_size):
+    """Yields `read(start, stop)` for consecutive `chunk_size` ranges of `length`."""
+    for start in range(0, length, chunk_size):
+        yield read(start, min(start + chunk_size, length))
+
+
+def detect_r_peaks_chunked(chunks, fs, leads=1, missing_value=None, thresholds=None):
+    """
+    Runs a `StreamingPeakDetector` over `chunks`, yielding the new final
+    peaks of every lead after each chunk.
+    """
+    detector = StreamingPeakDetector(fs, leads, missing_value, thresholds)
+    for chunk in chunks:
+        yield detector.feed(chunk)
+    yield detector.flush()
@@ -17,13 +17,22 @@ Options:
 """
 
 import argparse
+import logging
 import os
 import sys
 import tempfile
 
 from pathlib import Path
 
+from ..calibration.calibration_profiles import (
+    CALIBRATION_PROFILES_ENABLED,
+    CalibrationProfile,
+    calibration_profiles,
+)
+from ..ecg_record.ecg_record import ECGRecord
+from ..metrics.metrics import timed_stage
 from .modules.ecg_processor import ECGProcessor
+from .modules.image_processing import decode_image
 
 
 def parse_arguments():
@@ -48,6 +57,9 @@ def parse_arguments():
 
 def main():
     args = parse_arguments()
+    logging.basicConfig(
+        level=logging.DEBUG if args.debug else logging.INFO, format="%(message)s"
+    )
     os.makedirs(args.output_dir, exist_ok=True)
 
     try:
@@ -64,7 +76,7 @@ def main():
 
         print(f"Processing completed successfully. Output saved to {args.output_dir}")
         print(f"Signal duration: {time_values[-1] - time_values[0]:.2f} seconds")
-        print(f"Amplitude range: {min(amplitude_values):.2f} to {max(amplitude_values):.2f} mV")
+        print(f"Amplitude range: {amplitude_values.min():.2f} to {amplitude_values.max():.2f} mV")
         print(f"Sample rate: {sample_rate} Hz")
         print(f"Total samples: {len(time_values)}")
         print(f"Calibration: {args.time_per_grid}s and {args.mv_per_grid}mV per small grid")
@@ -89,5 +101,27 @@ def process_ecg_image(image_bytes: bytes, image_filename: str) -> list[dict]:
         return wfdb_dict
 
 
+def digitize_image_buffer(
+    image_buffer, profile: CalibrationProfile | None = None, use_profile_store=True
+) -> ECGRecord:
+    """
+    Digitizes an encoded image with the selected calibration `profile`, or
+    else with a stored profile matching the image, or with grid detection.
+    Without `use_profile_store`, stored profiles are neither matched nor saved.
+    """
+    with timed_stage("image_decode"):
+        image = decode_image(image_buffer)
+
+    processor = ECGProcessor(
+        profile_store=(
+            calibration_profiles
+            if CALIBRATION_PROFILES_ENABLED and use_profile_store
+            else None
+        ),
+        profile=profile,
+    )
+    return processor.process_to_record(image)
+
+
 if __name__ == "__main__":
     main()
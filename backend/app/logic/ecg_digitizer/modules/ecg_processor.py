@@ -1,26 +1,58 @@
+import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-import matplotlib.pyplot as plt
+import numpy as np
 
+from ...calibration.calibration_profiles import (
+    CalibrationProfile,
+    profile_key,
+    verify_profile,
+)
 from .image_processing import preprocess_image
+from .lead_layout import detect_lead_bands
 from .signal_processing import (
     calibrate_signal,
     detect_grid_size,
     extract_signal,
     resample_signal,
 )
-from .wfdb_utils import save_to_wfdb
+from ...ecg_record.ecg_record import ECGRecord
+from ...metrics.metrics import IMAGE_PIXELS, observe, timed_stage
+from .wfdb_utils import create_ecg_record, save_to_wfdb
+
+# Threads tracing the lead strips of one image; OpenCV and numpy release the
+# GIL for most of the work
+DIGITIZER_THREADS = int(os.environ.get("EKG_DIGITIZER_THREADS", os.cpu_count() or 1))
+# "linear" or "polyphase", see `resample_signal`
+DIGITIZER_RESAMPLE_METHOD = os.environ.get("EKG_RESAMPLE_METHOD", "linear")
+
+logger = logging.getLogger(__name__)
 
 
 class ECGProcessor:
     def __init__(
-        self, debug=False, time_per_grid=0.04, mv_per_grid=0.1, force_sample_rate=None
+        self,
+        debug=False,
+        time_per_grid=0.04,
+        mv_per_grid=0.1,
+        force_sample_rate=None,
+        threads=DIGITIZER_THREADS,
+        profile_store=None,
+        profile=None,
+        resample_method=DIGITIZER_RESAMPLE_METHOD,
     ):
         self.debug = debug
         self.time_per_grid = time_per_grid
         self.mv_per_grid = mv_per_grid
         self.force_sample_rate = force_sample_rate
+        self.threads = threads
+        # Profiles are looked up in and saved to `profile_store`, unless an
+        # explicitly selected `profile` is given
+        self.profile_store = profile_store
+        self.profile = profile
+        self.resample_method = resample_method
 
     def process(self, image_path, output_dir):
         debug_dir = self._setup_directories(output_dir)
@@ -41,23 +73,73 @@ class ECGProcessor:
 
         return time_values, amplitude_values, sample_rate
 
-    def process_to_wfdb(self, image_path, tmpdir) -> list[dict]:
-        binary_image, original_image = preprocess_image(image_path)
+    def process_to_record(self, image) -> ECGRecord:
+        with timed_stage("preprocessing"):
+            binary_image, original_image = preprocess_image(image)
+        observe(IMAGE_PIXELS, original_image.shape[0] * original_image.shape[1])
+
+        with timed_stage("grid_detection"):
+            small_grid_size = self._detect_grid(original_image)
+
+        with timed_stage("lead_layout"):
+            bands = detect_lead_bands(binary_image, small_grid_size)
+        logger.debug("Detected %d lead strips", len(bands))
+
+        threads = max(1, min(self.threads, len(bands)))
+        with ThreadPoolExecutor(threads) as executor:
+            with timed_stage("tracing"):
+                traces = list(executor.map(
+                    lambda band: extract_signal(
+                        binary_image[band.top:band.bottom],
+                        baseline_y=band.baseline - band.top,
+                    ),
+                    bands,
+                ))
+
+            with timed_stage("calibration"):
+                calibrated = list(executor.map(
+                    lambda trace: self._calibrate(*trace, small_grid_size), traces
+                ))
+
+        sample_rate = calibrated[0][0]
+        return create_ecg_record(
+            self._align_leads(calibrated, sample_rate), sample_rate
+        )
 
-        small_grid_size = self._detect_grid(original_image)
+    @staticmethod
+    def _align_leads(calibrated, sample_rate):
+        """
+        Places the calibrated strips side by side by their start time, so
+        strips printed under each other share sample indices. Samples outside
+        a strip are NaN; a single strip is returned as is.
+        """
+        if len(calibrated) == 1:
+            return calibrated[0][2]
+
+        starts = [
+            int(round(time_values[0] * sample_rate)) if len(time_values) else 0
+            for _, time_values, _ in calibrated
+        ]
+        first = min(starts)
+        length = max(
+            start - first + len(amplitude_values)
+            for start, (_, _, amplitude_values) in zip(starts, calibrated)
+        )
 
-        x_values, y_values = extract_signal(binary_image)
+        signals = np.full((length, len(calibrated)), np.nan)
+        for lead, (start, (_, _, amplitude_values)) in enumerate(zip(starts, calibrated)):
+            signals[start - first:start - first + len(amplitude_values), lead] = amplitude_values
+        return signals
 
-        sample_rate, _, amplitude_values = self._calibrate(
-            x_values, y_values, small_grid_size
-        )
+    def process_to_wfdb(self, image_path, tmpdir) -> list[dict]:
+        record = self.process_to_record(image_path)
 
         base_filename = os.path.splitext(os.path.basename(image_path))[0]
 
-        wfdb_path = save_to_wfdb(amplitude_values, sample_rate, tmpdir, base_filename)
+        wfdb_path = save_to_wfdb(record.p_signal, record.fs, tmpdir, base_filename)
 
         # wfdb_dict = convert_wfdb_to_dict(tmp_dat_path=wfdb_path)
-        print(f"Saved WFDB record: {wfdb_path}")
+        logger.debug("Saved WFDB record: %s", wfdb_path)
         wfdb_path = Path(wfdb_path)
         return wfdb_path
 
@@ -72,21 +154,54 @@ class ECGProcessor:
         return debug_dir
 
     def _detect_grid(self, image, debug_dir=None):
+        key = None
+        if self.profile is None and self.profile_store is not None:
+            with timed_stage("calibration_profile"):
+                key = profile_key(image)
+                self.profile = self._find_profile(image, key)
+
+        if self.profile is not None:
+            logger.debug("Using calibration profile %s", self.profile.profile_id)
+            return self.profile.small_grid_size
+
         small_grid_size, large_grid_size = detect_grid_size(image, debug_dir)
+        if key is not None:
+            self._save_profile(key, image, small_grid_size)
 
-        if self.debug:
-            print(
-                f"Detected grid sizes - Small: {small_grid_size:.2f} pixels, "
-                f"Large: {large_grid_size:.2f} pixels"
-            )
+        logger.debug(
+            "Detected grid sizes - Small: %.2f pixels, Large: %.2f pixels",
+            small_grid_size,
+            large_grid_size,
+        )
 
         return small_grid_size
 
-    def _calibrate(self, x_values, y_values, grid_size):
+    def _find_profile(self, image, key) -> CalibrationProfile | None:
+        profile = self.profile_store.get(key)
+        if profile is None or not verify_profile(image, profile):
+            return None
+        return profile
+
+    def _save_profile(self, key, image, small_grid_size):
+        self.profile = self.profile_store.put(
+            CalibrationProfile(
+                profile_id=key,
+                width=image.shape[1],
+                height=image.shape[0],
+                small_grid_size=float(small_grid_size),
+                sample_rate=self._sample_rate(small_grid_size),
+            )
+        )
+
+    def _sample_rate(self, grid_size):
         if self.force_sample_rate:
-            sample_rate = self.force_sample_rate
-        else:
-            sample_rate = self._calculate_sample_rate(grid_size)
+            return self.force_sample_rate
+        if self.profile is not None:
+            return self.profile.sample_rate
+        return self._calculate_sample_rate(grid_size)
+
+    def _calibrate(self, x_values, y_values, grid_size):
+        sample_rate = self._sample_rate(grid_size)
 
         time_values, amplitude_values = calibrate_signal(
             x_values, y_values, grid_size, self.time_per_grid, self.mv_per_grid
@@ -96,7 +211,7 @@ class ECGProcessor:
             current_rate = len(time_values) / (time_values[-1] - time_values[0])
             if abs(current_rate - sample_rate) / sample_rate > 0.05:
                 time_values, amplitude_values = resample_signal(
-                    time_values, amplitude_values, sample_rate
+                    time_values, amplitude_values, sample_rate, self.resample_method
                 )
 
         return sample_rate, time_values, amplitude_values
@@ -107,8 +222,7 @@ class ECGProcessor:
         # Ensure reasonable limits (125Hz to 1000Hz)
         sample_rate = max(125, min(1000, sample_rate))
 
-        if self.debug:
-            print(f"Using sample rate: {sample_rate} Hz")
+        logger.debug("Using sample rate: %s Hz", sample_rate)
 
         return sample_rate
 
@@ -123,10 +237,11 @@ class ECGProcessor:
             amplitude_values, sample_rate, output_dir, base_filename
         )
 
-        if self.debug:
-            print(f"Saved WFDB record: {wfdb_path}")
+        logger.debug("Saved WFDB record: %s", wfdb_path)
 
     def _create_plot(self, time_values, amplitude_values, output_dir):
+        import matplotlib.pyplot as plt
+
         plt.figure(figsize=(12, 6))
         plt.plot(time_values, amplitude_values, "b-", linewidth=1)
         plt.title("Calibrated ECG Signal")
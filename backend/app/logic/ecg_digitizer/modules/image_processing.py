@@ -3,9 +3,12 @@ import numpy as np
 import os
 
 
-def preprocess_image(image_path, debug_dir=None):
+def preprocess_image(image, debug_dir=None):
     # Load and convert to grayscale
-    original_image = load_image(image_path)
+    if isinstance(image, np.ndarray):
+        original_image = to_grayscale(image)
+    else:
+        original_image = load_image(image)
     save_debug_image(original_image, debug_dir, "01_original.png")
 
     # Remove grid
@@ -26,6 +29,14 @@ def load_image(image_path):
     return to_grayscale(image)
 
 
+def decode_image(image_bytes):
+    buffer = np.frombuffer(image_bytes, dtype=np.uint8)
+    image = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("Unable to decode image data")
+    return to_grayscale(image)
+
+
 def to_grayscale(image):
     if len(image.shape) == 3:
         return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
@@ -48,10 +59,11 @@ def clean_and_normalize_signal(image, min_size=5):
         image, connectivity=8
     )
 
-    cleaned = np.zeros_like(image)
-    for i in range(1, num_labels):
-        if stats[i, cv2.CC_STAT_AREA] >= min_size:
-            cleaned[labels == i] = 255
+    # Map every label to 0/255 through a lookup table in one pass over the image
+    keep = stats[:, cv2.CC_STAT_AREA] >= min_size
+    keep[0] = False
+    lookup = np.where(keep, 255, 0).astype(image.dtype)
+    cleaned = lookup[labels]
 
     if np.mean(cleaned) > 127:
         return cv2.bitwise_not(cleaned)
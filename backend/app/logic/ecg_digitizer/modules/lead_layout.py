@@ -0,0 +1,54 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+# Baselines of neighbouring lead strips are at least this many small grid
+# squares (mm) apart
+LEAD_BAND_MIN_SPACING = 15
+# A row is a strip baseline when its smoothed foreground count reaches this
+# share of the highest one, and this share of the image width
+LEAD_BAND_MIN_RELATIVE_COVERAGE = 0.3
+LEAD_BAND_MIN_COVERAGE = 0.05
+
+
+@dataclass
+class LeadBand:
+    """Rows `[top, bottom)` of one lead strip, with its baseline row."""
+    top: int
+    bottom: int
+    baseline: int
+
+
+def detect_lead_bands(binary_image, small_grid_size) -> list[LeadBand]:
+    """
+    Splits a cleaned, grid-free image into horizontal lead strips. The flat
+    parts of a trace pile up on its baseline row, so every strip shows up as
+    a peak of the per-row foreground count; strips are split halfway between
+    neighbouring baselines. An image without several clear peaks is a single
+    strip centred on its middle row, as a single-lead image is traced.
+    """
+    from scipy.signal import find_peaks
+
+    height, width = binary_image.shape
+    single = [LeadBand(0, height, height // 2)]
+
+    coverage = np.count_nonzero(binary_image, axis=1).astype(np.float64)
+    smoothing = max(1, int(round(small_grid_size)))
+    smoothed = np.convolve(coverage, np.ones(smoothing) / smoothing, mode="same")
+    if not smoothed.any():
+        return single
+
+    min_height = max(
+        LEAD_BAND_MIN_RELATIVE_COVERAGE * smoothed.max(),
+        LEAD_BAND_MIN_COVERAGE * width,
+    )
+    spacing = max(1, int(LEAD_BAND_MIN_SPACING * small_grid_size))
+    baselines, _ = find_peaks(smoothed, height=min_height, distance=spacing)
+    if len(baselines) < 2:
+        return single
+
+    edges = np.concatenate(([0], (baselines[:-1] + baselines[1:]) // 2, [height]))
+    return [
+        LeadBand(int(top), int(bottom), int(baseline))
+        for top, bottom, baseline in zip(edges[:-1], edges[1:], baselines)
+    ]
@@ -1,46 +1,63 @@
 import numpy as np
-import matplotlib.pyplot as plt
-from scipy import signal, interpolate
 import cv2
 
+# scipy and matplotlib are imported where they are used: matplotlib is only
+# needed for debug output and scipy only in the worker processes, so neither
+# slows down importing the app.
 
-def extract_signal(binary_image, debug_dir=None):
-    height, width = binary_image.shape
-    x_values = []
-    y_values = []
 
-    baseline_y = height // 2
+def trace_columns(binary_image):
+    """
+    Foreground statistics of every image column at once: the pixel count and
+    the top, bottom and mean foreground row. Columns without foreground have
+    a count of 0 and a NaN mean.
+    """
+    height = binary_image.shape[0]
+
+    # One row per image column keeps every reduction below contiguous
+    columns = (cv2.transpose(binary_image) > 0).view(np.uint8)
 
-    for x in range(width):
-        white_pixels = np.where(binary_image[:, x] > 0)[0]
+    counts = np.count_nonzero(columns, axis=1)
+    top = np.argmax(columns, axis=1)
+    bottom = height - 1 - np.argmax(cv2.flip(columns, 1), axis=1)
+    row_sums = np.einsum('ij,j->i', columns, np.arange(height, dtype=np.int64))
 
-        if len(white_pixels) > 0:
-            avg_y = np.mean(white_pixels)
-            is_upward = avg_y < baseline_y
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = row_sums / counts
 
-            if is_upward:
-                y = np.min(white_pixels)
-            else:
-                y = np.max(white_pixels)
+    return counts, top, bottom, mean
 
-            x_values.append(x)
-            y_values.append(baseline_y - y)
+
+def extract_signal(binary_image, debug_dir=None, baseline_y=None):
+    height, width = binary_image.shape
+
+    if baseline_y is None:
+        baseline_y = height // 2
+
+    counts, top, bottom, mean = trace_columns(binary_image)
+    x_values = np.flatnonzero(counts)
+
+    is_upward = mean[x_values] < baseline_y
+    y = np.where(is_upward, top[x_values], bottom[x_values])
+    y_values = baseline_y - y
 
     if debug_dir is not None:
-        _visualize_extracted_signal(x_values, y_values, binary_image, debug_dir)
+        _visualize_extracted_signal(
+            x_values, y_values, binary_image, baseline_y, debug_dir
+        )
 
     return x_values, y_values
 
 
-def _visualize_extracted_signal(x_values, y_values, binary_image, debug_dir):
+def _visualize_extracted_signal(x_values, y_values, binary_image, baseline_y, debug_dir):
+    import matplotlib.pyplot as plt
+
     plt.figure(figsize=(12, 6))
 
     plt.subplot(211)
     plt.imshow(binary_image, cmap='gray')
     plt.title('Binary ECG Image')
 
-    height = binary_image.shape[0]
-    baseline_y = height // 2
     for x, y in zip(x_values, y_values):
         image_y = baseline_y - y
         plt.plot(x, image_y, 'r.', markersize=2)
@@ -56,13 +73,19 @@ def _visualize_extracted_signal(x_values, y_values, binary_image, debug_dir):
     plt.close()
 
 
-def detect_grid_size(image, debug_dir=None):
-    height, width = image.shape
-
+def grid_margins(image):
+    """Top and bottom margins of the image, where the grid is least covered by the trace."""
+    height = image.shape[0]
     margin_height = max(int(height * 0.15), 20)
     top_margin = image[:margin_height, :]
     bottom_margin = image[height - margin_height:, :]
-    combined_margins = np.vstack((top_margin, bottom_margin))
+    return np.vstack((top_margin, bottom_margin))
+
+
+def detect_grid_size(image, debug_dir=None):
+    height, width = image.shape
+
+    combined_margins = grid_margins(image)
 
     enhanced_margins = cv2.adaptiveThreshold(
         combined_margins, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
@@ -103,6 +126,8 @@ def detect_grid_size(image, debug_dir=None):
 
 
 def _detect_grid_spacing_fft(projection):
+    from scipy import signal
+
     if np.std(projection) < 1e-6:
         return -1
 
@@ -127,6 +152,8 @@ def _detect_grid_spacing_fft(projection):
 
 
 def _detect_grid_spacing_peaks(projection):
+    from scipy import signal
+
     try:
         normalized = projection / np.max(projection)
 
@@ -164,6 +191,8 @@ def _detect_grid_spacing_peaks(projection):
 
 
 def _visualize_grid_detection(image, small_grid_size, large_grid_size, debug_dir):
+    import matplotlib.pyplot as plt
+
     height, width = image.shape
     grid_overlay = cv2.cvtColor(image.copy(), cv2.COLOR_GRAY2BGR)
 
@@ -189,8 +218,8 @@ def _visualize_grid_detection(image, small_grid_size, large_grid_size, debug_dir
 
 
 def calibrate_signal(x_values, y_values, small_grid_size, time_per_grid=0.04, mv_per_grid=0.1):
-    time_values = [x * (time_per_grid / small_grid_size) for x in x_values]
-    amplitude_values = [y * (mv_per_grid / small_grid_size) for y in y_values]
+    time_values = np.asarray(x_values, dtype=np.float64) * (time_per_grid / small_grid_size)
+    amplitude_values = np.asarray(y_values, dtype=np.float64) * (mv_per_grid / small_grid_size)
 
     amplitude_values = _correct_baseline(amplitude_values)
 
@@ -198,40 +227,71 @@ def calibrate_signal(x_values, y_values, small_grid_size, time_per_grid=0.04, mv
 
 
 def _correct_baseline(amplitude_values):
-    if not amplitude_values:
+    if len(amplitude_values) == 0:
         return amplitude_values
 
     hist, bin_edges = np.histogram(amplitude_values, bins=50)
     most_common_bin = np.argmax(hist)
     baseline_estimate1 = (bin_edges[most_common_bin] + bin_edges[most_common_bin + 1]) / 2
 
-    amplitude_array = np.array(amplitude_values)
-    derivatives = np.abs(np.diff(amplitude_array))
+    derivatives = np.abs(np.diff(amplitude_values))
     flat_threshold = np.percentile(derivatives, 30)
     flat_segments = derivatives < flat_threshold
 
     if np.sum(flat_segments) > len(amplitude_values) * 0.1:
-        baseline_estimate2 = np.mean(amplitude_array[:-1][flat_segments])
+        baseline_estimate2 = np.mean(amplitude_values[:-1][flat_segments])
     else:
         baseline_estimate2 = np.median(amplitude_values)
 
     baseline = 0.4 * baseline_estimate1 + 0.6 * baseline_estimate2
 
-    return [a - baseline for a in amplitude_values]
+    return amplitude_values - baseline
 
 
-def resample_signal(time_values, amplitude_values, target_sample_rate):
+def resample_signal(time_values, amplitude_values, target_sample_rate, method="linear"):
+    """
+    Resamples a trace onto a uniform grid at `target_sample_rate`, by linear
+    interpolation, or with `method="polyphase"` by interpolating it onto its
+    own column spacing and converting the rate with a polyphase filter.
+    """
+    time_values = np.asarray(time_values, dtype=np.float64)
+    amplitude_values = np.asarray(amplitude_values, dtype=np.float64)
+
+    if method == "polyphase":
+        return _resample_polyphase(time_values, amplitude_values, target_sample_rate)
+    if method != "linear":
+        raise ValueError(f"Unknown resampling method: {method}")
+
     duration = time_values[-1] - time_values[0]
 
     num_samples = int(duration * target_sample_rate)
 
-    f = interpolate.interp1d(
-        time_values, amplitude_values,
-        kind='linear', bounds_error=False, fill_value='extrapolate'
-    )
-
     new_time_values = np.linspace(time_values[0], time_values[-1], num_samples)
 
-    new_amplitude_values = f(new_time_values)
+    new_amplitude_values = np.interp(new_time_values, time_values, amplitude_values)
+
+    return new_time_values, new_amplitude_values
+
+
+def _resample_polyphase(time_values, amplitude_values, target_sample_rate):
+    from fractions import Fraction
+
+    from scipy import signal
+
+    # Traced columns are evenly spaced apart from the empty ones, which are
+    # filled in before the rate conversion
+    if len(time_values) < 2:
+        return time_values, amplitude_values
+    step = np.median(np.diff(time_values))
+    uniform_times = time_values[0] + step * np.arange(
+        int(round((time_values[-1] - time_values[0]) / step)) + 1
+    )
+    uniform_values = np.interp(uniform_times, time_values, amplitude_values)
+
+    ratio = Fraction(target_sample_rate * step).limit_denominator(1000)
+    new_amplitude_values = signal.resample_poly(
+        uniform_values, ratio.numerator, ratio.denominator, padtype="line"
+    )
+    new_time_values = time_values[0] + np.arange(len(new_amplitude_values)) / target_sample_rate
 
-    return new_time_values, new_amplitude_values
\ No newline at end of file
+    return new_time_values, new_amplitude_values
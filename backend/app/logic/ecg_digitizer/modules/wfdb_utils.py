@@ -1,36 +1,39 @@
 import os
 import numpy as np
-import wfdb
 
+from ...ecg_record.ecg_record import ECGRecord
 
-def save_to_wfdb(amplitude_values, sample_rate, output_dir, base_filename):
-    signal = np.array(amplitude_values).reshape(-1, 1)
+
+def create_ecg_record(amplitude_values, sample_rate, channel_names=None) -> ECGRecord:
+    """`amplitude_values` holds one lead, or one lead per column."""
+    signal = np.asarray(amplitude_values, dtype=float)
+    if signal.ndim == 1:
+        signal = signal.reshape(-1, 1)
+    n_sig = signal.shape[1]
 
     # Define the channel information
-    channel_names = ['ECG I']
-    units = ['mV']
+    if channel_names is None:
+        channel_names = ['ECG I'] if n_sig == 1 else [f'Strip {i + 1}' for i in range(n_sig)]
+    units = ['mV'] * n_sig
 
     # ADC information
     adc_gain = 1000.0
-    baseline = 0 
+    baseline = 0
+
+    return ECGRecord(
+        signal, sample_rate, channel_names, units, [adc_gain] * n_sig, [baseline] * n_sig
+    )
+
 
-    # Checking output dir
-    os.makedirs(output_dir, exist_ok=True)
-    record_name = base_filename
+def save_to_wfdb(amplitude_values, sample_rate, output_dir, base_filename):
+    record = create_ecg_record(amplitude_values, sample_rate)
 
     # Save record
-    wfdb.wrsamp(
-        record_name=record_name,
-        fs=sample_rate,
-        units=units,
-        sig_name=channel_names,
-        p_signal=signal,
-        fmt=['16'],
-        adc_gain=[adc_gain],
-        baseline=[baseline],
+    wfdb_path = record.to_wfdb(
+        output_dir,
+        base_filename,
         comments=[f'Digitized from ECG image: {base_filename}'],
-        write_dir=output_dir
     )
 
     # Return path
-    return os.path.join(output_dir, record_name)
+    return os.path.join(output_dir, wfdb_path.name)
@@ -0,0 +1,50 @@
+import cv2
+import numpy as np
+
+# One small (1 mm) square is 0.04 s by 0.1 mV, the digitizer defaults
+PAPER_SPEED_MM_PER_S = 25.0
+GAIN_MM_PER_MV = 10.0
+
+# Light enough for the digitizer to threshold the grid away, as on printed paper
+GRID_MINOR_COLOR = (225, 220, 255)
+GRID_MAJOR_COLOR = (190, 180, 250)
+TRACE_COLOR = (20, 20, 20)
+
+
+def render_ecg_image(signal, fs, px_per_mm=8, height_mm=40, trace_width=None):
+    """Returns a BGR image of `signal` (mV) drawn on ECG paper."""
+    signal = np.asarray(signal, dtype=float)
+    duration = len(signal) / fs
+
+    width = int(round(duration * PAPER_SPEED_MM_PER_S * px_per_mm))
+    height = int(round(height_mm * px_per_mm))
+    image = np.full((height, width, 3), 255, dtype=np.uint8)
+
+    minor_thickness = 1
+    major_thickness = max(1, int(round(px_per_mm / 4)))
+    for mm in range(int(width / px_per_mm) + 1):
+        x = int(round(mm * px_per_mm))
+        major = mm % 5 == 0
+        cv2.line(
+            image, (x, 0), (x, height),
+            GRID_MAJOR_COLOR if major else GRID_MINOR_COLOR,
+            major_thickness if major else minor_thickness,
+        )
+    for mm in range(int(height_mm) + 1):
+        y = int(round(mm * px_per_mm))
+        major = mm % 5 == 0
+        cv2.line(
+            image, (0, y), (width, y),
+            GRID_MAJOR_COLOR if major else GRID_MINOR_COLOR,
+            major_thickness if major else minor_thickness,
+        )
+
+    xs = np.arange(len(signal)) / fs * PAPER_SPEED_MM_PER_S * px_per_mm
+    ys = height / 2 - signal * GAIN_MM_PER_MV * px_per_mm
+    points = np.stack([xs, np.clip(ys, 0, height - 1)], axis=1)
+    points = np.round(points).astype(np.int32).reshape(-1, 1, 2)
+
+    trace_width = trace_width or max(1, int(round(px_per_mm / 4)))
+    cv2.polylines(image, [points], False, TRACE_COLOR, trace_width, cv2.LINE_AA)
+
+    return image
@@ -0,0 +1,105 @@
+import os
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+
+import numpy as np
+import wfdb
+
+from .wfdb_reader import WfdbSignalReader
+
+
+@dataclass
+class ECGRecord:
+    """
+    In-memory ECG record: a `(samples, channels)` array of physical values
+    plus the metadata needed to window, convert and analyse it.
+    """
+
+    p_signal: np.ndarray
+    fs: float
+    sig_name: list[str]
+    units: list[str] = field(default_factory=list)
+    # ADC parameters used when exporting or quantizing: adc = p * gain + baseline
+    adc_gain: list[float] = field(default_factory=list)
+    baseline: list[int] = field(default_factory=list)
+
+    def __post_init__(self):
+        if self.p_signal.ndim == 1:
+            self.p_signal = self.p_signal.reshape(-1, 1)
+        if not self.units:
+            self.units = ["mV"] * self.n_sig
+        if not self.adc_gain:
+            self.adc_gain = [1000.0] * self.n_sig
+        if not self.baseline:
+            self.baseline = [0] * self.n_sig
+
+    @property
+    def sig_len(self) -> int:
+        return self.p_signal.shape[0]
+
+    @property
+    def n_sig(self) -> int:
+        return self.p_signal.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        return self.p_signal.nbytes
+
+    @classmethod
+    def from_wfdb(cls, base_path, sampfrom=0, sampto=None, channels=None) -> "ECGRecord":
+        """
+        Reads `[sampfrom, sampto)` of a WFDB record, memory-mapped when its
+        format allows and through wfdb otherwise.
+        """
+        reader = WfdbSignalReader.open(base_path)
+        if reader is not None:
+            return cls.from_reader(reader, sampfrom, sampto, channels)
+
+        record = wfdb.rdrecord(
+            str(base_path), sampfrom=sampfrom, sampto=sampto, channels=channels
+        )
+        if record.p_signal is None:
+            raise ValueError("No signal data found in the record.")
+        return cls(
+            record.p_signal,
+            record.fs,
+            record.sig_name,
+            record.units,
+            [float(gain) for gain in record.adc_gain],
+            [int(baseline) for baseline in record.baseline],
+        )
+
+    @classmethod
+    def from_reader(
+        cls, reader: WfdbSignalReader, sampfrom=0, sampto=None, channels=None
+    ) -> "ECGRecord":
+        channels = list(range(reader.n_sig)) if channels is None else list(channels)
+        return cls(
+            reader.read_physical(sampfrom, sampto, channels),
+            reader.fs,
+            [reader.sig_name[channel] for channel in channels],
+            [reader.units[channel] for channel in channels],
+            [reader.adc_gain[channel] for channel in channels],
+            [reader.baseline[channel] for channel in channels],
+        )
+
+    def window(self, sampfrom, sampto) -> "ECGRecord":
+        return replace(self, p_signal=self.p_signal[sampfrom:sampto])
+
+    def to_wfdb(self, output_dir, record_name, comments=None) -> Path:
+        os.makedirs(output_dir, exist_ok=True)
+
+        wfdb.wrsamp(
+            record_name=record_name,
+            fs=self.fs,
+            units=self.units,
+            sig_name=self.sig_name,
+            p_signal=self.p_signal,
+            fmt=["16"] * self.n_sig,
+            adc_gain=self.adc_gain,
+            baseline=self.baseline,
+            comments=comments or [],
+            write_dir=str(output_dir),
+        )
+
+        return Path(output_dir) / record_name
@@ -0,0 +1,104 @@
+from pathlib import Path
+
+import numpy as np
+import wfdb
+
+# Digital value WFDB writes for missing samples, per format
+INVALID_SAMPLE_VALUES = {"16": -32768, "212": -2048, "80": -128}
+
+
+class WfdbSignalReader:
+    """
+    Random access to a single-segment WFDB record whose signals share one
+    `.dat` file in format 16, 212 or 80. The file is memory-mapped once and
+    every read decodes only the bytes of the requested sample range.
+    """
+
+    def __init__(self, header, dat_path: Path):
+        self.fs = header.fs
+        self.sig_name = list(header.sig_name)
+        self.units = list(header.units)
+        self.adc_gain = [float(gain) for gain in header.adc_gain]
+        self.baseline = [int(baseline) for baseline in header.baseline]
+        self.fmt = header.fmt[0]
+        self.n_sig = header.n_sig
+
+        offset = header.byte_offset[0] or 0
+        data = np.memmap(dat_path, dtype=np.uint8, mode="r", offset=offset)
+        if self.fmt == "16":
+            frames = len(data) // (2 * self.n_sig)
+            self._data = data[: frames * 2 * self.n_sig].view("<i2").reshape(-1, self.n_sig)
+        else:
+            self._data = data
+            stream_len = len(data) if self.fmt == "80" else len(data) * 2 // 3
+            frames = stream_len // self.n_sig
+
+        self.sig_len = frames if header.sig_len is None else min(header.sig_len, frames)
+
+    @classmethod
+    def open(cls, base_path) -> "WfdbSignalReader | None":
+        """Returns a reader, or None if the record needs the generic wfdb reader."""
+        base_path = Path(base_path)
+        header = wfdb.rdheader(str(base_path))
+
+        if not isinstance(header, wfdb.Record) or header.n_sig == 0:
+            return None
+        if len(set(header.fmt)) != 1 or header.fmt[0] not in INVALID_SAMPLE_VALUES:
+            return None
+        if len(set(header.file_name)) != 1 or len(set(header.byte_offset)) != 1:
+            return None
+        if any(spf not in (None, 1) for spf in header.samps_per_frame):
+            return None
+        if any(skew not in (None, 0) for skew in header.skew):
+            return None
+
+        dat_path = base_path.parent / header.file_name[0]
+        if not dat_path.is_file() or dat_path.stat().st_size <= (header.byte_offset[0] or 0):
+            return None
+
+        return cls(header, dat_path)
+
+    def _bounds(self, sampfrom, sampto):
+        sampto = self.sig_len if sampto is None else sampto
+        sampfrom = min(max(sampfrom, 0), self.sig_len)
+        return sampfrom, min(max(sampto, sampfrom), self.sig_len)
+
+    def read_digital(self, sampfrom=0, sampto=None) -> np.ndarray:
+        """Digital samples of `[sampfrom, sampto)` as a `(samples, n_sig)` array."""
+        sampfrom, sampto = self._bounds(sampfrom, sampto)
+
+        if self.fmt == "16":
+            return np.array(self._data[sampfrom:sampto])
+        if self.fmt == "80":
+            frames = self._data[sampfrom * self.n_sig:sampto * self.n_sig]
+            return (frames.astype(np.int16) - 128).reshape(-1, self.n_sig)
+        return self._read_212(sampfrom * self.n_sig, sampto * self.n_sig)
+
+    def _read_212(self, first, last) -> np.ndarray:
+        # Every 3 bytes hold two 12-bit samples: the first in byte 0 and the
+        # low nibble of byte 1, the second in byte 2 and its high nibble
+        first_pair, last_pair = first // 2, (last + 1) // 2
+        packed = np.zeros((last_pair - first_pair) * 3, dtype=np.uint8)
+        chunk = self._data[first_pair * 3:last_pair * 3]
+        packed[: len(chunk)] = chunk
+        packed = packed.reshape(-1, 3).astype(np.int16)
+
+        samples = np.empty(2 * len(packed), dtype=np.int16)
+        samples[0::2] = packed[:, 0] | ((packed[:, 1] & 0x0F) << 8)
+        samples[1::2] = packed[:, 2] | ((packed[:, 1] & 0xF0) << 4)
+        samples[samples > 2047] -= 4096
+
+        start = first - 2 * first_pair
+        return samples[start:start + last - first].reshape(-1, self.n_sig)
+
+    def read_physical(self, sampfrom=0, sampto=None, channels=None) -> np.ndarray:
+        """Samples of `[sampfrom, sampto)` in physical units, NaN where missing."""
+        digital = self.read_digital(sampfrom, sampto)
+        channels = list(range(self.n_sig)) if channels is None else list(channels)
+        digital = digital[:, channels]
+
+        baseline = np.asarray(self.baseline, dtype=np.float64)[channels]
+        adc_gain = np.asarray(self.adc_gain, dtype=np.float64)[channels]
+        physical = (digital.astype(np.float64) - baseline) / adc_gain
+        physical[digital == INVALID_SAMPLE_VALUES[self.fmt]] = np.nan
+        return physical
@@ -1,92 +1,583 @@
-import tempfile
+import asyncio
+import json
+import os
+import zipfile
+from collections import Counter
+from collections.abc import Callable
+from contextlib import contextmanager
+from dataclasses import asdict
 from pathlib import Path
 
-from ..logic.detector.detector import detect_sickness
+import numpy as np
 
-# from app.logic.ecg_digitizer.ecg_digitizer import process_ecg_image
-from ..logic.ecg_digitizer.modules.ecg_processor import ECGProcessor
+from ..logic.calibration.calibration_profiles import (
+    CalibrationProfile,
+    calibration_profiles,
+)
+from ..logic.detector.detector import RecordAnalysis, analyze_wfdb_record_tracked
+from ..logic.ecg_record.ecg_record import ECGRecord
+from ..logic.metrics.metrics import (
+    RECORD_LOOKUPS,
+    UPLOAD_BYTES,
+    timed_stage,
+)
+from ..logic.overview.overview_pyramid import build_wfdb_overview_pyramid
+from ..logic.record_store.record_store import (
+    StoredRecord,
+    compute_record_id,
+    record_store,
+)
 from ..logic.wfdb_converter.wfdb_json_converter import (
-    convert_wfdb_to_dict,
-    create_window_list,
+    WDFDB_SAMPLES_PER_WINDOW,
+    convert_signal_to_dict,
+)
+from ..logic.windowing.windowing import WINDOW_MAX_SIZE, WindowGrid
+from ..logic.uploads.uploads import (
+    UPLOAD_MAX_HEADER_BYTES,
+    UploadTooLargeError,
+    check_upload_size,
+    save_uploads,
+    upload_size,
+)
+from ..logic.worker_pool.worker_pool import (
+    SharedArray,
+    WorkerPoolBusyError,
+    WorkerPoolUnavailableError,
+    run_with_shared_array,
+    worker_pool,
+)
+
+BATCH_IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+BATCH_MAX_IMAGES = 200
+BATCH_MAX_IMAGE_BYTES = 50 * 1024 * 1024
+# Decompressed size of all images of an archive together
+BATCH_MAX_ARCHIVE_BYTES = int(
+    os.environ.get("EKG_BATCH_MAX_ARCHIVE_BYTES", 1024 * 1024 * 1024)
 )
+# Scans stop at the first window with one of these events, the ones they
+# reported before the other rhythm detectors existed
+SCAN_EVENT_TYPES = ("bradycardia", "tachycardia")
+# Streamed scans report their progress every this many windows, and every
+# this many seconds while the record is analysed
+SCAN_PROGRESS_EVERY = 50
+SCAN_PROGRESS_INTERVAL = 0.5
+
+_pending_computations: dict[tuple, asyncio.Task] = {}
+# Requests waiting for every pending computation
+_computation_waiters: Counter = Counter()
+# Progress arrays of the running analyses by record id, see
+# `analyze_wfdb_record_tracked`
+_analysis_progress: dict[str, SharedArray] = {}
+
+
+async def _compute_once(key: tuple, compute):
+    """
+    Runs `compute()` once per `key` across concurrent requests. The shared task
+    is shielded, so a request that times out or disconnects does not cancel
+    the work for the others; it is cancelled once no request waits for it.
+    """
+    task = _pending_computations.get(key)
+    if task is None:
+        task = asyncio.ensure_future(compute())
+        _pending_computations[key] = task
+        task.add_done_callback(lambda _: _pending_computations.pop(key, None))
+
+    _computation_waiters[key] += 1
+    try:
+        return await asyncio.shield(task)
+    finally:
+        _computation_waiters[key] -= 1
+        if not _computation_waiters[key]:
+            del _computation_waiters[key]
+            task.cancel()
+
+
+def get_stored_record(record_id: str) -> StoredRecord:
+    return record_store.get(record_id)
 
 
-def analyze_image_logic(image_bytes: bytes, filename: str, crop_idx: int) -> list[dict]:
-    with tempfile.TemporaryDirectory() as tmpdir:
-        tmp_image_path = Path(tmpdir) / filename
+def get_calibration_profile(profile_id: str | None) -> CalibrationProfile | None:
+    """Returns the selected profile, None if none is selected, or raises KeyError."""
+    if profile_id is None:
+        return None
+    profile = calibration_profiles.get(profile_id)
+    if profile is None:
+        raise KeyError(profile_id)
+    return profile
 
-        with open(tmp_image_path, "wb") as f:
-            f.write(image_bytes)
 
-        processor = ECGProcessor()
-        wfdb_path = processor.process_to_wfdb(tmp_image_path, tmpdir)
-        print(f"{wfdb_path}")
-        print(list(wfdb_path.parent.iterdir()))
-        wfdb_window_list = create_window_list(tmp_hea_path=wfdb_path)
-        print(wfdb_window_list)
-        crop_idx = min(crop_idx, len(wfdb_window_list) - 1)
-        crop_idx = max(crop_idx, -len(wfdb_window_list) + 1)
-        processed_data = convert_wfdb_to_dict(
-            *wfdb_window_list[crop_idx], tmp_dat_path=wfdb_path
+def list_calibration_profiles() -> list[dict]:
+    return [asdict(profile) for profile in calibration_profiles.profiles()]
+
+
+async def store_image_record(
+    image_bytes, filename: str, profile: CalibrationProfile | None = None
+) -> StoredRecord:
+    filename = Path(filename).name
+    files = {filename: image_bytes}
+    if profile is not None:
+        # The same image digitized with another calibration is another record
+        files["calibration_profile"] = json.dumps(asdict(profile)).encode()
+    record_id = compute_record_id(files)
+
+    if record_id in record_store:
+        RECORD_LOOKUPS.labels(kind="image", result="hit").inc()
+        return record_store.get(record_id)
+    RECORD_LOOKUPS.labels(kind="image", result="miss").inc()
+
+    async def digitize() -> StoredRecord:
+        # Imported on the first image, as it loads OpenCV
+        from ..logic.ecg_digitizer.ecg_digitizer import digitize_image_buffer
+
+        image_buffer = np.frombuffer(image_bytes, dtype=np.uint8)
+        with SharedArray(image_buffer) as image_spec:
+            ecg_record = await worker_pool.run(
+                run_with_shared_array, digitize_image_buffer, image_spec, profile
+            )
+
+        record_name = Path(filename).stem
+        return await asyncio.to_thread(
+            record_store.put_record,
+            record_id,
+            ecg_record,
+            record_name,
+            [f"Digitized from ECG image: {record_name}"],
         )
-        events = detect_sickness(*wfdb_window_list[crop_idx], crop_idx, tmp_hea_path=wfdb_path)
 
-        return processed_data, crop_idx, len(wfdb_window_list) - 1, events
+    return await _compute_once(("digitize", record_id), digitize)
 
 
-async def analyze_signal_logic(
-        hea_file, dat_file, xws_file, crop_idx: int = 0, show_full_signal: bool = True
+@contextmanager
+def read_images_from_zip(archive_file):
+    """
+    Yields the images of a ZIP upload as `(filename, read)` pairs, where
+    `read()` decompresses the image. Sizes are checked up front from the
+    archive directory, and each image is only decompressed when its turn
+    to be digitized comes.
+    """
+    try:
+        archive = zipfile.ZipFile(archive_file.file)
+    except zipfile.BadZipFile as e:
+        raise ValueError(f"Invalid zip archive: {e}")
+
+    with archive:
+        images = []
+        total_bytes = 0
+        for info in archive.infolist():
+            name = Path(info.filename).name
+            if info.is_dir() or name.startswith("."):
+                continue
+            if not name.lower().endswith(BATCH_IMAGE_EXTENSIONS):
+                continue
+            if info.file_size > BATCH_MAX_IMAGE_BYTES:
+                raise ValueError(f"Image '{name}' in the archive is too large")
+            if len(images) >= BATCH_MAX_IMAGES:
+                raise ValueError(f"Archive has more than {BATCH_MAX_IMAGES} images")
+            total_bytes += info.file_size
+            if total_bytes > BATCH_MAX_ARCHIVE_BYTES:
+                raise UploadTooLargeError(archive_file.filename, BATCH_MAX_ARCHIVE_BYTES)
+            images.append((name, lambda info=info: archive.read(info)))
+
+        yield images
+
+
+async def store_image_records_logic(
+    images: list[tuple[str, bytes | Callable[[], bytes]]],
+    profile: CalibrationProfile | None = None,
+) -> list[dict]:
+    """
+    Digitizes a batch of images concurrently. At most as many images as the
+    pool has workers are in flight, so a large batch queues up here instead
+    of being rejected by the pool, and one failing image does not affect the
+    others. Images given as functions are only read once in flight.
+    """
+    limit = asyncio.Semaphore(worker_pool.max_workers)
+
+    async def store(filename: str, image) -> dict:
+        async with limit:
+            try:
+                if callable(image):
+                    with timed_stage("upload_read"):
+                        image = await asyncio.to_thread(image)
+                record = await store_image_record(image, filename, profile)
+            except (WorkerPoolBusyError, WorkerPoolUnavailableError):
+                return {
+                    "filename": filename,
+                    "error": "Przetwarzanie jest chwilowo niedostępne.",
+                }
+            except Exception as e:
+                return {"filename": filename, "error": str(e) or type(e).__name__}
+
+        return {
+            "filename": filename,
+            "record_id": record.record_id,
+            "fs": record.fs,
+            "sig_len": record.sig_len,
+            "max_crop_idx": WindowGrid(record.sig_len).max_index,
+        }
+
+    return await asyncio.gather(
+        *(store(filename, image) for filename, image in images)
+    )
+
+
+async def store_signal_record(hea_file, dat_file, xws_file) -> StoredRecord:
+    """
+    Streams the uploaded files straight into a staging directory of the
+    store, hashing them on the way, so no file is ever read whole.
+    """
+    check_upload_size(hea_file, UPLOAD_MAX_HEADER_BYTES)
+    upload_files = (hea_file, dat_file, xws_file)
+    UPLOAD_BYTES.labels(kind="signal").observe(sum(map(upload_size, upload_files)))
+
+    with record_store.staging() as staging_dir:
+        with timed_stage("upload_write"):
+            record_id = await asyncio.to_thread(
+                save_uploads, upload_files, staging_dir
+            )
+
+        if record_id in record_store:
+            RECORD_LOOKUPS.labels(kind="signal", result="hit").inc()
+            return record_store.get(record_id)
+        RECORD_LOOKUPS.labels(kind="signal", result="miss").inc()
+
+        base_path = staging_dir / Path(hea_file.filename).stem
+        return await asyncio.to_thread(
+            record_store.commit, record_id, staging_dir, base_path
+        )
+
+
+async def get_record_analysis(record: StoredRecord):
+    analysis = record_store.find_derived(record.record_id, "analysis")
+    if analysis is not None:
+        return analysis
+
+    async def analyze():
+        # The worker memory-maps the stored signal file itself, and reports
+        # how far it got through shared memory
+        progress = SharedArray(np.zeros(3, dtype=np.int64))
+        with progress as progress_spec:
+            _analysis_progress[record.record_id] = progress
+            try:
+                analysis = await worker_pool.run(
+                    run_with_shared_array,
+                    analyze_wfdb_record_tracked,
+                    progress_spec,
+                    record.hea_path,
+                )
+            except asyncio.CancelledError:
+                # Stops the worker at its next chunk
+                progress.write(2, 1)
+                raise
+            finally:
+                del _analysis_progress[record.record_id]
+        return record_store.set_derived(record.record_id, "analysis", analysis)
+
+    return await _compute_once(("analysis", record.record_id), analyze)
+
+
+async def get_record_overview_pyramid(record: StoredRecord):
+    pyramid = record_store.find_derived(record.record_id, "overview")
+    if pyramid is not None:
+        return pyramid
+
+    async def build():
+        # Built from the memory-mapped signal file by a worker, like analyses
+        pyramid = await worker_pool.run(build_wfdb_overview_pyramid, record.hea_path)
+        return record_store.set_derived(record.record_id, "overview", pyramid)
+
+    return await _compute_once(("overview", record.record_id), build)
+
+
+def _clamp_range(record: StoredRecord, sampfrom: int, sampto: int | None):
+    sampto = record.sig_len if sampto is None else sampto
+    sampfrom = min(max(sampfrom, 0), record.sig_len)
+    return sampfrom, min(max(sampto, sampfrom), record.sig_len)
+
+
+async def get_record_overview_logic(
+        record_id: str, sampfrom: int, sampto: int | None, max_points: int
 ) -> dict:
-    with tempfile.TemporaryDirectory() as tmpdir:
-        hea_filename = hea_file.filename
-        dat_filename = dat_file.filename
-        xws_filename = xws_file.filename
-
-        tmp_hea_path = Path(tmpdir) / hea_filename
-        tmp_dat_path = Path(tmpdir) / dat_filename
-        tmp_xws_path = Path(tmpdir) / xws_filename
-
-        with open(tmp_hea_path, "wb") as f:
-            f.write(await hea_file.read())
-        with open(tmp_dat_path, "wb") as f:
-            f.write(await dat_file.read())
-        with open(tmp_xws_path, "wb") as f:
-            f.write(await xws_file.read())
-
-        wfdb_window_list = create_window_list(
-            tmp_hea_path=tmp_hea_path,
-            tmp_dat_path=tmp_dat_path,
-            tmp_xws_path=tmp_xws_path,
+    record = record_store.get(record_id)
+    sampfrom, sampto = _clamp_range(record, sampfrom, sampto)
+
+    return {
+        "record_id": record_id,
+        "fs": record.fs,
+        "sig_len": record.sig_len,
+        **await _record_range(record, sampfrom, sampto, max_points),
+    }
+
+
+async def _record_range(
+        record: StoredRecord,
+        sampfrom: int,
+        sampto: int,
+        max_points: int,
+        raw_samples: bool = False,
+        precision: int | None = None,
+) -> dict:
+    """
+    `[sampfrom, sampto)` in at most `max_points` points per channel: the raw
+    samples when they fit, otherwise the min/max buckets of the overview
+    pyramid. With `raw_samples`, raw channels hold `samples` instead of equal
+    `min` and `max` lists.
+    """
+    pyramid = await get_record_overview_pyramid(record)
+    overview = pyramid.select(sampfrom, sampto, max_points)
+
+    sig_name = record.sig_name
+    if overview is None:
+        window_record = await get_record_window_data(record, sampfrom, sampto)
+        bucket_size, start = 1, sampfrom
+        minimum = maximum = window_record.p_signal
+    else:
+        bucket_size, start = overview.bucket_size, overview.start
+        minimum, maximum = overview.minimum, overview.maximum
+
+    if precision is not None:
+        minimum, maximum = np.round(minimum, precision), np.round(maximum, precision)
+
+    if raw_samples and bucket_size == 1:
+        channels = convert_signal_to_dict(minimum, sig_name)
+    else:
+        channels = [
+            {
+                "label": label,
+                "min": minimum[:, idx].tolist(),
+                "max": maximum[:, idx].tolist(),
+            }
+            for idx, label in enumerate(sig_name)
+        ]
+
+    return {
+        "sampfrom": sampfrom,
+        "sampto": sampto,
+        "bucket_size": bucket_size,
+        "start": start,
+        "channels": channels,
+    }
+
+
+async def get_record_ranges_logic(
+        record_id: str,
+        ranges: list[tuple[int, int | None]],
+        max_points: int | None = None,
+        precision: int | None = None,
+) -> dict:
+    """
+    Several `[sampfrom, sampto)` ranges of a record in one call, each with its
+    events in record sample indices. Ranges longer than `max_points` (or
+    than WINDOW_MAX_SIZE) are reduced to min/max buckets.
+    """
+    record = record_store.get(record_id)
+    max_points = min(max_points or WINDOW_MAX_SIZE, WINDOW_MAX_SIZE)
+    analysis = await get_record_analysis(record)
+
+    async def fetch(sampfrom, sampto):
+        sampfrom, sampto = _clamp_range(record, sampfrom, sampto)
+        content = await _record_range(
+            record, sampfrom, sampto, max_points, raw_samples=True, precision=precision
         )
+        return {**content, "events": analysis.events_in_window(sampfrom, sampto)}
 
-        crop_idx = min(max(crop_idx, 0), len(wfdb_window_list) - 1)
+    return {
+        "record_id": record_id,
+        "fs": record.fs,
+        "sig_len": record.sig_len,
+        "ranges": await asyncio.gather(
+            *(fetch(sampfrom, sampto) for sampfrom, sampto in ranges)
+        ),
+    }
 
-        if show_full_signal:
-            window = wfdb_window_list[crop_idx]
-            processed_data = convert_wfdb_to_dict(
-                *window,
-                tmp_hea_path=tmp_hea_path,
-                tmp_dat_path=tmp_dat_path,
-                tmp_xws_path=tmp_xws_path,
-            )
-            events = detect_sickness(*window, crop_idx, tmp_hea_path=tmp_hea_path)
-            return processed_data, crop_idx, len(wfdb_window_list) - 1, events
-
-        while crop_idx < len(wfdb_window_list):
-            window = wfdb_window_list[crop_idx]
-            processed_data = convert_wfdb_to_dict(
-                *window,
-                tmp_hea_path=tmp_hea_path,
-                tmp_dat_path=tmp_dat_path,
-                tmp_xws_path=tmp_xws_path,
-            )
-            events = detect_sickness(*window, crop_idx, tmp_hea_path=tmp_hea_path)
 
-            if events:
-                return processed_data, crop_idx, len(wfdb_window_list) - 1, events
+async def get_record_events_logic(
+        record_id: str, sampfrom: int, sampto: int | None
+) -> dict:
+    """Events overlapping `[sampfrom, sampto)`, in record sample indices."""
+    record = record_store.get(record_id)
+    sampfrom, sampto = _clamp_range(record, sampfrom, sampto)
+
+    analysis = await get_record_analysis(record)
+    return {
+        "record_id": record_id,
+        "fs": record.fs,
+        "sampfrom": sampfrom,
+        "sampto": sampto,
+        "events": analysis.events_in_window(sampfrom, sampto),
+    }
+
+
+async def get_record_window_data(
+        record: StoredRecord, sampfrom: int, sampto: int
+) -> ECGRecord:
+    with timed_stage("window_read"):
+        return await asyncio.to_thread(
+            record_store.read_window, record.record_id, sampfrom, sampto
+        )
+
+
+async def get_record_window(record: StoredRecord, grid: WindowGrid, crop_idx: int):
+    sampfrom, sampto = grid[crop_idx]
+
+    window_record = await get_record_window_data(record, sampfrom, sampto)
+    analysis = await get_record_analysis(record)
+    events = analysis.events_in_window(sampfrom, sampto, sampfrom)
+
+    return window_record, events
+
+
+async def get_record_window_logic(
+        record_id: str,
+        crop_idx: int,
+        window_size: int = WDFDB_SAMPLES_PER_WINDOW,
+        overlap: int = 0,
+):
+    record = record_store.get(record_id)
+    grid = WindowGrid(record.sig_len, window_size, overlap)
+
+    crop_idx = grid.clamp(crop_idx)
+    window_record, events = await get_record_window(record, grid, crop_idx)
+
+    return window_record, crop_idx, grid.max_index, events
+
+
+async def analyze_image_logic(
+        image_bytes: bytes,
+        filename: str,
+        crop_idx: int,
+        profile: CalibrationProfile | None = None,
+        window_size: int = WDFDB_SAMPLES_PER_WINDOW,
+        overlap: int = 0,
+) -> list[dict]:
+    record = await store_image_record(image_bytes, filename, profile)
+    grid = WindowGrid(record.sig_len, window_size, overlap)
+
+    crop_idx = min(crop_idx, grid.max_index)
+    crop_idx = max(crop_idx, -grid.max_index)
+    window_record, events = await get_record_window(record, grid, crop_idx)
+
+    return window_record, crop_idx, grid.max_index, events
+
+
+async def analyze_signal_logic(
+        hea_file,
+        dat_file,
+        xws_file,
+        crop_idx: int = 0,
+        show_full_signal: bool = True,
+        window_size: int = WDFDB_SAMPLES_PER_WINDOW,
+        overlap: int = 0,
+) -> dict:
+    record = await store_signal_record(hea_file, dat_file, xws_file)
+    grid = WindowGrid(record.sig_len, window_size, overlap)
+
+    crop_idx = grid.clamp(crop_idx)
+
+    if show_full_signal:
+        window_record, events = await get_record_window(record, grid, crop_idx)
+        return window_record, crop_idx, grid.max_index, events
+
+    analysis = await get_record_analysis(record)
+    while crop_idx < len(grid):
+        sampfrom, sampto = grid[crop_idx]
+        events = analysis.events_in_window(sampfrom, sampto, sampfrom)
+
+        if _scan_match(events):
+            window_record = await get_record_window_data(record, sampfrom, sampto)
+            return window_record, crop_idx, grid.max_index, events
+
+        crop_idx += 1
+
+    return None, -1, grid.max_index, []
+
+
+def _scan_match(events) -> bool:
+    return any(event["type"] in SCAN_EVENT_TYPES for event in events)
+
+
+def _analysis_progress_message(record: StoredRecord) -> dict:
+    read, total = 0, 0
+    progress = _analysis_progress.get(record.record_id)
+    if progress is not None:
+        read, total, _ = progress.array.tolist()
+    return {"type": "progress", "stage": "analysis", "read": read, "total": total}
+
+
+async def _scan_analysis(record: StoredRecord):
+    """
+    Waits for the analysis of `record`, yielding progress messages meanwhile
+    and finally the analysis. Closing it while the analysis runs stops it,
+    unless another request waits for it as well.
+    """
+    waiting = asyncio.ensure_future(get_record_analysis(record))
+    try:
+        while True:
+            await asyncio.wait({waiting}, timeout=SCAN_PROGRESS_INTERVAL)
+            if waiting.done():
+                break
+            yield _analysis_progress_message(record)
+    finally:
+        waiting.cancel()
+    yield waiting.result()
+
+
+async def scan_record_logic(
+        record: StoredRecord,
+        crop_idx: int = 0,
+        stop_at_first: bool = False,
+        precision: int | None = None,
+        window_size: int = WDFDB_SAMPLES_PER_WINDOW,
+        overlap: int = 0,
+):
+    """
+    Scan mode as a stream of messages: the record summary right away, then
+    periodic progress of the analysis and of the windows, every window with
+    events, the first window with SCAN_EVENT_TYPES events with its samples,
+    and a final summary.
+    """
+    grid = WindowGrid(record.sig_len, window_size, overlap)
+    max_crop_idx = grid.max_index
+    crop_idx = grid.clamp(crop_idx)
+
+    yield {
+        "type": "record",
+        "record_id": record.record_id,
+        "fs": record.fs,
+        "sig_len": record.sig_len,
+        "max_crop_idx": max_crop_idx,
+    }
+
+    async for message in _scan_analysis(record):
+        if isinstance(message, RecordAnalysis):
+            analysis = message
+        else:
+            yield message
+    first_crop_idx = -1
+
+    for idx in range(crop_idx, max_crop_idx + 1):
+        sampfrom, sampto = grid[idx]
+        events = analysis.events_in_window(sampfrom, sampto, sampfrom)
 
-            crop_idx += 1
+        if events:
+            yield {"type": "events", "crop_idx": idx, "events": events}
 
-        return None, -1, len(wfdb_window_list) - 1, []
+            if first_crop_idx < 0 and _scan_match(events):
+                first_crop_idx = idx
+                window_record = await get_record_window_data(record, sampfrom, sampto)
+                yield {
+                    "type": "window",
+                    "channels": convert_signal_to_dict(
+                        window_record.p_signal, window_record.sig_name, precision
+                    ),
+                    "crop_idx": idx,
+                    "max_crop_idx": max_crop_idx,
+                    "events": events,
+                }
+                if stop_at_first:
+                    break
 
+        if (idx - crop_idx + 1) % SCAN_PROGRESS_EVERY == 0:
+            yield {"type": "progress", "crop_idx": idx, "max_crop_idx": max_crop_idx}
 
+    yield {"type": "done", "crop_idx": first_crop_idx, "max_crop_idx": max_crop_idx}
@@ -0,0 +1,38 @@
+import hashlib
+import os
+
+# Stored records never change, so their responses may be cached for long
+HTTP_CACHE_MAX_AGE = int(os.environ.get("EKG_HTTP_CACHE_MAX_AGE", 7 * 24 * 3600))
+
+# Part of every ETag; bump it whenever the content served for the same
+# record and parameters changes, e.g. after detector changes
+ETAG_VERSION = "1"
+
+
+def make_etag(record_id: str, *parameters) -> str:
+    """
+    Strong ETag of a response derived from a stored record. The record id is
+    the hash of its content, so hashing it with the response parameters
+    identifies the response without computing it.
+    """
+    digest = hashlib.sha256(ETAG_VERSION.encode())
+    for part in (record_id, *parameters):
+        digest.update(b"\0" + str(part).encode())
+    return f'"{digest.hexdigest()[:32]}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """`If-None-Match` check, with the weak comparison it calls for."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (candidate.strip() for candidate in if_none_match.split(","))
+    return etag in (candidate.removeprefix("W/") for candidate in candidates)
+
+
+def cache_headers(etag: str) -> dict:
+    return {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={HTTP_CACHE_MAX_AGE}, immutable",
+    }
@@ -0,0 +1,216 @@
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+from ..detector.detector import (
+    CONSENSUS_MIN_LEAD_FRACTION,
+    CONSENSUS_TOLERANCE,
+    RATE_WINDOW_DURATION,
+    RHYTHM_DETECTORS,
+    RecordAnalysis,
+    cluster_r_peaks,
+    compute_rr_features,
+    episode_leads,
+    fuse_r_peaks,
+)
+from ..detector.streaming_detector import StreamingPeakDetector
+from ..metrics.metrics import LIVE_CONNECTIONS, timed_stage
+
+LIVE_MAX_CONNECTIONS = int(os.environ.get("EKG_LIVE_MAX_CONNECTIONS", 256))
+LIVE_MAX_FS = 2000
+LIVE_MAX_LEADS = 12
+# Longest signal accepted in one frame, in seconds
+LIVE_MAX_FRAME_DURATION = 10.0
+# Longest a peak is held back waiting for the peaks after it, in seconds
+LIVE_MAX_PEAK_DELAY = 10.0
+# Beats older than this (in seconds) are dropped; it must cover the local
+# RR statistics of the detectors
+LIVE_HISTORY_DURATION = 60.0
+# Detectors whose events no later beat can change once the rate window
+# after them is complete. Irregular rhythm spans keep growing while it lasts
+LIVE_DETECTORS = ("bradycardia", "tachycardia", "pause", "asystole", "premature_beat")
+
+
+class LiveMonitorBusyError(Exception):
+    pass
+
+
+class LiveMonitor:
+    """
+    Rolling R-peak, heart rate and event state of a signal streamed in
+    frames. Peaks come from a `StreamingPeakDetector`, held to the running
+    mean of their lead, and are fused into beats once no later peak of any
+    lead can join them; the rhythm detectors then run on the last
+    `history_duration` seconds of beats. An event is reported once, as
+    soon as the rate window after its end holds beats, so it arrives at most
+    the peak delay, the rate window and one RR interval after it ends.
+    Memory is bounded by the history and the detector buffer.
+    """
+
+    def __init__(
+        self,
+        fs,
+        lead_names,
+        detectors=None,
+        history_duration=LIVE_HISTORY_DURATION,
+        max_peak_delay=LIVE_MAX_PEAK_DELAY,
+    ):
+        self.fs = fs
+        self.lead_names = list(lead_names)
+        if detectors is None:
+            detectors = {
+                event_type: RHYTHM_DETECTORS[event_type] for event_type in LIVE_DETECTORS
+            }
+        self.detectors = detectors
+        self.history = int(history_duration * fs)
+        self.tolerance = int(CONSENSUS_TOLERANCE * fs)
+
+        self._detector = StreamingPeakDetector(
+            fs, len(self.lead_names), max_delay=max_peak_delay
+        )
+        self._lead_peaks = [np.empty(0, dtype=np.intp) for _ in self.lead_names]
+        self._settled = 0
+        self._horizon = float("-inf")
+
+    @property
+    def received(self) -> int:
+        return self._detector.samples_seen
+
+    @property
+    def peak_delay(self) -> float:
+        """Most seconds of signal that can follow a peak before it is reported."""
+        return (self._detector.max_lookahead + self.tolerance) / self.fs
+
+    def feed(self, samples) -> dict:
+        """Adds `(samples, leads)` to the signal and returns the new beats and events."""
+        with timed_stage("live_update"):
+            return self._update(self._detector.feed(samples))
+
+    def flush(self) -> dict:
+        """Reports everything left, once the stream has ended."""
+        with timed_stage("live_update"):
+            return self._update(self._detector.flush(), final=True)
+
+    def _settled_until(self) -> int:
+        """
+        End of the beats no later peak can change: up to the last final beat
+        that a majority of the leads detected and that is further than the
+        tolerance from the unread peaks, as the beats kept between two
+        majority beats depend on both.
+        """
+        _, last, support = cluster_r_peaks(self._lead_peaks, self.fs)
+        voters = sum(1 for peaks in self._lead_peaks if len(peaks))
+        closed = (last < self._detector.samples_final - self.tolerance) & (
+            support.sum(axis=1) > CONSENSUS_MIN_LEAD_FRACTION * voters
+        )
+        if not closed.any():
+            return self._settled
+        return int(last[closed][-1]) + 1
+
+    def _update(self, found, final=False) -> dict:
+        cutoff = self.received - self.history
+        for lead, peaks in enumerate(found):
+            kept = self._lead_peaks[lead]
+            self._lead_peaks[lead] = np.concatenate([kept[kept >= cutoff], peaks])
+
+        settled = self.received if final else self._settled_until()
+        update = {"received": self.received, "beats": [], "heart_rate": None, "events": []}
+        if settled <= self._settled:
+            return update
+
+        lead_peaks = [peaks[peaks < settled] for peaks in self._lead_peaks]
+        beats, beat_leads = fuse_r_peaks(lead_peaks, self.fs)
+        update["beats"] = beats[beats >= self._settled].tolist()
+        update["heart_rate"] = self._heart_rate(beats)
+        self._settled = settled
+        if len(beats) < 2:
+            return update
+
+        # Rate windows reach RATE_WINDOW_DURATION past an event, so its
+        # beats are all known once the last beat is that far past its end
+        horizon = np.inf if final else beats[-1] - RATE_WINDOW_DURATION * self.fs
+        if horizon <= self._horizon:
+            return update
+
+        features = compute_rr_features(beats, self.fs, lead_peaks=lead_peaks)
+        episodes = {
+            event_type: detect(features) for event_type, detect in self.detectors.items()
+        }
+        analysis = RecordAnalysis(
+            fs=self.fs,
+            r_peaks=beats,
+            rr_intervals=features.rr_intervals,
+            heart_rates=features.heart_rates,
+            episodes=episodes,
+            lead_names=self.lead_names,
+            beat_leads=beat_leads,
+            episode_leads={
+                event_type: episode_leads(beats, beat_leads, starts, ends)
+                for event_type, (starts, ends) in episodes.items()
+            },
+        )
+        update["events"] = [
+            event for event in analysis.events_in_window(self._horizon, horizon)
+            if self._horizon < event["end"] <= horizon
+        ]
+        self._horizon = horizon
+        return update
+
+    def _heart_rate(self, beats) -> float | None:
+        """Mean heart rate over the rate window before the last beat."""
+        if len(beats) < 2:
+            return None
+        recent = beats[beats >= beats[-1] - RATE_WINDOW_DURATION * self.fs]
+        if len(recent) < 2:
+            recent = beats[-2:]
+        return 60.0 * (len(recent) - 1) * self.fs / float(recent[-1] - recent[0])
+
+
+def parse_frame(message: bytes | str, leads: int, max_samples: int) -> np.ndarray:
+    """
+    `(samples, leads)` array of a frame: little-endian float32 values with the
+    leads interleaved when binary, a JSON array of samples (or of per-sample
+    lists of leads) when text.
+    """
+    if isinstance(message, bytes):
+        if len(message) % (4 * leads):
+            raise ValueError("Frame length is not a whole number of samples")
+        samples = np.frombuffer(message, dtype="<f4")
+    else:
+        try:
+            samples = np.asarray(json.loads(message), dtype=np.float64)
+        except TypeError:
+            raise ValueError("Frame is not an array of numbers")
+        if samples.ndim == 2 and samples.shape[1] != leads:
+            raise ValueError("Frame samples do not match the lead count")
+        if samples.ndim not in (1, 2) or samples.size % leads:
+            raise ValueError("Frame is not a whole number of samples")
+
+    samples = samples.reshape(-1, leads)
+    if len(samples) > max_samples:
+        raise ValueError("Frame is too long")
+    return samples
+
+
+_connections = 0
+_connections_lock = threading.Lock()
+
+
+@contextmanager
+def live_monitor_session(fs, leads):
+    """A `LiveMonitor` counted against LIVE_MAX_CONNECTIONS while in use."""
+    global _connections
+    with _connections_lock:
+        if _connections >= LIVE_MAX_CONNECTIONS:
+            raise LiveMonitorBusyError()
+        _connections += 1
+    LIVE_CONNECTIONS.inc()
+    try:
+        yield LiveMonitor(fs, [f"lead {i}" for i in range(leads)])
+    finally:
+        LIVE_CONNECTIONS.dec()
+        with _connections_lock:
+            _connections -= 1
@@ -0,0 +1,138 @@
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import Counter, Gauge, Histogram
+
+SERVER_TIMING_ENABLED = os.environ.get("EKG_SERVER_TIMING", "0") == "1"
+
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+    60.0,
+)
+# Powers of 4 from 256 up to ~1e9, for byte, sample and pixel counts
+SIZE_BUCKETS = tuple(float(4**exponent) for exponent in range(4, 16))
+
+STAGE_DURATION = Histogram(
+    "ekg_stage_duration_seconds",
+    "Duration of a processing stage.",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUEST_DURATION = Histogram(
+    "ekg_request_duration_seconds",
+    "Duration of HTTP requests.",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "ekg_requests_in_progress", "HTTP requests being handled.", ["method"]
+)
+UPLOAD_BYTES = Histogram(
+    "ekg_upload_bytes", "Size of uploaded files per request.", ["kind"], buckets=SIZE_BUCKETS
+)
+RECORD_SAMPLES = Histogram(
+    "ekg_record_samples", "Samples per channel of stored records.", buckets=SIZE_BUCKETS
+)
+RECORD_DISK_BYTES = Histogram(
+    "ekg_record_disk_bytes", "On-disk size of stored records.", buckets=SIZE_BUCKETS
+)
+IMAGE_PIXELS = Histogram(
+    "ekg_image_pixels", "Pixel count of digitized images.", buckets=SIZE_BUCKETS
+)
+LIVE_CONNECTIONS = Gauge(
+    "ekg_live_connections", "Open live monitoring WebSocket connections."
+)
+RECORD_LOOKUPS = Counter(
+    "ekg_record_lookups_total",
+    "Uploads answered from the record store (hit) or processed (miss).",
+    ["kind", "result"],
+)
+
+# Histograms that may be observed in worker processes, by name, to record
+# the observations the workers send back
+_REMOTE_HISTOGRAMS = {"ekg_image_pixels": IMAGE_PIXELS}
+
+
+class _Collected:
+    def __init__(self, remote=False):
+        # Remote collections run in a worker process; what they gather is
+        # returned to the parent and recorded there instead.
+        self.remote = remote
+        self.stages: list[tuple[str, float]] = []
+        self.observations: list[tuple[str, float, dict]] = []
+
+
+_collected: contextvars.ContextVar[_Collected | None] = contextvars.ContextVar(
+    "ekg_metrics_collected", default=None
+)
+
+
+def record_stage(stage: str, seconds: float):
+    collected = _collected.get()
+    if collected is None or not collected.remote:
+        STAGE_DURATION.labels(stage=stage).observe(seconds)
+    if collected is not None:
+        collected.stages.append((stage, seconds))
+
+
+@contextmanager
+def timed_stage(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+
+def observe(histogram: Histogram, value, **labels):
+    """Observes `value`, in the parent process when run in a worker."""
+    collected = _collected.get()
+    if collected is not None and collected.remote:
+        collected.observations.append((histogram.describe()[0].name, value, labels))
+    else:
+        (histogram.labels(**labels) if labels else histogram).observe(value)
+
+
+def run_collecting_metrics(fn, *args):
+    """
+    Worker-side wrapper returning `fn(*args)` together with the stages and
+    observations recorded while it ran, to be passed to `record_collected`.
+    """
+    collected = _Collected(remote=True)
+    token = _collected.set(collected)
+    try:
+        result = fn(*args)
+    finally:
+        _collected.reset(token)
+    return result, collected.stages, collected.observations
+
+
+def record_collected(stages, observations):
+    for stage, seconds in stages:
+        record_stage(stage, seconds)
+    for name, value, labels in observations:
+        observe(_REMOTE_HISTOGRAMS[name], value, **labels)
+
+
+@contextmanager
+def collect_request_stages():
+    """Collects the stages timed in the current context, e.g. one request."""
+    collected = _Collected()
+    token = _collected.set(collected)
+    try:
+        yield collected.stages
+    finally:
+        _collected.reset(token)
+
+
+def format_server_timing(stages, total_seconds=None) -> str:
+    durations = {}
+    for stage, seconds in stages:
+        durations[stage] = durations.get(stage, 0.0) + seconds
+    if total_seconds is not None:
+        durations["total"] = total_seconds
+    return ", ".join(
+        f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in durations.items()
+    )
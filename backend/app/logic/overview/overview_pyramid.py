@@ -0,0 +1,166 @@
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from ..ecg_record.ecg_record import ECGRecord
+from ..ecg_record.wfdb_reader import WfdbSignalReader
+from ..metrics.metrics import timed_stage
+
+# Samples per bucket at the finest level and reduction between levels
+OVERVIEW_BASE_BUCKET = 8
+OVERVIEW_LEVEL_FACTOR = 4
+# Levels are added until the coarsest one has at most this many buckets
+OVERVIEW_MIN_BUCKETS = 256
+# Stored records are read this many finest-level buckets at a time
+OVERVIEW_CHUNK_BUCKETS = 64 * 1024
+
+
+@dataclass
+class OverviewLevel:
+    bucket_size: int
+    # (buckets, channels) per-bucket extremes; bucket i covers samples
+    # [i * bucket_size, (i + 1) * bucket_size)
+    minimum: np.ndarray
+    maximum: np.ndarray
+
+
+@dataclass
+class OverviewWindow:
+    bucket_size: int
+    start: int
+    minimum: np.ndarray
+    maximum: np.ndarray
+
+
+def _reduce_buckets(minimum, maximum, factor):
+    """Min/max of every `factor` consecutive rows, NaN-ignoring."""
+    full = (len(minimum) // factor) * factor
+    shape = (-1, factor, minimum.shape[1])
+    grouped_min = minimum[:full].reshape(shape)
+    grouped_max = maximum[:full].reshape(shape)
+
+    # Element-wise passes over the group offsets are much faster than
+    # reducing along the short, strided group axis
+    reduced_min = grouped_min[:, 0].copy()
+    reduced_max = grouped_max[:, 0].copy()
+    for offset in range(1, factor):
+        np.fmin(reduced_min, grouped_min[:, offset], out=reduced_min)
+        np.fmax(reduced_max, grouped_max[:, offset], out=reduced_max)
+
+    if full < len(minimum):
+        tail_min = np.fmin.reduce(minimum[full:], axis=0, keepdims=True)
+        tail_max = np.fmax.reduce(maximum[full:], axis=0, keepdims=True)
+        reduced_min = np.concatenate([reduced_min, tail_min])
+        reduced_max = np.concatenate([reduced_max, tail_max])
+
+    return reduced_min, reduced_max
+
+
+@dataclass
+class OverviewPyramid:
+    sig_len: int
+    levels: list[OverviewLevel]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(level.minimum.nbytes + level.maximum.nbytes for level in self.levels)
+
+    def select(self, sampfrom, sampto, max_points) -> OverviewWindow | None:
+        """
+        Finest level whose buckets covering `[sampfrom, sampto)` fit in
+        `max_points` points (two per bucket). Returns None when the raw samples
+        already fit and should be served instead.
+        """
+        if sampto - sampfrom <= max_points:
+            return None
+
+        max_buckets = max(1, max_points // 2)
+        for level in self.levels:
+            first = sampfrom // level.bucket_size
+            last = -(-sampto // level.bucket_size)
+            if last - first <= max_buckets:
+                return OverviewWindow(
+                    level.bucket_size,
+                    first * level.bucket_size,
+                    level.minimum[first:last],
+                    level.maximum[first:last],
+                )
+
+        # Even the coarsest level is too dense: merge its buckets further
+        level = self.levels[-1]
+        first = sampfrom // level.bucket_size
+        last = -(-sampto // level.bucket_size)
+        factor = -(-(last - first) // max_buckets)
+        minimum, maximum = _reduce_buckets(
+            level.minimum[first:last], level.maximum[first:last], factor
+        )
+        return OverviewWindow(
+            level.bucket_size * factor, first * level.bucket_size, minimum, maximum
+        )
+
+
+def build_overview_pyramid(
+    p_signal,
+    base_bucket=OVERVIEW_BASE_BUCKET,
+    factor=OVERVIEW_LEVEL_FACTOR,
+    min_buckets=OVERVIEW_MIN_BUCKETS,
+) -> OverviewPyramid:
+    """
+    Builds the min/max pyramid of a `(samples, channels)` signal. Only the
+    finest level reads the signal; every coarser level is reduced from the
+    one below it.
+    """
+    minimum, maximum = _reduce_buckets(p_signal, p_signal, base_bucket)
+    return _stack_levels(len(p_signal), minimum, maximum, base_bucket, factor, min_buckets)
+
+
+def build_wfdb_overview_pyramid(
+    tmp_hea_path,
+    base_bucket=OVERVIEW_BASE_BUCKET,
+    factor=OVERVIEW_LEVEL_FACTOR,
+    min_buckets=OVERVIEW_MIN_BUCKETS,
+    chunk_buckets=OVERVIEW_CHUNK_BUCKETS,
+) -> OverviewPyramid:
+    """
+    `build_overview_pyramid` of a stored record, read from its memory-mapped
+    signal file one chunk of whole buckets at a time, so only the finest
+    level and one chunk are ever held in memory.
+    """
+    base_path = Path(tmp_hea_path).with_suffix("")
+    with timed_stage("overview_build"):
+        reader = WfdbSignalReader.open(base_path)
+        if reader is None:
+            p_signal = ECGRecord.from_wfdb(base_path).p_signal
+            return build_overview_pyramid(p_signal, base_bucket, factor, min_buckets)
+
+        chunk_size = chunk_buckets * base_bucket
+        minimums, maximums = [], []
+        for start in range(0, reader.sig_len, chunk_size):
+            chunk = reader.read_physical(start, start + chunk_size)
+            minimum, maximum = _reduce_buckets(chunk, chunk, base_bucket)
+            minimums.append(minimum)
+            maximums.append(maximum)
+
+        if not minimums:
+            minimums = maximums = [np.empty((0, reader.n_sig))]
+        return _stack_levels(
+            reader.sig_len,
+            np.concatenate(minimums),
+            np.concatenate(maximums),
+            base_bucket,
+            factor,
+            min_buckets,
+        )
+
+
+def _stack_levels(sig_len, minimum, maximum, base_bucket, factor, min_buckets):
+    """The pyramid over a finest level, with coarser levels reduced from it."""
+    levels = [OverviewLevel(base_bucket, minimum, maximum)]
+
+    while len(levels[-1].minimum) > min_buckets:
+        previous = levels[-1]
+        minimum, maximum = _reduce_buckets(previous.minimum, previous.maximum, factor)
+        levels.append(OverviewLevel(previous.bucket_size * factor, minimum, maximum))
+
+    return OverviewPyramid(sig_len, levels)
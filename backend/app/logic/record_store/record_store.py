@@ -0,0 +1,357 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+
+import wfdb
+
+from ..ecg_record.ecg_record import ECGRecord
+from ..ecg_record.wfdb_reader import WfdbSignalReader
+from ..metrics.metrics import RECORD_DISK_BYTES, RECORD_SAMPLES, timed_stage
+
+RECORD_STORE_DIR = Path(
+    os.environ.get("EKG_RECORD_STORE_DIR", Path(tempfile.gettempdir()) / "ekg-records")
+)
+RECORD_STORE_MAX_DISK_BYTES = int(
+    os.environ.get("EKG_RECORD_STORE_MAX_DISK_BYTES", 2 * 1024**3)
+)
+RECORD_STORE_MAX_MEMORY_BYTES = int(
+    os.environ.get("EKG_RECORD_STORE_MAX_MEMORY_BYTES", 512 * 1024**2)
+)
+# Memory-mapped signal files kept open, one file descriptor each
+RECORD_STORE_MAX_READERS = int(os.environ.get("EKG_RECORD_STORE_MAX_READERS", 256))
+
+STAGING_PREFIX = ".staging-"
+STAGING_MAX_AGE_SECONDS = 3600
+
+
+@dataclass
+class StoredRecord:
+    record_id: str
+    directory: Path
+    record_name: str
+    sig_len: int
+    fs: float
+    sig_name: list[str]
+    disk_bytes: int
+
+    @property
+    def base_path(self) -> Path:
+        return self.directory / self.record_name
+
+    @property
+    def hea_path(self) -> Path:
+        return self.directory / f"{self.record_name}.hea"
+
+
+class RecordIdHasher:
+    """
+    Incremental `compute_record_id`: call `add_file` for every file in
+    sorted filename order, each followed by `update` with its content.
+    """
+
+    def __init__(self):
+        self._digest = hashlib.sha256()
+
+    def add_file(self, filename: str, size: int):
+        self._digest.update(filename.encode())
+        self._digest.update(size.to_bytes(8, "little"))
+
+    def update(self, content):
+        self._digest.update(content)
+
+    def hexdigest(self) -> str:
+        return self._digest.hexdigest()
+
+
+def compute_record_id(files: dict[str, bytes]) -> str:
+    hasher = RecordIdHasher()
+    for filename in sorted(files):
+        content = files[filename]
+        hasher.add_file(filename, len(content))
+        hasher.update(content)
+    return hasher.hexdigest()
+
+
+def _directory_size(directory: Path) -> int:
+    return sum(path.stat().st_size for path in directory.iterdir() if path.is_file())
+
+
+class RecordStore:
+    """
+    Content-addressed store of WFDB records kept on disk, with an LRU-bounded
+    in-memory tier holding the decoded signals, derived values and signal
+    file readers of records. Both tiers evict least recently used records
+    once their byte budget is exceeded; the memory tier drops everything it
+    holds for a record at once.
+    """
+
+    def __init__(
+        self, root_dir, max_disk_bytes, max_memory_bytes, max_readers=RECORD_STORE_MAX_READERS
+    ):
+        self.root_dir = Path(root_dir)
+        self.max_disk_bytes = max_disk_bytes
+        self.max_memory_bytes = max_memory_bytes
+        self.max_readers = max_readers
+
+        self._records: OrderedDict[str, StoredRecord] = OrderedDict()
+        self._signals: dict[str, ECGRecord] = {}
+        # None for records whose format has to be decoded by wfdb
+        self._readers: dict[str, WfdbSignalReader | None] = {}
+        self._derived: dict[str, dict] = {}
+        # Bytes the memory tier holds for every record, least recently used first
+        self._memory: OrderedDict[str, int] = OrderedDict()
+        self._disk_bytes = 0
+        self._memory_bytes = 0
+        self._lock = threading.RLock()
+
+        self.root_dir.mkdir(parents=True, exist_ok=True)
+        self._load_existing()
+
+    def __contains__(self, record_id: str) -> bool:
+        with self._lock:
+            return record_id in self._records
+
+    def put(self, record_id: str, writer) -> StoredRecord:
+        """
+        Stores a record under `record_id`. `writer(directory)` must write the
+        WFDB files into `directory` and return the record base path. It is not
+        called if the record is already stored.
+        """
+        with self._lock:
+            if record_id in self._records:
+                return self._touch(record_id)
+
+        with self.staging() as staging_dir:
+            with timed_stage("upload_write"):
+                base_path = writer(staging_dir)
+            return self.commit(record_id, staging_dir, base_path)
+
+    def put_record(
+        self, record_id: str, ecg_record: ECGRecord, record_name: str, comments=None
+    ) -> StoredRecord:
+        """
+        Stores an in-memory record. It is exported to WFDB for the disk tier and
+        kept decoded in memory, so nothing has to be read back from disk.
+        """
+        with self._lock:
+            if record_id in self._records:
+                return self._touch(record_id)
+
+        with self.staging() as staging_dir:
+            with timed_stage("wfdb_write"):
+                base_path = ecg_record.to_wfdb(staging_dir, record_name, comments)
+            record = self.commit(record_id, staging_dir, base_path, ecg_record)
+
+        self._cache_ecg_record(record_id, ecg_record)
+        return record
+
+    @contextmanager
+    def staging(self):
+        """
+        Yields a scratch directory inside the store to write a new record into.
+        It is removed on exit unless it was moved into place by `commit`.
+        """
+        staging_dir = Path(tempfile.mkdtemp(prefix=STAGING_PREFIX, dir=self.root_dir))
+        try:
+            yield staging_dir
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+    def commit(
+        self, record_id: str, staging_dir: Path, base_path, header=None
+    ) -> StoredRecord:
+        base_path = Path(base_path)
+        if header is None:
+            header = wfdb.rdheader(str(base_path))
+
+        with self._lock:
+            if record_id in self._records:
+                return self._touch(record_id)
+
+            final_dir = self.root_dir / record_id
+            shutil.rmtree(final_dir, ignore_errors=True)
+            os.replace(staging_dir, final_dir)
+
+            record = StoredRecord(
+                record_id=record_id,
+                directory=final_dir,
+                record_name=base_path.name,
+                sig_len=header.sig_len,
+                fs=header.fs,
+                sig_name=list(header.sig_name),
+                disk_bytes=_directory_size(final_dir),
+            )
+            self._records[record_id] = record
+            self._disk_bytes += record.disk_bytes
+            self._evict_disk()
+
+        RECORD_SAMPLES.observe(record.sig_len)
+        RECORD_DISK_BYTES.observe(record.disk_bytes)
+        return record
+
+    def get(self, record_id: str) -> StoredRecord:
+        with self._lock:
+            if record_id not in self._records:
+                raise KeyError(record_id)
+            return self._touch(record_id)
+
+    def get_ecg_record(self, record_id: str) -> ECGRecord:
+        """
+        Returns the decoded record, reading it from disk only when it is not
+        already cached in memory.
+        """
+        record = self.get(record_id)
+
+        with self._lock:
+            if record_id in self._signals:
+                self._memory.move_to_end(record_id)
+                return self._signals[record_id]
+
+        with timed_stage("wfdb_read"):
+            ecg_record = ECGRecord.from_wfdb(record.base_path)
+        return self._cache_ecg_record(record_id, ecg_record)
+
+    def get_reader(self, record_id: str) -> WfdbSignalReader | None:
+        record = self.get(record_id)
+
+        with self._lock:
+            if record_id in self._readers:
+                self._memory.move_to_end(record_id)
+                return self._readers[record_id]
+
+        reader = WfdbSignalReader.open(record.base_path)
+        with self._lock:
+            if record_id not in self._records:
+                return reader
+            if record_id not in self._readers:
+                self._readers[record_id] = reader
+                self._hold_memory(record_id, 0)
+            return self._readers[record_id]
+
+    def read_window(self, record_id: str, sampfrom: int, sampto: int) -> ECGRecord:
+        """
+        Returns samples `[sampfrom, sampto)` of a record. Unless the record is
+        already decoded in memory, only that range is read from the
+        memory-mapped signal file, so the cost does not depend on the record
+        length. Records in other formats are decoded whole through wfdb.
+        """
+        with self._lock:
+            if record_id in self._signals:
+                self._memory.move_to_end(record_id)
+                return self._signals[record_id].window(sampfrom, sampto)
+
+        reader = self.get_reader(record_id)
+        if reader is not None:
+            return ECGRecord.from_reader(reader, sampfrom, sampto)
+
+        return self.get_ecg_record(record_id).window(sampfrom, sampto)
+
+    def find_derived(self, record_id: str, name: str):
+        self.get(record_id)
+        with self._lock:
+            value = self._derived.get(record_id, {}).get(name)
+            if value is not None:
+                self._memory.move_to_end(record_id)
+            return value
+
+    def set_derived(self, record_id: str, name: str, value):
+        """Keeps `value`, counted against the memory budget by its `nbytes`."""
+        with self._lock:
+            if record_id not in self._records:
+                return value
+            derived = self._derived.setdefault(record_id, {})
+            if name not in derived:
+                derived[name] = value
+                self._hold_memory(record_id, getattr(value, "nbytes", 0))
+            return derived[name]
+
+    def _touch(self, record_id: str) -> StoredRecord:
+        self._records.move_to_end(record_id)
+        record = self._records[record_id]
+        try:
+            os.utime(record.directory)
+        except OSError:
+            pass
+        return record
+
+    def _evict_disk(self):
+        while self._disk_bytes > self.max_disk_bytes and len(self._records) > 1:
+            record_id, record = self._records.popitem(last=False)
+            self._disk_bytes -= record.disk_bytes
+            self._drop_memory(record_id)
+            shutil.rmtree(record.directory, ignore_errors=True)
+
+    def _cache_ecg_record(self, record_id: str, ecg_record: ECGRecord) -> ECGRecord:
+        with self._lock:
+            if record_id in self._signals:
+                return self._signals[record_id]
+            if record_id not in self._records:
+                return ecg_record
+
+            self._signals[record_id] = ecg_record
+            self._hold_memory(record_id, ecg_record.nbytes)
+            return ecg_record
+
+    def _hold_memory(self, record_id: str, nbytes: int):
+        self._memory[record_id] = self._memory.get(record_id, 0) + nbytes
+        self._memory.move_to_end(record_id)
+        self._memory_bytes += nbytes
+        self._evict_memory()
+
+    def _evict_memory(self):
+        while len(self._memory) > 1 and (
+            self._memory_bytes > self.max_memory_bytes
+            or len(self._readers) > self.max_readers
+        ):
+            self._drop_memory(next(iter(self._memory)))
+
+    def _drop_memory(self, record_id: str):
+        self._signals.pop(record_id, None)
+        self._derived.pop(record_id, None)
+        self._readers.pop(record_id, None)
+        self._memory_bytes -= self._memory.pop(record_id, 0)
+
+    def _load_existing(self):
+        directories = []
+        for directory in self.root_dir.iterdir():
+            if not directory.is_dir():
+                continue
+            if directory.name.startswith(STAGING_PREFIX):
+                if time.time() - directory.stat().st_mtime > STAGING_MAX_AGE_SECONDS:
+                    shutil.rmtree(directory, ignore_errors=True)
+                continue
+            directories.append(directory)
+
+        for directory in sorted(directories, key=lambda path: path.stat().st_mtime):
+            try:
+                hea_path = next(directory.glob("*.hea"))
+                header = wfdb.rdheader(str(hea_path.with_suffix("")))
+            except Exception:
+                shutil.rmtree(directory, ignore_errors=True)
+                continue
+
+            record = StoredRecord(
+                record_id=directory.name,
+                directory=directory,
+                record_name=hea_path.stem,
+                sig_len=header.sig_len,
+                fs=header.fs,
+                sig_name=list(header.sig_name),
+                disk_bytes=_directory_size(directory),
+            )
+            self._records[record.record_id] = record
+            self._disk_bytes += record.disk_bytes
+
+        self._evict_disk()
+
+
+record_store = RecordStore(
+    RECORD_STORE_DIR, RECORD_STORE_MAX_DISK_BYTES, RECORD_STORE_MAX_MEMORY_BYTES
+)
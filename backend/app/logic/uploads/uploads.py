@@ -0,0 +1,86 @@
+import os
+from pathlib import Path
+
+import numpy as np
+
+from ..record_store.record_store import RecordIdHasher
+
+UPLOAD_MAX_FILE_BYTES = int(os.environ.get("EKG_UPLOAD_MAX_FILE_BYTES", 512 * 1024**2))
+UPLOAD_MAX_IMAGE_BYTES = int(os.environ.get("EKG_UPLOAD_MAX_IMAGE_BYTES", 50 * 1024**2))
+UPLOAD_MAX_REQUEST_BYTES = int(
+    os.environ.get("EKG_UPLOAD_MAX_REQUEST_BYTES", 1024**3)
+)
+# WFDB headers are a few lines of text; parsing a huge one is very slow
+UPLOAD_MAX_HEADER_BYTES = 64 * 1024
+UPLOAD_CHUNK_SIZE = 1024**2
+
+
+class UploadTooLargeError(Exception):
+    def __init__(self, filename, max_bytes):
+        super().__init__(f"File '{filename}' exceeds {max_bytes} bytes")
+        self.filename = filename
+        self.max_bytes = max_bytes
+
+
+def upload_size(upload_file) -> int:
+    if upload_file.size is not None:
+        return upload_file.size
+
+    file = upload_file.file
+    position = file.tell()
+    file.seek(0, os.SEEK_END)
+    size = file.tell()
+    file.seek(position)
+    return size
+
+
+def check_upload_size(upload_file, max_bytes=UPLOAD_MAX_FILE_BYTES) -> int:
+    size = upload_size(upload_file)
+    if size > max_bytes:
+        raise UploadTooLargeError(upload_file.filename, max_bytes)
+    return size
+
+
+def read_upload(upload_file, max_bytes=UPLOAD_MAX_FILE_BYTES) -> np.ndarray:
+    """
+    Reads an upload into a byte array allocated once at its final size,
+    without the intermediate copies of `UploadFile.read()`.
+    """
+    size = check_upload_size(upload_file, max_bytes)
+    buffer = np.empty(size, dtype=np.uint8)
+    view = memoryview(buffer)
+
+    upload_file.file.seek(0)
+    received = 0
+    while received < size:
+        count = upload_file.file.readinto(view[received:received + UPLOAD_CHUNK_SIZE])
+        if not count:
+            break
+        received += count
+
+    return buffer[:received]
+
+
+def save_uploads(upload_files, directory: Path, max_bytes=UPLOAD_MAX_FILE_BYTES) -> str:
+    """
+    Streams uploads into `directory` in chunks, so at most one chunk is held
+    in memory, and returns the record id of their content.
+    """
+    uploads = {Path(upload_file.filename).name: upload_file for upload_file in upload_files}
+    sizes = {
+        filename: check_upload_size(upload_file, max_bytes)
+        for filename, upload_file in uploads.items()
+    }
+
+    hasher = RecordIdHasher()
+    for filename in sorted(uploads):
+        hasher.add_file(filename, sizes[filename])
+
+        source = uploads[filename].file
+        source.seek(0)
+        with open(directory / filename, "wb") as output:
+            while chunk := source.read(UPLOAD_CHUNK_SIZE):
+                hasher.update(chunk)
+                output.write(chunk)
+
+    return hasher.hexdigest()
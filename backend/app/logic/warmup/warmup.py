@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from ..detector.detector import analyze_wfdb_record
+from ..ecg_record.ecg_record import ECGRecord
+from ..live_monitor.live_monitor import LiveMonitor
+from ..overview.overview_pyramid import build_wfdb_overview_pyramid
+from ..wfdb_converter.wfdb_json_converter import (
+    convert_record_to_base64_dict,
+    convert_signal_to_dict,
+    encode_frame,
+)
+from ..worker_pool.worker_pool import SharedArray, run_with_shared_array, worker_pool
+
+WARMUP_ENABLED = os.environ.get("EKG_WARMUP", "1") == "1"
+
+WARMUP_FS = 250
+WARMUP_DURATION = 10.0
+WARMUP_BPM = 72
+# Scale and height of the synthetic strip image
+WARMUP_PX_PER_MM = 10
+WARMUP_HEIGHT_MM = 30
+
+logger = logging.getLogger(__name__)
+
+
+def synthetic_signal(duration=WARMUP_DURATION, fs=WARMUP_FS, bpm=WARMUP_BPM):
+    """Narrow 1 mV R waves at a constant rate."""
+    t = np.arange(int(duration * fs)) / fs
+    phase = (t * bpm / 60) % 1
+    return np.exp(-0.5 * ((phase - 0.5) / 0.02) ** 2)
+
+
+def synthetic_image(signal, fs, px_per_mm=WARMUP_PX_PER_MM) -> np.ndarray:
+    """Returns `signal` drawn on an ECG grid, encoded as PNG."""
+    import cv2
+
+    from ..ecg_paper.ecg_paper import render_ecg_image
+
+    image = render_ecg_image(signal, fs, px_per_mm, height_mm=WARMUP_HEIGHT_MM)
+    _, encoded = cv2.imencode(".png", image)
+    return encoded
+
+
+class Warmup:
+    """
+    Runs every pipeline stage once on a tiny synthetic record and image, so
+    that worker processes are spawned, modules imported and lazily
+    initialized code paths exercised before the first real request.
+    """
+
+    def __init__(self, enabled=WARMUP_ENABLED):
+        self.enabled = enabled
+        self.ready = False
+        self.duration = None
+
+    async def run(self):
+        """Warms the pipeline up; the app only becomes ready if it succeeds."""
+        start = time.perf_counter()
+        failed = False
+        if self.enabled:
+            try:
+                with tempfile.TemporaryDirectory() as tmpdir:
+                    ecg_record = ECGRecord(synthetic_signal(), WARMUP_FS, ["ECG I"])
+                    base_path = ecg_record.to_wfdb(tmpdir, "warmup")
+
+                    await self._warm_up_workers(ecg_record, base_path)
+                    await asyncio.to_thread(self._warm_up_local, base_path)
+            except Exception:
+                logger.exception("Pipeline warm-up failed")
+                failed = True
+
+        self.duration = time.perf_counter() - start
+        self.ready = not failed
+        if self.ready:
+            logger.info("Pipeline warm-up finished in %.2f s", self.duration)
+
+    @staticmethod
+    async def _warm_up_workers(ecg_record, base_path):
+        from ..ecg_digitizer.ecg_digitizer import digitize_image_buffer
+
+        image_buffer = synthetic_image(ecg_record.p_signal[:, 0], ecg_record.fs)
+
+        # One digitization per worker, submitted at once so every worker is
+        # spawned, then one analysis and overview. Calibration profiles are
+        # left out, so the synthetic image is neither matched with nor stored
+        # as one
+        with SharedArray(image_buffer) as image_spec:
+            await asyncio.gather(
+                *(
+                    worker_pool.run(
+                        run_with_shared_array,
+                        digitize_image_buffer,
+                        image_spec,
+                        None,
+                        False,
+                    )
+                    for _ in range(worker_pool.max_workers)
+                )
+            )
+        await worker_pool.run(analyze_wfdb_record, base_path.with_suffix(".hea"))
+        await worker_pool.run(build_wfdb_overview_pyramid, base_path.with_suffix(".hea"))
+
+    @staticmethod
+    def _warm_up_local(base_path):
+        ecg_record = ECGRecord.from_wfdb(base_path)
+        window_record = ECGRecord.from_wfdb(base_path, 100, 200)
+
+        convert_signal_to_dict(window_record.p_signal, window_record.sig_name)
+        convert_record_to_base64_dict(window_record, "int16")
+        encode_frame({}, window_record)
+
+        monitor = LiveMonitor(ecg_record.fs, ecg_record.sig_name)
+        monitor.feed(ecg_record.p_signal)
+        monitor.flush()
+
+
+warmup = Warmup()
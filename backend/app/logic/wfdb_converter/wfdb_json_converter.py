@@ -1,41 +1,46 @@
-from pathlib import Path
+import base64
+import json
+import struct
 
-import wfdb
+import numpy as np
+
+from ..ecg_record.ecg_record import ECGRecord
 
 WDFDB_SAMPLES_PER_WINDOW = 4000
 
+JSON_MEDIA_TYPE = "application/json"
+INT16_JSON_MEDIA_TYPE = "application/vnd.ekg.int16+json"
+FLOAT32_JSON_MEDIA_TYPE = "application/vnd.ekg.float32+json"
+FRAME_MEDIA_TYPE = "application/vnd.ekg.frame"
 
-def create_window_list(**kwargs):
-    tmp_hea_path: Path = kwargs.pop("tmp_hea_path", None)
-    base_path = tmp_hea_path.with_suffix("")
-    try:
-        total_samples = wfdb.rdheader(base_path)
-        print(f"Total samples in record: {total_samples.sig_len}")
-    except Exception as e:
-        raise RuntimeError(f"Could not read WFDB record at '{tmp_hea_path}': {e}")
-    return [
-        (x - WDFDB_SAMPLES_PER_WINDOW, min(x, total_samples.sig_len - 1))
-        for x in range(
-            WDFDB_SAMPLES_PER_WINDOW,
-            total_samples.sig_len - 1 + WDFDB_SAMPLES_PER_WINDOW,
-            WDFDB_SAMPLES_PER_WINDOW,
-        )
-    ]
+SUPPORTED_MEDIA_TYPES = [
+    JSON_MEDIA_TYPE,
+    INT16_JSON_MEDIA_TYPE,
+    FLOAT32_JSON_MEDIA_TYPE,
+    FRAME_MEDIA_TYPE,
+]
+
+FRAME_MAGIC = b"EKG1"
+# ADC value written for missing (NaN) samples, as in WFDB format 16
+INT16_NAN_VALUE = -32768
 
 
 def convert_wfdb_to_dict(sampfrom, sampto, **kwargs):
     tmp_dat_path = kwargs.pop("tmp_dat_path", None)
     base_path = tmp_dat_path.with_suffix("")
     try:
-        record = wfdb.rdrecord(base_path, sampfrom=sampfrom, sampto=sampto)
+        record = ECGRecord.from_wfdb(base_path, sampfrom=sampfrom, sampto=sampto)
+    except ValueError:
+        raise
     except Exception as e:
         raise RuntimeError(f"Could not read WFDB record at '{tmp_dat_path}': {e}")
 
-    if record.p_signal is None:
-        raise ValueError("No signal data found in the record.")
+    return convert_signal_to_dict(record.p_signal, record.sig_name)
+
 
-    signal_data = record.p_signal
-    channel_names = record.sig_name
+def convert_signal_to_dict(signal_data, channel_names, precision=None):
+    if precision is not None:
+        signal_data = np.round(signal_data, precision)
 
     result = []
     for idx, label in enumerate(channel_names):
@@ -43,3 +48,110 @@ def convert_wfdb_to_dict(sampfrom, sampto, **kwargs):
         result.append({"label": label, "samples": samples})
 
     return result
+
+
+def negotiate_media_type(accept_header):
+    """
+    Picks the supported media type the client prefers most in its `Accept`
+    header, falling back to plain JSON.
+    """
+    if not accept_header:
+        return JSON_MEDIA_TYPE
+
+    candidates = []
+    for position, item in enumerate(accept_header.split(",")):
+        media_type, *params = [part.strip() for part in item.split(";")]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            candidates.append((-quality, position, media_type.lower()))
+
+    for _, _, media_type in sorted(candidates):
+        if media_type in SUPPORTED_MEDIA_TYPES:
+            return media_type
+        if media_type in ("*/*", "application/*"):
+            return JSON_MEDIA_TYPE
+
+    return JSON_MEDIA_TYPE
+
+
+def _to_int16_adc(samples, gain, baseline):
+    adc = np.round(samples * gain + baseline)
+    missing = np.isnan(adc)
+    valid = adc[~missing]
+    if valid.size and (valid.min() <= INT16_NAN_VALUE or valid.max() > 32767):
+        return None
+    adc[missing] = INT16_NAN_VALUE
+    return adc.astype("<i2")
+
+
+def encode_channels(ecg_record, encoding):
+    """
+    Encodes every channel as raw little-endian bytes: int16 ADC values with
+    their gain and baseline (physical = (adc - baseline) / gain), or float32
+    physical values. Channels that do not fit int16 fall back to float32.
+    """
+    channels = []
+    for idx, label in enumerate(ecg_record.sig_name):
+        samples = ecg_record.p_signal[:, idx]
+        gain = ecg_record.adc_gain[idx]
+        baseline = ecg_record.baseline[idx]
+
+        data = None
+        if encoding == "int16":
+            data = _to_int16_adc(samples, gain, baseline)
+        if data is None:
+            channels.append(
+                {"label": label, "dtype": "float32", "data": samples.astype("<f4")}
+            )
+        else:
+            channels.append({
+                "label": label,
+                "dtype": "int16",
+                "gain": gain,
+                "baseline": baseline,
+                "nan_value": INT16_NAN_VALUE,
+                "data": data,
+            })
+
+    return channels
+
+
+def convert_record_to_base64_dict(ecg_record, encoding):
+    result = []
+    for channel in encode_channels(ecg_record, encoding):
+        data = channel.pop("data")
+        channel["samples"] = base64.b64encode(data.tobytes()).decode("ascii")
+        result.append(channel)
+
+    return result
+
+
+def encode_frame(content, ecg_record, encoding="int16"):
+    """
+    Binary frame: the `FRAME_MAGIC` bytes, a little-endian uint32 header length,
+    a UTF-8 JSON header (`content` plus per-channel dtype, byte offset into the
+    samples section and sample count) and the channel samples. The header is
+    padded so that every channel starts at an 8-byte aligned offset and can be
+    viewed as a typed array in place.
+    """
+    header_channels = []
+    payload = bytearray()
+    for channel in encode_channels(ecg_record, encoding):
+        raw = channel.pop("data")
+        header_channels.append(
+            {**channel, "offset": len(payload), "length": len(raw)}
+        )
+        payload += raw.tobytes()
+        payload += bytes(-len(payload) % 8)
+
+    header = json.dumps({**content, "channels": header_channels}).encode("utf-8")
+    header += b" " * (-(len(FRAME_MAGIC) + 4 + len(header)) % 8)
+
+    return FRAME_MAGIC + struct.pack("<I", len(header)) + header + bytes(payload)
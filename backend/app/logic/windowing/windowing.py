@@ -0,0 +1,80 @@
+import math
+from dataclasses import dataclass
+
+from ..wfdb_converter.wfdb_json_converter import WDFDB_SAMPLES_PER_WINDOW
+
+# Largest window or range served with raw samples, per channel
+WINDOW_MAX_SIZE = 100_000
+# Ranges fetched in one request
+RANGE_MAX_COUNT = 32
+RANGE_UNITS = ("samples", "s")
+
+
+@dataclass(frozen=True)
+class WindowGrid:
+    """
+    Windows of `size` samples over a record of `sig_len` samples, each
+    starting `size - overlap` samples after the previous one. Windows are
+    computed on demand; as always, a window ends before the last sample.
+    """
+    sig_len: int
+    size: int = WDFDB_SAMPLES_PER_WINDOW
+    overlap: int = 0
+
+    def __post_init__(self):
+        if self.size <= 0 or not 0 <= self.overlap < self.size:
+            raise ValueError("Window overlap must be smaller than the window size")
+
+    @property
+    def step(self) -> int:
+        return self.size - self.overlap
+
+    def __len__(self) -> int:
+        last = self.sig_len - 1
+        if last <= 0:
+            return 0
+        # Windows after the first one reaching the end would be redundant
+        return 1 + max(0, -(-(last - self.size) // self.step))
+
+    @property
+    def max_index(self) -> int:
+        return len(self) - 1
+
+    def clamp(self, index: int) -> int:
+        return min(max(index, 0), self.max_index)
+
+    def __getitem__(self, index: int) -> tuple[int, int]:
+        count = len(self)
+        if index < 0:
+            index += count
+        if not 0 <= index < count:
+            raise IndexError(index)
+
+        sampfrom = index * self.step
+        return sampfrom, min(sampfrom + self.size, self.sig_len - 1)
+
+
+def parse_range(text: str, unit: str, fs: float) -> tuple[int, int | None]:
+    """
+    Parses `start:end` into sample indices. Either bound may be empty, for
+    the record start or end; in seconds when `unit` is "s".
+    """
+    start, separator, end = text.partition(":")
+    if not separator:
+        raise ValueError(f"Invalid range '{text}', expected start:end")
+
+    def to_sample(value: str, default):
+        value = value.strip()
+        if not value:
+            return default
+        if unit == "s":
+            seconds = float(value)
+            if not math.isfinite(seconds):
+                raise ValueError(f"Invalid range '{text}'")
+            return int(round(seconds * fs))
+        return int(value)
+
+    sampfrom, sampto = to_sample(start, 0), to_sample(end, None)
+    if sampfrom < 0 or (sampto is not None and sampto < sampfrom):
+        raise ValueError(f"Invalid range '{text}'")
+    return sampfrom, sampto
@@ -0,0 +1,188 @@
+import asyncio
+import importlib
+import multiprocessing
+import os
+import sys
+import threading
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+from prometheus_client import Gauge
+
+from ..metrics.metrics import record_collected, run_collecting_metrics
+
+WORKER_PROCESSES = int(os.environ.get("EKG_WORKER_PROCESSES", os.cpu_count() or 1))
+WORKER_QUEUE_SIZE = int(os.environ.get("EKG_WORKER_QUEUE_SIZE", 2 * WORKER_PROCESSES))
+WORKER_TIMEOUT = float(os.environ.get("EKG_WORKER_TIMEOUT", 60.0))
+
+# Imported by every worker as soon as it is spawned rather than by its first
+# job. The app process itself does not need most of them.
+WORKER_PRELOAD_MODULES = [
+    "scipy.signal",
+    "scipy.interpolate",
+    "app.logic.detector.detector",
+    "app.logic.ecg_digitizer.ecg_digitizer",
+    "app.logic.overview.overview_pyramid",
+]
+
+
+class WorkerPoolBusyError(Exception):
+    pass
+
+
+class WorkerPoolUnavailableError(Exception):
+    pass
+
+
+class WorkerPoolTimeoutError(WorkerPoolUnavailableError):
+    pass
+
+
+@dataclass(frozen=True)
+class SharedArraySpec:
+    name: str
+    shape: tuple
+    dtype: str
+
+
+class SharedArray:
+    """
+    Copies an array into a shared memory block, so that worker processes can
+    map it by name instead of receiving it pickled. The caller can read and
+    write it while they run; the block is released when the context exits.
+    """
+
+    def __init__(self, array):
+        array = np.ascontiguousarray(array)
+        self._shm = SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=self._shm.buf)[...] = array
+        self.spec = SharedArraySpec(self._shm.name, array.shape, array.dtype.str)
+
+    @property
+    def array(self) -> np.ndarray:
+        """A copy of the shared array as it is now."""
+        return self._view().copy()
+
+    def write(self, index, value):
+        self._view()[index] = value
+
+    def _view(self) -> np.ndarray:
+        return np.ndarray(self.spec.shape, dtype=self.spec.dtype, buffer=self._shm.buf)
+
+    def __enter__(self) -> SharedArraySpec:
+        return self.spec
+
+    def __exit__(self, *exc_info):
+        self._shm.close()
+        self._shm.unlink()
+
+
+def run_with_shared_array(fn, spec: SharedArraySpec, *args):
+    """Worker-side entry point calling `fn(array, *args)` on a shared array."""
+    if sys.version_info >= (3, 13):
+        shm = SharedMemory(name=spec.name, track=False)
+    else:
+        shm = SharedMemory(name=spec.name)
+    try:
+        array = np.ndarray(spec.shape, dtype=spec.dtype, buffer=shm.buf)
+        try:
+            return fn(array, *args)
+        except BaseException as e:
+            # Its frames would keep views of the block, which then cannot close
+            traceback.clear_frames(e.__traceback__)
+            raise
+        finally:
+            del array
+    finally:
+        shm.close()
+
+
+def _preload_modules(module_names):
+    for module_name in module_names:
+        importlib.import_module(module_name)
+
+
+class WorkerPool:
+    """
+    Process pool for CPU-bound pipeline stages. At most `max_workers` jobs
+    run at once and at most `max_queue` more wait for a worker; anything
+    beyond that is rejected immediately instead of piling up.
+    """
+
+    def __init__(self, max_workers, max_queue, timeout):
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self.timeout = timeout
+
+        self._executor = None
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    async def run(self, fn, *args, timeout=None):
+        """
+        Runs `fn(*args)` in a worker. Stages the job times in the worker are
+        recorded as if they had run in the calling request.
+        """
+        with self._lock:
+            if self._in_flight >= self.max_workers + self.max_queue:
+                raise WorkerPoolBusyError()
+            self._in_flight += 1
+
+        try:
+            future = self._get_executor().submit(run_collecting_metrics, fn, *args)
+        except (BrokenProcessPool, RuntimeError) as e:
+            self._release()
+            self.shutdown()
+            raise WorkerPoolUnavailableError() from e
+        future.add_done_callback(self._release)
+
+        try:
+            result, stages, observations = await asyncio.wait_for(
+                asyncio.wrap_future(future), timeout or self.timeout
+            )
+        except asyncio.TimeoutError as e:
+            future.cancel()
+            raise WorkerPoolTimeoutError() from e
+        except BrokenProcessPool as e:
+            self.shutdown()
+            raise WorkerPoolUnavailableError() from e
+
+        record_collected(stages, observations)
+        return result
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_preload_modules,
+                    initargs=(WORKER_PRELOAD_MODULES,),
+                )
+            return self._executor
+
+    def _release(self, *_):
+        with self._lock:
+            self._in_flight -= 1
+
+
+worker_pool = WorkerPool(WORKER_PROCESSES, WORKER_QUEUE_SIZE, WORKER_TIMEOUT)
+
+WORKER_POOL_IN_FLIGHT = Gauge(
+    "ekg_worker_pool_in_flight", "Jobs running or queued in the worker pool."
+)
+WORKER_POOL_IN_FLIGHT.set_function(lambda: worker_pool.in_flight)
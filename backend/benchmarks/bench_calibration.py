@@ -0,0 +1,141 @@
+"""
+Benchmark of the calibrate -> baseline -> resample chain of the digitizer.
+
+Traces rendered ECG strips at several resolutions and times the array chain
+against the previous list-based one (list comprehensions and an `interp1d`
+object), checking that both give the same signal. The polyphase resampling
+option is timed alongside.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_calibration [--repeat N]
+"""
+
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from app.logic.ecg_digitizer.modules.image_processing import preprocess_image
+from app.logic.ecg_digitizer.modules.signal_processing import (
+    calibrate_signal,
+    detect_grid_size,
+    extract_signal,
+    resample_signal,
+)
+from app.logic.ecg_digitizer.modules.wfdb_utils import create_ecg_record
+
+from .render_ecg import render_ecg_image
+from .synthetic_ecg import generate_ecg
+
+DURATION = 30.0
+FS = 500
+RESOLUTIONS = [4, 8, 12]
+# Above the rate of every resolution, so every strip is resampled
+TARGET_RATE = 500
+
+
+def calibrate_signal_lists(x_values, y_values, small_grid_size, time_per_grid=0.04, mv_per_grid=0.1):
+    time_values = [x * (time_per_grid / small_grid_size) for x in x_values]
+    amplitude_values = [y * (mv_per_grid / small_grid_size) for y in y_values]
+
+    amplitude_values = _correct_baseline_lists(amplitude_values)
+
+    return time_values, amplitude_values
+
+
+def _correct_baseline_lists(amplitude_values):
+    if not amplitude_values:
+        return amplitude_values
+
+    hist, bin_edges = np.histogram(amplitude_values, bins=50)
+    most_common_bin = np.argmax(hist)
+    baseline_estimate1 = (bin_edges[most_common_bin] + bin_edges[most_common_bin + 1]) / 2
+
+    amplitude_array = np.array(amplitude_values)
+    derivatives = np.abs(np.diff(amplitude_array))
+    flat_threshold = np.percentile(derivatives, 30)
+    flat_segments = derivatives < flat_threshold
+
+    if np.sum(flat_segments) > len(amplitude_values) * 0.1:
+        baseline_estimate2 = np.mean(amplitude_array[:-1][flat_segments])
+    else:
+        baseline_estimate2 = np.median(amplitude_values)
+
+    baseline = 0.4 * baseline_estimate1 + 0.6 * baseline_estimate2
+
+    return [a - baseline for a in amplitude_values]
+
+
+def resample_signal_interp1d(time_values, amplitude_values, target_sample_rate):
+    from scipy import interpolate
+
+    duration = time_values[-1] - time_values[0]
+    num_samples = int(duration * target_sample_rate)
+    f = interpolate.interp1d(
+        time_values, amplitude_values,
+        kind='linear', bounds_error=False, fill_value='extrapolate'
+    )
+    new_time_values = np.linspace(time_values[0], time_values[-1], num_samples)
+    return new_time_values, f(new_time_values)
+
+
+def chain_lists(x_values, y_values, small_grid_size):
+    time_values, amplitude_values = calibrate_signal_lists(x_values, y_values, small_grid_size)
+    _, amplitude_values = resample_signal_interp1d(time_values, amplitude_values, TARGET_RATE)
+    return create_ecg_record(np.array(amplitude_values).reshape(-1, 1), TARGET_RATE)
+
+
+def chain_arrays(x_values, y_values, small_grid_size, method="linear"):
+    time_values, amplitude_values = calibrate_signal(x_values, y_values, small_grid_size)
+    _, amplitude_values = resample_signal(time_values, amplitude_values, TARGET_RATE, method)
+    return create_ecg_record(amplitude_values, TARGET_RATE)
+
+
+def _best_time(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    signal, _ = generate_ecg(DURATION, FS, leads=1, seed=1)
+
+    print(f"{'px/mm':>5} {'columns':>8} {'lists [ms]':>10} {'arrays [ms]':>11} "
+          f"{'speedup':>8} {'polyphase [ms]':>14}")
+
+    for px_per_mm in RESOLUTIONS:
+        image = render_ecg_image(signal[:, 0], FS, px_per_mm=px_per_mm)
+        binary_image, original_image = preprocess_image(
+            cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        )
+        small_grid_size, _ = detect_grid_size(original_image)
+        x_values, y_values = extract_signal(binary_image)
+
+        lists_time, expected = _best_time(
+            lambda: chain_lists(x_values, y_values, small_grid_size), args.repeat
+        )
+        arrays_time, actual = _best_time(
+            lambda: chain_arrays(x_values, y_values, small_grid_size), args.repeat
+        )
+        polyphase_time, _ = _best_time(
+            lambda: chain_arrays(x_values, y_values, small_grid_size, "polyphase"),
+            args.repeat,
+        )
+        if not np.allclose(expected.p_signal, actual.p_signal, rtol=0, atol=1e-9):
+            raise AssertionError("Array chain output differs from the list-based one")
+
+        print(f"{px_per_mm:>5} {len(x_values):>8} {lists_time * 1000:>10.2f} "
+              f"{arrays_time * 1000:>11.2f} {lists_time / arrays_time:>7.1f}x "
+              f"{polyphase_time * 1000:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Benchmark of `clean_and_normalize_signal` on speckle-heavy binary images.
+
+Compares the area lookup-table filter with the previous per-component loop
+and checks that both produce the same image.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_clean_and_normalize [--repeat N]
+"""
+
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from app.logic.ecg_digitizer.modules.image_processing import clean_and_normalize_signal
+
+
+def clean_and_normalize_signal_per_component(image, min_size=5):
+    num_labels, labels, stats, _ = cv2.connectedComponentsWithStats(
+        image, connectivity=8
+    )
+
+    cleaned = np.zeros_like(image)
+    for i in range(1, num_labels):
+        if stats[i, cv2.CC_STAT_AREA] >= min_size:
+            cleaned[labels == i] = 255
+
+    if np.mean(cleaned) > 127:
+        return cv2.bitwise_not(cleaned)
+    return cleaned
+
+
+def make_speckle_image(height, width, speckle_density, seed=0):
+    rng = np.random.default_rng(seed)
+    image = np.zeros((height, width), dtype=np.uint8)
+
+    # Isolated speckles of 1-3 px and a few larger blobs that survive the filter
+    image[rng.random((height, width)) < speckle_density] = 255
+    for _ in range(int(height * width * speckle_density * 0.05)):
+        x, y = rng.integers(0, width), rng.integers(0, height)
+        cv2.circle(image, (int(x), int(y)), int(rng.integers(2, 5)), 255, -1)
+
+    # A trace running across the whole strip
+    xs = np.arange(width)
+    ys = (height / 2 + height / 4 * np.sin(xs / 40)).astype(np.int32)
+    cv2.polylines(image, [np.stack([xs, ys], axis=1).reshape(-1, 1, 2)], False, 255, 2)
+
+    return image
+
+
+def _best_time(fn, image, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(image)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{'size':>11} {'density':>8} {'components':>10} "
+          f"{'loop [ms]':>10} {'lookup [ms]':>11} {'speedup':>8}")
+
+    for height, width in [(600, 2400), (1200, 6000)]:
+        for density in (0.001, 0.01, 0.03):
+            image = make_speckle_image(height, width, density)
+            num_labels = cv2.connectedComponents(image, connectivity=8)[0]
+
+            loop_time, expected = _best_time(
+                clean_and_normalize_signal_per_component, image, args.repeat
+            )
+            lookup_time, actual = _best_time(
+                clean_and_normalize_signal, image, args.repeat
+            )
+            if not np.array_equal(expected, actual):
+                raise AssertionError("Lookup-table filter output differs from the loop")
+
+            print(f"{height:>5}x{width:<5} {density:>8} {num_labels - 1:>10} "
+                  f"{loop_time * 1000:>10.1f} {lookup_time * 1000:>11.1f} "
+                  f"{loop_time / lookup_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
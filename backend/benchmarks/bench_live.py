@@ -0,0 +1,159 @@
+"""
+Replay benchmark of the live monitoring WebSocket.
+
+Streams a synthetic record (or a WFDB one) over many concurrent
+connections at N times real time and measures, for every connection:
+  - update latency: from sending the frame with the last sample an update
+    covers to receiving the update,
+  - event latency: from sending the frame with the last sample of an event
+    to receiving the event,
+  - event delay: the signal time between the end of an event and the last
+    sample received when it was reported.
+
+Without --url, the app is served in-process with uvicorn.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_live [--url ws://HOST/ekg/live] [--connections N]
+        [--speed N] [--duration S] [--leads N] [--frame S] [--record BASE_PATH]
+"""
+
+import argparse
+import asyncio
+import json
+import socket
+import statistics
+import threading
+import time
+from urllib.parse import urlencode
+
+import numpy as np
+
+from app.logic.ecg_record.ecg_record import ECGRecord
+
+from .synthetic_ecg import generate_ecg
+
+FS = 250
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else float("nan")
+
+
+def serve_app():
+    """Starts the app on a free local port and returns its live monitoring URL."""
+    import uvicorn
+
+    from app.app import app
+
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    )
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"ws://127.0.0.1:{port}/ekg/live"
+
+
+async def replay(url, signal, fs, speed, frame_samples):
+    """Streams `signal` over one connection and returns its latency samples."""
+    import websockets
+
+    frames = [
+        signal[start:start + frame_samples].astype("<f4").tobytes()
+        for start in range(0, len(signal), frame_samples)
+    ]
+    # Send time of every frame, NaN until sent
+    sent = np.full(len(frames), np.nan)
+    stats = {"update_latency": [], "event_latency": [], "event_delay": [], "events": 0}
+
+    def sent_at(sample):
+        return sent[min(int(sample) // frame_samples, len(frames) - 1)]
+
+    query = urlencode({"fs": fs, "leads": signal.shape[1]})
+    async with websockets.connect(f"{url}?{query}", max_size=None) as websocket:
+        json.loads(await websocket.recv())
+
+        async def send():
+            start = time.perf_counter()
+            for index, frame in enumerate(frames):
+                delay = start + index * frame_samples / fs / speed - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                sent[index] = time.perf_counter()
+                await websocket.send(frame)
+            await websocket.send("end")
+
+        sender = asyncio.create_task(send())
+        async for message in websocket:
+            received_at = time.perf_counter()
+            update = json.loads(message)
+            stats["update_latency"].append(received_at - sent_at(update["received"] - 1))
+            for event in update["events"]:
+                stats["events"] += 1
+                stats["event_latency"].append(received_at - sent_at(event["end"]))
+                stats["event_delay"].append((update["received"] - event["end"]) / fs)
+        await sender
+
+    return stats
+
+
+async def run(url, signal, fs, connections, speed, frame_samples):
+    results = await asyncio.gather(*(
+        replay(url, signal, fs, speed, frame_samples) for _ in range(connections)
+    ))
+    merged = {key: [] for key in ("update_latency", "event_latency", "event_delay")}
+    for stats in results:
+        for key in merged:
+            merged[key].extend(stats[key])
+    merged["events"] = [stats["events"] for stats in results]
+    return merged
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url")
+    parser.add_argument("--connections", type=int, default=50)
+    parser.add_argument("--speed", type=float, default=10.0)
+    parser.add_argument("--duration", type=float, default=120.0)
+    parser.add_argument("--leads", type=int, default=1)
+    parser.add_argument("--frame", type=float, default=0.2, help="Frame length in seconds")
+    parser.add_argument("--record", help="WFDB record to replay instead of a synthetic one")
+    args = parser.parse_args()
+
+    if args.record:
+        record = ECGRecord.from_wfdb(args.record)
+        signal, fs = record.p_signal, record.fs
+    else:
+        signal, _ = generate_ecg(args.duration, FS, leads=args.leads, seed=1)
+        fs = FS
+
+    url = args.url or serve_app()
+    frame_samples = max(1, int(args.frame * fs))
+
+    start = time.perf_counter()
+    stats = asyncio.run(
+        run(url, signal, fs, args.connections, args.speed, frame_samples)
+    )
+    elapsed = time.perf_counter() - start
+
+    print(f"{args.connections} connections, {len(signal) / fs:.0f} s of {signal.shape[1]}-lead "
+          f"signal at {args.speed:g}x real time in {elapsed:.1f} s")
+    print(f"events per connection: {statistics.mean(stats['events']):.1f} "
+          f"(min {min(stats['events'])}, max {max(stats['events'])})")
+    print(f"{'':>22} {'p50':>8} {'p95':>8} {'max':>8}")
+    for name, key, scale, unit in (
+        ("update latency", "update_latency", 1000, "ms"),
+        ("event latency", "event_latency", 1000, "ms"),
+        ("event delay", "event_delay", 1, "s"),
+    ):
+        values = stats[key]
+        print(f"{name + ' [' + unit + ']':>22} {percentile(values, 50) * scale:>8.1f} "
+              f"{percentile(values, 95) * scale:>8.1f} {max(values, default=float('nan')) * scale:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+"""
+Stage-level benchmarks of the ECG pipeline.
+
+Renders synthetic ECG strips and multi-strip pages at several resolutions
+and times every image stage on them, times the WFDB and detection stages on synthetic records of
+several lengths, and times both upload endpoints end to end. Results are
+written as JSON; with --baseline the run fails when any stage got slower
+than --max-regression times its baseline median.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_pipeline [--output FILE] [--repeat N] [--quick]
+        [--baseline FILE] [--max-regression RATIO]
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+from app.logic.calibration.calibration_profiles import (
+    CalibrationProfile,
+    profile_key,
+    verify_profile,
+)
+from app.logic.detector.detector import detect_sickness
+from app.logic.ecg_record.ecg_record import ECGRecord
+from app.logic.ecg_digitizer.modules.ecg_processor import ECGProcessor
+from app.logic.ecg_digitizer.modules.image_processing import load_image, preprocess_image
+from app.logic.ecg_digitizer.modules.lead_layout import detect_lead_bands
+from app.logic.ecg_digitizer.modules.signal_processing import (
+    calibrate_signal,
+    detect_grid_size,
+    extract_signal,
+    resample_signal,
+)
+from app.logic.ecg_digitizer.modules.wfdb_utils import save_to_wfdb
+from app.logic.wfdb_converter.wfdb_json_converter import (
+    WDFDB_SAMPLES_PER_WINDOW,
+    convert_wfdb_to_dict,
+)
+
+from .render_ecg import write_ecg_image
+from .synthetic_ecg import generate_ecg, write_synthetic_record
+
+IMAGE_DURATION = 10.0
+IMAGE_FS = 500
+IMAGE_RESOLUTIONS = [4, 8, 12]
+IMAGE_FORMATS = ["png", "jpg"]
+PAGE_LEADS = 6
+
+RECORD_FS = 250
+RECORD_DURATIONS = [60.0, 600.0, 1800.0]
+RECORD_LEADS = [1, 2, 12]
+
+QUICK_IMAGE_RESOLUTIONS = [8]
+QUICK_RECORD_DURATIONS = [60.0]
+
+
+def measure(fn, repeat, warmup=1):
+    for _ in range(warmup):
+        fn()
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+
+    return {
+        "median_s": statistics.median(timings),
+        "min_s": min(timings),
+        "max_s": max(timings),
+        "repeats": repeat,
+    }
+
+
+def bench_image_stages(workdir, px_per_mm, image_format, repeat):
+    signal, _ = generate_ecg(IMAGE_DURATION, IMAGE_FS, leads=1, seed=1)
+    image_path = workdir / f"strip_{px_per_mm}.{image_format}"
+    write_ecg_image(image_path, signal[:, 0], IMAGE_FS, px_per_mm=px_per_mm)
+
+    binary_image, original_image = preprocess_image(str(image_path))
+    small_grid_size, _ = detect_grid_size(original_image)
+    x_values, y_values = extract_signal(binary_image)
+    time_values, amplitude_values = calibrate_signal(
+        x_values, y_values, small_grid_size
+    )
+    output_dir = workdir / "wfdb"
+    profile = CalibrationProfile(
+        profile_id=profile_key(original_image),
+        width=original_image.shape[1],
+        height=original_image.shape[0],
+        small_grid_size=small_grid_size,
+        sample_rate=IMAGE_FS,
+    )
+
+    key = f"{image_format},{px_per_mm}px/mm,{original_image.shape[1]}x{original_image.shape[0]}"
+    return {
+        f"preprocess_image[{key}]": measure(
+            lambda: preprocess_image(str(image_path)), repeat
+        ),
+        f"detect_grid_size[{key}]": measure(
+            lambda: detect_grid_size(original_image), repeat
+        ),
+        f"calibration_profile_lookup[{key}]": measure(
+            lambda: verify_profile(original_image, profile)
+            and profile_key(original_image),
+            repeat,
+        ),
+        f"extract_signal[{key}]": measure(lambda: extract_signal(binary_image), repeat),
+        f"calibrate_signal[{key}]": measure(
+            lambda: calibrate_signal(x_values, y_values, small_grid_size), repeat
+        ),
+        f"resample_signal[{key}]": measure(
+            lambda: resample_signal(time_values, amplitude_values, IMAGE_FS), repeat
+        ),
+        f"save_to_wfdb[{key}]": measure(
+            lambda: save_to_wfdb(amplitude_values, IMAGE_FS, output_dir, "strip"),
+            repeat,
+        ),
+    }
+
+
+def bench_page_stages(workdir, px_per_mm, repeat):
+    signal, _ = generate_ecg(IMAGE_DURATION, IMAGE_FS, leads=PAGE_LEADS, seed=1)
+    image_path = workdir / f"page_{px_per_mm}.png"
+    write_ecg_image(image_path, signal, IMAGE_FS, px_per_mm=px_per_mm)
+
+    image = load_image(str(image_path))
+    binary_image, _ = preprocess_image(image)
+    small_grid_size, _ = detect_grid_size(image)
+    serial = ECGProcessor(threads=1)
+    parallel = ECGProcessor()
+
+    key = f"{PAGE_LEADS} leads,{px_per_mm}px/mm,{image.shape[1]}x{image.shape[0]}"
+    return {
+        f"detect_lead_bands[{key}]": measure(
+            lambda: detect_lead_bands(binary_image, small_grid_size), repeat
+        ),
+        f"digitize_page_serial[{key}]": measure(
+            lambda: serial.process_to_record(image), repeat
+        ),
+        f"digitize_page[{key}]": measure(
+            lambda: parallel.process_to_record(image), repeat
+        ),
+    }
+
+
+def bench_record_stages(workdir, duration, leads, repeat):
+    base_path = write_synthetic_record(
+        workdir / "records", f"synthetic_{int(duration)}s_{leads}l",
+        duration, RECORD_FS, leads,
+    )
+    window = (0, WDFDB_SAMPLES_PER_WINDOW)
+    middle = int(duration * RECORD_FS) // 2
+
+    key = f"{int(duration)}s,{leads}lead,{RECORD_FS}Hz"
+    return {
+        f"read_window[{key}]": measure(
+            lambda: ECGRecord.from_wfdb(
+                base_path, middle, middle + WDFDB_SAMPLES_PER_WINDOW
+            ),
+            repeat,
+        ),
+        f"convert_wfdb_to_dict[{key}]": measure(
+            lambda: convert_wfdb_to_dict(*window, tmp_dat_path=base_path.with_suffix(".dat")),
+            repeat,
+        ),
+        f"detect_sickness[{key}]": measure(
+            lambda: detect_sickness(*window, 0, base_path.with_suffix(".hea")),
+            repeat,
+        ),
+    }
+
+
+def bench_endpoints(workdir, repeat):
+    """
+    Times both upload endpoints through the ASGI app. Cold runs change the
+    content hash on every request (image filename, .xws content) so each one
+    is fully processed; warm runs repeat an identical upload.
+    """
+    os.environ.setdefault("EKG_RECORD_STORE_DIR", str(workdir / "store"))
+
+    from fastapi.testclient import TestClient
+
+    from app.app import app
+
+    signal, _ = generate_ecg(IMAGE_DURATION, IMAGE_FS, leads=1, seed=2)
+    image_bytes = Path(
+        write_ecg_image(workdir / "endpoint.png", signal[:, 0], IMAGE_FS)
+    ).read_bytes()
+    base_path = write_synthetic_record(
+        workdir / "endpoint", "endpoint", 600.0, RECORD_FS, leads=2
+    )
+    hea_bytes = base_path.with_suffix(".hea").read_bytes()
+    dat_bytes = base_path.with_suffix(".dat").read_bytes()
+
+    counter = iter(range(10**9))
+
+    def post_image(cold):
+        filename = f"strip_{next(counter)}.png" if cold else "strip.png"
+        response = client.post(
+            "/ekg/image",
+            files={"image_file": (filename, image_bytes, "image/png")},
+        )
+        response.raise_for_status()
+
+    def post_signal(cold):
+        xws_bytes = str(next(counter)).encode() if cold else b""
+        response = client.post(
+            "/ekg/signal",
+            files={
+                "hea_file": ("endpoint.hea", hea_bytes),
+                "dat_file": ("endpoint.dat", dat_bytes),
+                "xws_file": ("endpoint.xws", xws_bytes),
+            },
+        )
+        response.raise_for_status()
+
+    with TestClient(app) as client:
+        return {
+            "endpoint_image[cold]": measure(lambda: post_image(True), repeat),
+            "endpoint_image[warm]": measure(lambda: post_image(False), repeat),
+            "endpoint_signal[cold]": measure(lambda: post_signal(True), repeat),
+            "endpoint_signal[warm]": measure(lambda: post_signal(False), repeat),
+        }
+
+
+def compare(results, baseline, max_regression):
+    regressions = []
+    for name, result in sorted(results.items()):
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        ratio = result["median_s"] / previous["median_s"]
+        flag = " REGRESSION" if ratio > max_regression else ""
+        print(f"  {name:<60} {ratio:6.2f}x{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--quick", action="store_true")
+    parser.add_argument("--baseline")
+    parser.add_argument("--max-regression", type=float, default=1.25)
+    parser.add_argument("--skip-endpoints", action="store_true")
+    args = parser.parse_args()
+
+    resolutions = QUICK_IMAGE_RESOLUTIONS if args.quick else IMAGE_RESOLUTIONS
+    durations = QUICK_RECORD_DURATIONS if args.quick else RECORD_DURATIONS
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        workdir = Path(tmpdir)
+
+        for image_format in IMAGE_FORMATS:
+            for px_per_mm in resolutions:
+                results.update(
+                    bench_image_stages(workdir, px_per_mm, image_format, args.repeat)
+                )
+        for px_per_mm in resolutions:
+            results.update(bench_page_stages(workdir, px_per_mm, args.repeat))
+        for duration in durations:
+            for leads in RECORD_LEADS:
+                results.update(bench_record_stages(workdir, duration, leads, args.repeat))
+        if not args.skip_endpoints:
+            results.update(bench_endpoints(workdir, args.repeat))
+
+    for name, result in results.items():
+        print(f"{name:<62} {result['median_s'] * 1000:10.2f} ms")
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+    Path(args.output).write_text(json.dumps(report, indent=2))
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())["results"]
+        print(f"Comparison with {args.baseline} (max {args.max_regression}x):")
+        regressions = compare(results, baseline, args.max_regression)
+        if regressions:
+            print(f"{len(regressions)} stage(s) regressed")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Startup benchmarks: app import time, worker spawn, pipeline warm-up and the
+first image digitization with and without warm-up.
+
+Every probe runs in a fresh interpreter, so nothing is cached between
+measurements. For a per-module breakdown of the import use
+`python -X importtime -c "import app.app"`.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_startup [--output FILE] [--repeat N]
+        [--baseline FILE] [--max-regression RATIO]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+# Modules the app process should not load until they are needed
+LAZY_MODULES = [
+    "matplotlib", "matplotlib.pyplot", "scipy.signal", "scipy.interpolate", "cv2"
+]
+
+
+def probe_import_app():
+    start = time.perf_counter()
+    import app.app  # noqa: F401
+
+    elapsed = time.perf_counter() - start
+    return elapsed, {"loaded": [name for name in LAZY_MODULES if name in sys.modules]}
+
+
+def probe_worker_spawn():
+    from app.logic.worker_pool.worker_pool import worker_pool
+
+    start = time.perf_counter()
+    asyncio.run(worker_pool.run(os.getpid))
+    elapsed = time.perf_counter() - start
+    worker_pool.shutdown()
+    return elapsed, {}
+
+
+def probe_warmup():
+    from app.logic.warmup.warmup import Warmup
+    from app.logic.worker_pool.worker_pool import worker_pool
+
+    warmup = Warmup(enabled=True)
+    asyncio.run(warmup.run())
+    worker_pool.shutdown()
+    return warmup.duration, {"workers": worker_pool.max_workers}
+
+
+def _first_image(warm):
+    from app.logic.ecg_digitizer.ecg_digitizer import digitize_image_buffer
+    from app.logic.warmup.warmup import (
+        WARMUP_FS,
+        Warmup,
+        synthetic_image,
+        synthetic_signal,
+    )
+    from app.logic.worker_pool.worker_pool import (
+        SharedArray,
+        run_with_shared_array,
+        worker_pool,
+    )
+
+    image_buffer = synthetic_image(synthetic_signal(duration=30.0), WARMUP_FS)
+
+    async def digitize():
+        if warm:
+            await Warmup(enabled=True).run()
+        with SharedArray(image_buffer) as image_spec:
+            start = time.perf_counter()
+            await worker_pool.run(
+                run_with_shared_array, digitize_image_buffer, image_spec
+            )
+            return time.perf_counter() - start
+
+    elapsed = asyncio.run(digitize())
+    worker_pool.shutdown()
+    return elapsed, {}
+
+
+PROBES = {
+    "import_app": probe_import_app,
+    "worker_spawn": probe_worker_spawn,
+    "warmup": probe_warmup,
+    "first_image_cold": lambda: _first_image(warm=False),
+    "first_image_warm": lambda: _first_image(warm=True),
+}
+
+
+def run_probe(name):
+    result = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_startup", "--probe", name],
+        cwd=Path(__file__).resolve().parent.parent,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--output", default="bench_startup.json")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--baseline")
+    parser.add_argument("--max-regression", type=float, default=1.25)
+    parser.add_argument("--probe", choices=sorted(PROBES), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.probe:
+        elapsed, details = PROBES[args.probe]()
+        print(json.dumps({"seconds": elapsed, **details}))
+        return
+
+    results = {}
+    for name in PROBES:
+        runs = [run_probe(name) for _ in range(args.repeat)]
+        timings = [run["seconds"] for run in runs]
+        details = {key: value for key, value in runs[-1].items() if key != "seconds"}
+        results[name] = {
+            "median_s": statistics.median(timings),
+            "min_s": min(timings),
+            "max_s": max(timings),
+            "repeats": args.repeat,
+            **details,
+        }
+        print(f"{name:<20} {results[name]['median_s'] * 1000:10.2f} ms  {details or ''}")
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+    Path(args.output).write_text(json.dumps(report, indent=2))
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        from .bench_pipeline import compare
+
+        baseline = json.loads(Path(args.baseline).read_text())["results"]
+        print(f"Comparison with {args.baseline} (max {args.max_regression}x):")
+        regressions = compare(results, baseline, args.max_regression)
+        if regressions:
+            print(f"{len(regressions)} stage(s) regressed")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
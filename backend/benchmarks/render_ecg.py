@@ -0,0 +1,31 @@
+"""
+Renders signals onto a standard ECG paper grid, one strip per lead.
+
+Paper speed is 25 mm/s and gain 10 mm/mV, so one small (1 mm) square is
+0.04 s by 0.1 mV, which matches the digitizer defaults.
+"""
+
+import cv2
+import numpy as np
+
+from app.logic.ecg_paper.ecg_paper import render_ecg_image
+
+
+def render_ecg_page(signals, fs, px_per_mm=8, **kwargs):
+    """Returns the leads of a `(samples, leads)` array as strips under each other."""
+    return np.vstack([
+        render_ecg_image(signal, fs, px_per_mm, **kwargs) for signal in np.asarray(signals).T
+    ])
+
+
+def write_ecg_image(path, signal, fs, px_per_mm=8, jpeg_quality=90, **kwargs):
+    if np.ndim(signal) == 2:
+        image = render_ecg_page(signal, fs, px_per_mm, **kwargs)
+    else:
+        image = render_ecg_image(signal, fs, px_per_mm, **kwargs)
+    params = []
+    if str(path).lower().endswith((".jpg", ".jpeg")):
+        params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]
+    if not cv2.imwrite(str(path), image, params):
+        raise ValueError(f"Unable to write image to {path}")
+    return path
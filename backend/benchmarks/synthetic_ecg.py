@@ -0,0 +1,108 @@
+"""
+Synthetic ECG generator for benchmarks.
+
+Beats are placed by integrating a piecewise-constant heart-rate profile, so
+bradycardia and tachycardia episodes appear exactly where the profile puts
+them. Every beat is a sum of Gaussian P, Q, R, S and T waves.
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+
+from app.logic.ecg_record.ecg_record import ECGRecord
+
+# (offset from R in seconds, width in seconds, amplitude in mV)
+PQRST_WAVES = [
+    (-0.20, 0.025, 0.15),
+    (-0.03, 0.010, -0.10),
+    (0.00, 0.012, 1.20),
+    (0.03, 0.010, -0.25),
+    (0.25, 0.040, 0.30),
+]
+
+# Relative amplitude of every lead, cycled when more leads are requested
+LEAD_GAINS = [1.0, 0.8, 0.6, 0.9, -0.5, 0.7, 0.4, 1.1, 1.2, 1.0, 0.9, 0.8]
+
+
+@dataclass
+class HeartRateSegment:
+    duration: float
+    bpm: float
+
+
+def default_heart_rate_profile(duration):
+    """Normal rhythm with one bradycardia and one tachycardia episode."""
+    episode = min(20.0, duration / 6)
+    normal = (duration - 2 * episode) / 3
+    return [
+        HeartRateSegment(normal, 72),
+        HeartRateSegment(episode, 45),
+        HeartRateSegment(normal, 75),
+        HeartRateSegment(episode, 130),
+        HeartRateSegment(normal, 70),
+    ]
+
+
+def beat_times(profile):
+    times = []
+    t = 0.0
+    segment_start = 0.0
+    for segment in profile:
+        segment_end = segment_start + segment.duration
+        while t < segment_end:
+            times.append(t)
+            t += 60.0 / segment.bpm
+        segment_start = segment_end
+    return np.asarray(times)
+
+
+def generate_ecg(duration, fs, leads=1, profile=None, noise=0.02, wander=0.05, seed=0):
+    """Returns a `(samples, leads)` signal in mV and the R-peak times."""
+    rng = np.random.default_rng(seed)
+    profile = profile or default_heart_rate_profile(duration)
+
+    n_samples = int(duration * fs)
+    t = np.arange(n_samples) / fs
+    beats = beat_times(profile) + 0.3
+    beats = beats[beats < duration]
+
+    beat_wave = np.zeros(n_samples)
+    for offset, width, amplitude in PQRST_WAVES:
+        for start in range(0, len(beats), 256):
+            centres = beats[start:start + 256] + offset
+            first = max(0, int((centres.min() - 4 * width) * fs))
+            last = min(n_samples, int((centres.max() + 4 * width) * fs) + 1)
+            segment = t[first:last, None] - centres[None, :]
+            beat_wave[first:last] += amplitude * np.exp(
+                -0.5 * (segment / width) ** 2
+            ).sum(axis=1)
+
+    signal = np.empty((n_samples, leads))
+    for lead in range(leads):
+        gain = LEAD_GAINS[lead % len(LEAD_GAINS)]
+        phase = rng.uniform(0, 2 * np.pi)
+        signal[:, lead] = (
+            gain * beat_wave
+            + wander * np.sin(2 * np.pi * 0.25 * t + phase)
+            + noise * rng.standard_normal(n_samples)
+        )
+
+    return signal, beats
+
+
+def generate_record(duration, fs, leads=1, profile=None, seed=0) -> ECGRecord:
+    signal, _ = generate_ecg(duration, fs, leads, profile, seed=seed)
+    return ECGRecord(signal, fs, [f"ECG {lead + 1}" for lead in range(leads)])
+
+
+def write_synthetic_record(
+    output_dir, record_name, duration, fs, leads=1, profile=None, seed=0
+):
+    """Writes a synthetic WFDB record (plus an empty .xws) and returns its path."""
+    record = generate_record(duration, fs, leads, profile, seed)
+    base_path = record.to_wfdb(
+        output_dir, record_name, comments=["Synthetic ECG for benchmarks"]
+    )
+    base_path.with_suffix(".xws").write_bytes(b"")
+    return base_path
@@ -0,0 +1,161 @@
+import numpy as np
+import pytest
+
+from app.logic.detector.detector import (
+    analyze_record,
+    compute_heart_rate,
+    compute_rr_features,
+    compute_rr_intervals,
+    detect_asystole,
+    detect_bradycardia,
+    detect_pauses,
+    detect_premature_beats,
+    detect_r_peaks,
+    detect_tachycardia,
+    fuse_r_peaks,
+)
+from benchmarks.synthetic_ecg import generate_ecg
+
+FS = 250
+
+
+def test_fuse_r_peaks_drops_peak_seen_by_one_of_two_leads():
+    lead_0 = np.array([100, 300, 500, 700])
+    lead_1 = np.array([102, 298, 420, 501, 699])
+
+    beats, support = fuse_r_peaks([lead_0, lead_1], FS)
+
+    np.testing.assert_array_equal(beats, [101, 299, 500, 700])
+    assert support.all()
+
+
+def test_fuse_r_peaks_keeps_majority_of_three_leads():
+    lead_0 = np.array([100, 300])
+    lead_1 = np.array([101, 300, 420])
+    lead_2 = np.array([300, 421])
+
+    beats, support = fuse_r_peaks([lead_0, lead_1, lead_2], FS)
+
+    np.testing.assert_array_equal(beats, [100, 300, 420])
+    np.testing.assert_array_equal(support.sum(axis=1), [2, 3, 2])
+
+
+def test_fuse_r_peaks_ignores_leads_without_peaks():
+    peaks = np.array([100, 300, 500])
+
+    beats, _ = fuse_r_peaks([peaks, np.empty(0, dtype=np.intp)], FS)
+
+    np.testing.assert_array_equal(beats, peaks)
+
+
+def test_fuse_r_peaks_keeps_one_lead_where_leads_disagree():
+    lead_0 = np.array([100, 250, 400, 700])
+    lead_1 = np.array([100, 320, 470, 701])
+
+    beats, support = fuse_r_peaks([lead_0, lead_1], FS)
+
+    np.testing.assert_array_equal(beats, [100, 250, 400, 700])
+    np.testing.assert_array_equal(support.sum(axis=1), [2, 1, 1, 2])
+
+
+def test_two_lead_fusion_opens_no_gaps():
+    fs = 360
+    signal, _ = generate_ecg(1800, fs, leads=2, seed=1800)
+
+    fused = analyze_record(signal, fs, ["lead 0", "lead 1"])
+    single = [analyze_record(signal[:, lead], fs) for lead in range(2)]
+
+    for analysis in single:
+        beats = len(analysis.r_peaks)
+        assert abs(len(fused.r_peaks) - beats) <= 0.01 * beats
+        assert fused.rr_intervals.max() <= analysis.rr_intervals.max()
+        for event_type in ("pause", "asystole"):
+            assert len(analysis.episodes[event_type][0]) == 0
+            assert len(fused.episodes[event_type][0]) == 0
+
+
+def test_analysis_uses_rate_window_and_thresholds():
+    signal, _ = generate_ecg(300, FS, seed=3)
+
+    def rate_events(**options):
+        episodes = analyze_record(signal, FS, **options).episodes
+        return len(episodes["bradycardia"][0]), len(episodes["tachycardia"][0])
+
+    bradycardia, tachycardia = rate_events()
+    assert bradycardia > 0
+    assert rate_events(bradycardia_threshold=40, tachycardia_threshold=200) == (0, 0)
+    assert rate_events(tachycardia_threshold=70)[1] > tachycardia
+    assert rate_events(window_duration=10.0) != (bradycardia, tachycardia)
+
+
+def beats_from_intervals(intervals):
+    return np.round(np.concatenate(([0.0], np.cumsum(intervals))) * FS).astype(np.intp)
+
+
+def test_premature_beat_needs_compensatory_pause():
+    intervals = [60 / 65] * 30 + [0.6, 1.25] + [60 / 65] * 10
+    beats = beats_from_intervals(intervals)
+
+    starts, ends = detect_premature_beats(compute_rr_features(beats, FS))
+
+    assert len(starts) == 1
+    assert starts[0] < beats[31] < ends[0]
+
+
+def test_rate_step_is_not_premature_beat():
+    beats = beats_from_intervals([60 / 65] * 30 + [60 / 90] * 30)
+
+    starts, _ = detect_premature_beats(compute_rr_features(beats, FS))
+
+    assert len(starts) == 0
+
+
+def test_pause_must_be_a_gap_in_the_leads():
+    beats = beats_from_intervals([0.8] * 10 + [2.5] + [0.8] * 10)
+    beat_in_gap = np.sort(np.append(beats, beats[10] + FS))
+
+    unfused = compute_rr_features(beats, FS)
+    confirmed = compute_rr_features(beats, FS, lead_peaks=[beats, beats])
+    disputed = compute_rr_features(beats, FS, lead_peaks=[beats, beat_in_gap])
+
+    assert len(detect_pauses(unfused)[0]) == 1
+    assert len(detect_pauses(confirmed)[0]) == 1
+    assert len(detect_pauses(disputed)[0]) == 0
+    assert len(detect_asystole(confirmed)[0]) == 0
+
+
+def loop_rate_onsets(times, hr, threshold, above, window_duration=3.0):
+    """The per-interval loop detect_bradycardia and detect_tachycardia replaced."""
+    onsets = []
+    for i in range(len(hr)):
+        in_window = (times >= times[i]) & (times <= times[i] + window_duration)
+        mean_hr = np.mean(hr[in_window])
+        if (mean_hr > threshold) if above else (mean_hr < threshold):
+            onsets.append(times[i])
+    return onsets
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_rate_onsets_match_loop(seed):
+    signal, _ = generate_ecg(300, FS, seed=seed)
+    beats = detect_r_peaks(signal[:, 0], FS)
+    times = beats[:-1] / FS
+    hr = compute_heart_rate(compute_rr_intervals(beats, FS))
+
+    bradycardia = detect_bradycardia(times, hr)
+    tachycardia = detect_tachycardia(times, hr)
+
+    assert bradycardia and bradycardia == loop_rate_onsets(times, hr, 60, above=False)
+    assert tachycardia == loop_rate_onsets(times, hr, 100, above=True)
+
+
+def test_rate_onsets_match_loop_at_threshold():
+    # Intervals of exactly 1 s put the window means on the 60 bpm threshold
+    times = np.arange(20, dtype=float)
+    hr = np.full(20, 60.0)
+    hr[5] = 60.0 + 1e-9
+
+    assert detect_bradycardia(times, hr) == loop_rate_onsets(times, hr, 60, above=False)
+    assert detect_tachycardia(times, hr, threshold=60) == loop_rate_onsets(
+        times, hr, 60, above=True
+    )
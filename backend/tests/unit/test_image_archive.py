@@ -0,0 +1,35 @@
+import io
+import zipfile
+from types import SimpleNamespace
+
+import pytest
+
+from app.logic import ekg_endpoints_logic
+from app.logic.ekg_endpoints_logic import read_images_from_zip
+from app.logic.uploads.uploads import UploadTooLargeError
+
+
+def zip_upload(files):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, content in files.items():
+            archive.writestr(name, content)
+    buffer.seek(0)
+    return SimpleNamespace(file=buffer, filename="images.zip")
+
+
+def test_archive_images_are_read_on_demand():
+    upload = zip_upload({"a.png": b"png", "scans/b.jpg": b"jpeg", "notes.txt": b"text"})
+
+    with read_images_from_zip(upload) as images:
+        assert [name for name, _ in images] == ["a.png", "b.jpg"]
+        assert [read() for _, read in images] == [b"png", b"jpeg"]
+
+
+def test_archive_over_total_size_is_rejected(monkeypatch):
+    monkeypatch.setattr(ekg_endpoints_logic, "BATCH_MAX_ARCHIVE_BYTES", 10)
+    upload = zip_upload({"a.png": b"x" * 6, "b.png": b"x" * 6})
+
+    with pytest.raises(UploadTooLargeError):
+        with read_images_from_zip(upload):
+            pass
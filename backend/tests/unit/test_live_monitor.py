@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from app.logic.detector.detector import analyze_record
+from app.logic.live_monitor.live_monitor import LIVE_DETECTORS, LiveMonitor
+from benchmarks.synthetic_ecg import generate_ecg
+
+
+def replay(signal, fs, lead_names, frame_duration=0.2):
+    monitor = LiveMonitor(fs, lead_names)
+    frame = int(frame_duration * fs)
+    updates = [
+        monitor.feed(signal[start:start + frame]) for start in range(0, len(signal), frame)
+    ]
+    updates.append(monitor.flush())
+    return updates
+
+
+def events(event_list):
+    return sorted((event["type"], event["start"], event["end"]) for event in event_list)
+
+
+@pytest.mark.parametrize("duration, fs, leads, seed", [
+    (120, 250, 2, 0),
+    (300, 500, 2, 2),
+])
+def test_replayed_record_events_match_analysis(duration, fs, leads, seed):
+    signal, _ = generate_ecg(duration, fs, leads=leads, seed=seed)
+    lead_names = [f"lead {i}" for i in range(leads)]
+
+    updates = replay(signal, fs, lead_names)
+    analysis = analyze_record(signal, fs, lead_names)
+
+    beats = [beat for update in updates for beat in update["beats"]]
+    np.testing.assert_array_equal(beats, analysis.r_peaks)
+    expected = [
+        event for event in analysis.events_in_window(0, len(signal))
+        if event["type"] in LIVE_DETECTORS
+    ]
+    assert events(event for update in updates for event in update["events"]) == events(expected)
+    assert any(event["type"] == "bradycardia" for event in expected)
+
+
+def test_two_leads_open_no_gaps_in_fast_runs():
+    # The leads keep different beats of the 130 bpm run, which the live
+    # beats must not lose
+    fs = 360
+    signal, _ = generate_ecg(180, fs, leads=2, seed=6)
+
+    updates = replay(signal, fs, ["lead 0", "lead 1"])
+    single = analyze_record(signal[:, 0], fs)
+
+    beats = np.array([beat for update in updates for beat in update["beats"]])
+    assert np.diff(beats).max() <= np.diff(single.r_peaks).max()
+    assert abs(len(beats) - len(single.r_peaks)) <= 0.02 * len(single.r_peaks)
+    live_events = {event["type"] for update in updates for event in update["events"]}
+    assert not live_events & {"pause", "asystole"}
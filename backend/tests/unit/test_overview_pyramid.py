@@ -0,0 +1,26 @@
+import numpy as np
+
+from app.logic.ecg_record.ecg_record import ECGRecord
+from app.logic.overview.overview_pyramid import (
+    build_overview_pyramid,
+    build_wfdb_overview_pyramid,
+)
+from benchmarks.synthetic_ecg import generate_ecg
+
+
+def test_chunked_pyramid_matches_whole_signal(tmp_path):
+    signal, _ = generate_ecg(60, 250, leads=2, seed=0)
+    base_path = ECGRecord(signal, 250, ["lead 0", "lead 1"]).to_wfdb(tmp_path, "record")
+    record = ECGRecord.from_wfdb(base_path)
+
+    whole = build_overview_pyramid(record.p_signal, base_bucket=8, min_buckets=4)
+    chunked = build_wfdb_overview_pyramid(
+        base_path.with_suffix(".hea"), base_bucket=8, min_buckets=4, chunk_buckets=3
+    )
+
+    assert chunked.sig_len == whole.sig_len
+    assert len(chunked.levels) == len(whole.levels) > 1
+    for chunked_level, whole_level in zip(chunked.levels, whole.levels):
+        assert chunked_level.bucket_size == whole_level.bucket_size
+        np.testing.assert_array_equal(chunked_level.minimum, whole_level.minimum)
+        np.testing.assert_array_equal(chunked_level.maximum, whole_level.maximum)
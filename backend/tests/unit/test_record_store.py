@@ -0,0 +1,47 @@
+import numpy as np
+
+from app.logic.ecg_record.ecg_record import ECGRecord
+from app.logic.record_store.record_store import RecordStore
+
+
+class Derived:
+    nbytes = 1000
+
+
+def put_records(store, count, length=100):
+    for index in range(count):
+        signal = np.zeros((length, 1))
+        store.put_record(f"record-{index}", ECGRecord(signal, 250, ["I"]), "record")
+
+
+def test_record_keeps_lead_names(tmp_path):
+    store = RecordStore(tmp_path, max_disk_bytes=10**9, max_memory_bytes=10**9)
+    store.put_record("record", ECGRecord(np.zeros((10, 2)), 250, ["I", "II"]), "record")
+
+    assert store.get("record").sig_name == ["I", "II"]
+    assert RecordStore(tmp_path, 10**9, 10**9).get("record").sig_name == ["I", "II"]
+
+
+def test_derived_values_count_against_memory(tmp_path):
+    store = RecordStore(tmp_path, max_disk_bytes=10**9, max_memory_bytes=2000)
+    put_records(store, 2)
+
+    store.set_derived("record-0", "analysis", Derived())
+    store.set_derived("record-1", "analysis", Derived())
+
+    assert store.find_derived("record-0", "analysis") is None
+    assert store.find_derived("record-1", "analysis") is not None
+    assert store._memory_bytes <= store.max_memory_bytes
+
+
+def test_readers_are_bounded(tmp_path):
+    store = RecordStore(
+        tmp_path, max_disk_bytes=10**9, max_memory_bytes=10**9, max_readers=2
+    )
+    put_records(store, 3)
+
+    for index in range(3):
+        assert store.get_reader(f"record-{index}") is not None
+
+    assert set(store._readers) == {"record-1", "record-2"}
+    assert "record-0" not in store._signals
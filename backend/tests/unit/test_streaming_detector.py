@@ -0,0 +1,116 @@
+import numpy as np
+import pytest
+
+from app.logic.detector.detector import (
+    AnalysisStoppedError,
+    analyze_chunks,
+    analyze_record,
+    analyze_wfdb_record,
+    analyze_wfdb_record_tracked,
+    detect_r_peaks_multi,
+)
+from app.logic.detector.streaming_detector import (
+    detect_r_peaks_chunked,
+    iter_chunks,
+    lead_means,
+)
+from app.logic.ecg_record.ecg_record import ECGRecord
+from app.logic.metrics.metrics import run_collecting_metrics
+from benchmarks.synthetic_ecg import generate_ecg
+
+
+def read_chunks(signal, chunk_size):
+    return iter_chunks(lambda start, stop: signal[start:stop], len(signal), chunk_size)
+
+
+def events(analysis, length):
+    return sorted(
+        (event["type"], event["start"], event["end"])
+        for event in analysis.events_in_window(0, length)
+    )
+
+
+@pytest.mark.parametrize("duration, fs, leads, seed", [
+    (120, 250, 1, 0),
+    (600, 250, 3, 1),
+    (300, 500, 2, 2),
+])
+@pytest.mark.parametrize("chunk_duration", [60.0, 7.0, 1.3])
+def test_chunked_peaks_match_whole_array(duration, fs, leads, seed, chunk_duration):
+    signal, _ = generate_ecg(duration, fs, leads=leads, seed=seed)
+    chunk_size = int(chunk_duration * fs)
+
+    thresholds = lead_means(read_chunks(signal, chunk_size), leads)
+    found = detect_r_peaks_chunked(
+        read_chunks(signal, chunk_size), fs, leads, thresholds=thresholds
+    )
+    chunked = [np.concatenate(peaks) for peaks in zip(*found)]
+
+    for lead_chunked, lead_whole in zip(chunked, detect_r_peaks_multi(signal, fs)):
+        np.testing.assert_array_equal(lead_chunked, lead_whole)
+
+
+@pytest.mark.parametrize("duration, fs, leads, seed", [
+    (120, 250, 1, 0),
+    (600, 250, 3, 1),
+])
+def test_chunked_analysis_matches_whole_array(duration, fs, leads, seed):
+    signal, _ = generate_ecg(duration, fs, leads=leads, seed=seed)
+    lead_names = [f"lead {i}" for i in range(leads)]
+    chunk_size = 10 * fs
+
+    whole = analyze_record(signal, fs, lead_names)
+    chunked = analyze_chunks(
+        read_chunks(signal, chunk_size),
+        fs,
+        lead_names,
+        thresholds=lead_means(read_chunks(signal, chunk_size), leads),
+    )
+
+    np.testing.assert_array_equal(chunked.r_peaks, whole.r_peaks)
+    assert events(chunked, len(signal)) == events(whole, len(signal))
+    assert {"bradycardia"} <= {event[0] for event in events(whole, len(signal))}
+
+
+def test_wfdb_record_analysis_matches_whole_array(tmp_path):
+    fs = 250
+    signal, _ = generate_ecg(120, fs, seed=0)
+    base_path = ECGRecord(signal, fs, ["lead 0"]).to_wfdb(tmp_path, "record")
+    record = ECGRecord.from_wfdb(base_path)
+
+    whole = analyze_record(record.p_signal, fs, record.sig_name)
+    chunked = analyze_wfdb_record(base_path.with_suffix(".hea"), chunk_duration=7.0)
+
+    np.testing.assert_array_equal(chunked.r_peaks, whole.r_peaks)
+    assert events(chunked, len(signal)) == events(whole, len(signal))
+
+
+def test_tracked_analysis_reports_progress_and_stops(tmp_path):
+    fs = 250
+    signal, _ = generate_ecg(300, fs, seed=0)
+    base_path = ECGRecord(signal, fs, ["lead 0"]).to_wfdb(tmp_path, "record")
+    hea_path = base_path.with_suffix(".hea")
+
+    progress = np.zeros(3, dtype=np.int64)
+    analysis = analyze_wfdb_record_tracked(progress, hea_path)
+    assert len(analysis.r_peaks) > 0
+    assert progress[1] == 2 * len(signal)
+    assert len(signal) < progress[0] < progress[1]
+
+    progress[2] = 1
+    with pytest.raises(AnalysisStoppedError):
+        analyze_wfdb_record_tracked(progress, hea_path)
+
+
+def test_wfdb_record_analysis_times_every_stage_once(tmp_path):
+    fs = 250
+    signal, _ = generate_ecg(120, fs, leads=2, seed=0)
+    base_path = ECGRecord(signal, fs, ["lead 0", "lead 1"]).to_wfdb(tmp_path, "record")
+
+    _, stages, _ = run_collecting_metrics(
+        analyze_wfdb_record, base_path.with_suffix(".hea"), 7.0
+    )
+
+    names = [stage for stage, _ in stages]
+    assert len(names) == len(set(names))
+    assert {"lead_means", "r_peak_detection", "peak_fusion"} <= set(names)
@@ -0,0 +1,54 @@
+import pytest
+from fastapi import HTTPException
+from starlette.datastructures import Headers
+
+from app.app import MultipartFileLimit
+
+BOUNDARY = "limit-boundary"
+
+
+def multipart_body(parts):
+    body = b""
+    for name, filename, content in parts:
+        disposition = f'form-data; name="{name}"'
+        if filename is not None:
+            disposition += f'; filename="{filename}"'
+        body += (
+            f"--{BOUNDARY}\r\nContent-Disposition: {disposition}\r\n\r\n".encode()
+            + content
+            + b"\r\n"
+        )
+    return body + f"--{BOUNDARY}--\r\n".encode()
+
+
+def file_limit(max_bytes):
+    headers = Headers({"content-type": f"multipart/form-data; boundary={BOUNDARY}"})
+    return MultipartFileLimit.from_headers(headers, max_bytes)
+
+
+def test_file_over_limit_is_rejected_while_streaming():
+    body = multipart_body([("dat_file", "a.dat", b"x" * 100)])
+    limit = file_limit(64)
+
+    with pytest.raises(HTTPException) as error:
+        for start in range(0, len(body), 16):
+            limit.feed(body[start:start + 16])
+
+    assert error.value.status_code == 413
+    assert "a.dat" in error.value.detail
+    # Rejected before the rest of the file was received
+    assert start < len(body) - 16
+
+
+def test_files_and_fields_within_limit_pass():
+    body = multipart_body(
+        [("field", None, b"y" * 100), ("hea_file", "a.hea", b"x" * 64)]
+    )
+
+    assert file_limit(64).feed(body)
+
+
+def test_non_multipart_bodies_are_not_followed():
+    headers = Headers({"content-type": "application/json"})
+
+    assert MultipartFileLimit.from_headers(headers, 64) is None
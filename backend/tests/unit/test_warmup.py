@@ -0,0 +1,21 @@
+import asyncio
+
+from app.logic.warmup.warmup import Warmup
+
+
+def test_failed_warmup_is_not_ready(monkeypatch):
+    async def fail(*args):
+        raise RuntimeError("worker crashed")
+
+    monkeypatch.setattr(Warmup, "_warm_up_workers", staticmethod(fail))
+    warmup = Warmup(enabled=True)
+    asyncio.run(warmup.run())
+
+    assert not warmup.ready
+
+
+def test_disabled_warmup_is_ready():
+    warmup = Warmup(enabled=False)
+    asyncio.run(warmup.run())
+
+    assert warmup.ready
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+import wfdb
+
+from app.logic.ecg_record.wfdb_reader import INVALID_SAMPLE_VALUES, WfdbSignalReader
+
+# Largest digital value of every format
+DIGITAL_LIMITS = {"16": 32767, "212": 2047, "80": 127}
+
+
+def write_record(directory, fmt, n_sig, length=1001):
+    rng = np.random.default_rng(int(fmt) + n_sig)
+    limit = DIGITAL_LIMITS[fmt]
+    digital = rng.integers(-limit, limit + 1, size=(length, n_sig))
+    digital[[0, 17, length - 1], 0] = INVALID_SAMPLE_VALUES[fmt]
+    wfdb.wrsamp(
+        "record",
+        fs=250,
+        units=["mV"] * n_sig,
+        sig_name=[f"lead {i}" for i in range(n_sig)],
+        d_signal=digital,
+        fmt=[fmt] * n_sig,
+        adc_gain=[200.0] * n_sig,
+        baseline=[0] * n_sig,
+        write_dir=str(directory),
+    )
+    return directory / "record"
+
+
+@pytest.mark.parametrize("fmt", ["16", "212", "80"])
+@pytest.mark.parametrize("n_sig", [1, 2, 3])
+def test_reader_matches_rdrecord(tmp_path, fmt, n_sig):
+    base_path = write_record(tmp_path, fmt, n_sig)
+    reader = WfdbSignalReader.open(base_path)
+    assert reader is not None
+
+    for sampfrom, sampto in [(0, None), (0, 1), (1, 2), (17, 530), (999, 1001)]:
+        expected = wfdb.rdrecord(
+            str(base_path), sampfrom=sampfrom, sampto=sampto, physical=False
+        ).d_signal
+        np.testing.assert_array_equal(reader.read_digital(sampfrom, sampto), expected)
+
+    record = wfdb.rdrecord(str(base_path))
+    np.testing.assert_allclose(reader.read_physical(), record.p_signal, equal_nan=True)
+    assert reader.sig_len == record.sig_len